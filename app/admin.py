@@ -1,6 +1,14 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db.models import Q
 from django.utils.html import format_html
-from .models import Produto, Pedido, ItemPedido, Cupom, CupomUso
+from .models import Produto, Pedido, ItemPedido, Cupom, CupomUso, NotificacaoWebhook, PagamentoProcessado
+from .sugestoes import indice_sugestoes
+from .fila import reprocessar
+from .cupons import remover_usos, recalcular_contadores
+from .precos import recalcular_totais
+from .transicoes import origens_permitidas, transicionar_pedidos
+from .busca import filtrar_produtos
+from .admin_escala import AdminEmEscalaMixin, FiltroAutocomplete, variantes_cep, variantes_email
 import json  # ADICIONAR ESTE IMPORT
 
 
@@ -12,7 +20,13 @@ class ItemPedidoInline(admin.TabularInline):
     extra = 0
     readonly_fields = ['produto', 'quantidade', 'preco_unitario', 'subtotal']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('produto')
+
     def subtotal(self, obj):
+        # A linha vazia de "adicionar item" não tem preço ainda
+        if obj.preco_unitario is None:
+            return '-'
         return f"R$ {obj.subtotal():.2f}"
     subtotal.short_description = 'Subtotal'
 
@@ -21,10 +35,15 @@ class ItemPedidoInline(admin.TabularInline):
 # ADMIN: PEDIDO (CORRIGIDO - AÇÕES FUNCIONANDO)
 # ===============================
 @admin.register(Pedido)
-class PedidoAdmin(admin.ModelAdmin):
+class PedidoAdmin(AdminEmEscalaMixin, admin.ModelAdmin):
     list_display = ['id', 'usuario', 'status', 'valor_total_formatado', 'criado_em', 'nome_entrega', 'cidade_estado']
-    list_filter = ['status', 'criado_em', 'cidade', 'estado']
-    search_fields = ['usuario__username', 'id', 'nome_entrega', 'endereco', 'cidade', 'estado', 'cep']
+    list_select_related = ['usuario']
+    # cidade/estado saíram da barra lateral (SELECT DISTINCT na tabela inteira);
+    # ?estado=PR na URL continua funcionando
+    list_filter = ['status', 'criado_em']
+    # id, CEP e e-mail são atendidos por busca_exata; o resto por prefixo
+    search_fields = ['^nome_entrega', '^usuario__username', '^cidade']
+    autocomplete_fields = ['usuario', 'cupom']
     inlines = [ItemPedidoInline]
     
     # CORREÇÃO: Status NÃO está em readonly_fields para permitir ações
@@ -76,6 +95,18 @@ class PedidoAdmin(admin.ModelAdmin):
         return "Não informado"
     cidade_estado.short_description = 'Endereço de Entrega'
 
+    def busca_exata(self, termo):
+        filtro = None
+        if termo.isdigit() and len(termo) < 19:
+            filtro = Q(pk=int(termo))
+        cep = variantes_cep(termo)
+        if cep:
+            filtro = Q(cep__in=cep) if filtro is None else filtro | Q(cep__in=cep)
+        email = variantes_email(termo)
+        if email:
+            filtro = Q(email_entrega__in=email)
+        return filtro
+
     def dados_entrega_completo(self, obj):
         """Exibe todos os dados de entrega de forma organizada"""
         
@@ -204,71 +235,96 @@ class PedidoAdmin(admin.ModelAdmin):
     
     dados_entrega_completo.short_description = '📦 RESUMO DOS DADOS DE ENTREGA'
 
-    # AÇÕES EM MASSA - CORRIGIDAS
-    actions = ['marcar_como_pago', 'marcar_como_enviado', 'marcar_como_entregue', 'cancelar_pedido']
+    # AÇÕES EM MASSA: seguem Pedido.FLUXO_STATUS (um UPDATE por status de origem)
+    actions = [
+        'marcar_como_pago', 'marcar_como_preparando', 'marcar_como_enviado', 'marcar_como_entregue',
+        'cancelar_pedido', 'recalcular_totais_pedidos'
+    ]
 
-    def marcar_como_pago(self, request, queryset):
-        """Marca pedidos pendentes como pagos"""
-        pedidos_para_atualizar = queryset.filter(status='pendente')
-        updated = pedidos_para_atualizar.count()
-        
-        if updated > 0:
-            pedidos_para_atualizar.update(status='pago')
-            self.message_user(request, f"✅ {updated} pedido(s) marcado(s) como PAGO.")
+    def _transicionar(self, request, queryset, novo_status, rotulo):
+        alterados = transicionar_pedidos(queryset, novo_status)
+        if alterados:
+            self.message_user(request, f"{sum(alterados.values())} pedido(s) marcado(s) como {rotulo}.")
         else:
-            self.message_user(request, "ℹ️ Nenhum pedido pendente selecionado para marcar como pago.")
-    marcar_como_pago.short_description = "💰 Marcar como PAGO (apenas pendentes)"
+            origens = ', '.join(origens_permitidas(novo_status))
+            self.message_user(
+                request, f"ℹ️ Nenhum pedido selecionado pode ir para {rotulo} (apenas: {origens}).", messages.WARNING
+            )
+
+    def marcar_como_pago(self, request, queryset):
+        """Confirma o pagamento de pedidos pendentes/em processamento (baixa a reserva, registra o cupom)"""
+        self._transicionar(request, queryset, 'pago', 'PAGO')
+    marcar_como_pago.short_description = "💰 Marcar como PAGO (pendentes/em processamento)"
+
+    def marcar_como_preparando(self, request, queryset):
+        """Marca pedidos pagos como em preparação"""
+        self._transicionar(request, queryset, 'preparando', 'PREPARANDO ENVIO')
+    marcar_como_preparando.short_description = "📋 Marcar como PREPARANDO ENVIO (apenas pagos)"
 
     def marcar_como_enviado(self, request, queryset):
-        """Marca pedidos pagos como enviados"""
-        pedidos_para_atualizar = queryset.filter(status='pago')
-        updated = pedidos_para_atualizar.count()
-        
-        if updated > 0:
-            pedidos_para_atualizar.update(status='enviado')
-            self.message_user(request, f"🚚 {updated} pedido(s) marcado(s) como ENVIADO.")
-        else:
-            self.message_user(request, "ℹ️ Nenhum pedido pago selecionado para marcar como enviado.")
-    marcar_como_enviado.short_description = "📦 Marcar como ENVIADO (apenas pagos)"
+        """Marca pedidos em preparação como enviados"""
+        self._transicionar(request, queryset, 'enviado', 'ENVIADO')
+    marcar_como_enviado.short_description = "📦 Marcar como ENVIADO (apenas em preparação)"
 
     def marcar_como_entregue(self, request, queryset):
-        """Marca pedidos pagos ou enviados como entregues"""
-        pedidos_para_atualizar = queryset.filter(status__in=['pago', 'enviado'])
-        updated = pedidos_para_atualizar.count()
-        
-        if updated > 0:
-            pedidos_para_atualizar.update(status='entregue')
-            self.message_user(request, f"🎉 {updated} pedido(s) marcado(s) como ENTREGUE.")
-        else:
-            self.message_user(request, "ℹ️ Nenhum pedido pago ou enviado selecionado para marcar como entregue.")
-    marcar_como_entregue.short_description = "✅ Marcar como ENTREGUE (apenas pagos/enviados)"
+        """Marca pedidos enviados como entregues"""
+        self._transicionar(request, queryset, 'entregue', 'ENTREGUE')
+    marcar_como_entregue.short_description = "✅ Marcar como ENTREGUE (apenas enviados)"
 
     def cancelar_pedido(self, request, queryset):
-        """Cancela pedidos pendentes ou pagos"""
-        pedidos_para_atualizar = queryset.filter(status__in=['pendente', 'pago'])
-        updated = pedidos_para_atualizar.count()
-        
-        if updated > 0:
-            pedidos_para_atualizar.update(status='cancelado')
-            self.message_user(request, f"❌ {updated} pedido(s) CANCELADO(s).")
-        else:
-            self.message_user(request, "ℹ️ Nenhum pedido pendente ou pago selecionado para cancelar.")
-    cancelar_pedido.short_description = "🚫 Cancelar pedido(s) (apenas pendentes/pagos)"
+        """Cancela pedidos pendentes ou em processamento, devolvendo estoque e cupons"""
+        self._transicionar(request, queryset, 'cancelado', 'CANCELADO')
+    cancelar_pedido.short_description = "🚫 Cancelar pedido(s) (apenas pendentes/em processamento)"
 
-    # CORREÇÃO: Adicionar edição rápida na lista
-    list_editable = ['status']
+    def recalcular_totais_pedidos(self, request, queryset):
+        """Refaz valor_total a partir dos itens (soma no banco), do frete e do desconto"""
+        atualizados = recalcular_totais(queryset)
+        self.message_user(request, f"Total recalculado para {atualizados} pedido(s).")
+    recalcular_totais_pedidos.short_description = "Recalcular totais dos pedidos selecionados"
 
-    date_hierarchy = 'criado_em'
+    def save_model(self, request, obj, form, change):
+        """
+        Mudança de status no formulário passa pelo mesmo fluxo das ações
+        (Pedido.FLUXO_STATUS, devolução de estoque e cupons), em vez de
+        gravar o campo direto.
+        """
+        novo_status = obj.status
+        if not change or 'status' not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+
+        obj.status = form.initial['status']
+        super().save_model(request, obj, form, change)
+        if not transicionar_pedidos(Pedido.objects.filter(pk=obj.pk), novo_status):
+            self.message_user(
+                request,
+                f"ℹ️ Status mantido: um pedido {obj.get_status_display()} não pode ir para "
+                f"{dict(Pedido.STATUS_CHOICES)[novo_status]}.",
+                messages.WARNING
+            )
+        obj.refresh_from_db()
 
 
 # ===============================
 # ADMIN: ITEM DO PEDIDO
 # ===============================
+class FiltroProduto(FiltroAutocomplete):
+    title = 'produto'
+    parameter_name = 'produto'
+
+
 @admin.register(ItemPedido)
-class ItemPedidoAdmin(admin.ModelAdmin):
+class ItemPedidoAdmin(AdminEmEscalaMixin, admin.ModelAdmin):
     list_display = ['pedido', 'produto', 'quantidade', 'preco_unitario_formatado', 'subtotal_formatado']
-    list_filter = ['pedido__status', 'produto']
-    search_fields = ['pedido__id', 'produto__nome']
+    list_select_related = ['pedido__usuario', 'produto']
+    list_filter = ['pedido__status', FiltroProduto]
+    search_fields = ['^produto__nome']
+    autocomplete_fields = ['pedido', 'produto']
+
+    def busca_exata(self, termo):
+        # Número: itens do pedido com esse id
+        if termo.isdigit() and len(termo) < 19:
+            return Q(pedido_id=int(termo))
+        return None
 
     def preco_unitario_formatado(self, obj):
         return f"R$ {obj.preco_unitario:.2f}"
@@ -283,9 +339,10 @@ class ItemPedidoAdmin(admin.ModelAdmin):
 # ADMIN: PRODUTO
 # ===============================
 @admin.register(Produto)
-class ProdutoAdmin(admin.ModelAdmin):
+class ProdutoAdmin(AdminEmEscalaMixin, admin.ModelAdmin):
     list_display = ['nome', 'preco_formatado', 'estoque', 'disponivel', 'disponivel_badge', 'data_criacao']
     list_filter = ['disponivel', 'data_criacao']
+    # Busca pelo índice FTS5 (get_search_results); também atende os autocompletes
     search_fields = ['nome', 'descricao']
     readonly_fields = ['data_criacao', 'data_atualizacao']
 
@@ -327,15 +384,23 @@ class ProdutoAdmin(admin.ModelAdmin):
             )
     disponivel_badge.short_description = 'Status Visual'
 
+    def get_search_results(self, request, queryset, search_term):
+        termo = search_term.strip()
+        if not termo or self.busca_exata(termo) is not None:
+            return super().get_search_results(request, queryset, search_term)
+        return filtrar_produtos(queryset, termo), False
+
     actions = ['ativar_produtos', 'desativar_produtos']
 
     def ativar_produtos(self, request, queryset):
         updated = queryset.update(disponivel=True)
+        indice_sugestoes.invalidar()  # update() não dispara signals
         self.message_user(request, f"{updated} produto(s) ativado(s).")
     ativar_produtos.short_description = "Ativar produtos selecionados"
 
     def desativar_produtos(self, request, queryset):
         updated = queryset.update(disponivel=False)
+        indice_sugestoes.invalidar()
         self.message_user(request, f"{updated} produto(s) desativado(s).")
     desativar_produtos.short_description = "Desativar produtos selecionados"
 
@@ -346,7 +411,7 @@ class ProdutoAdmin(admin.ModelAdmin):
 # ADMIN: CUPOM DE DESCONTO (COM AÇÃO PARA LIMPAR USOS)
 # ===============================
 @admin.register(Cupom)
-class CupomAdmin(admin.ModelAdmin):
+class CupomAdmin(AdminEmEscalaMixin, admin.ModelAdmin):
     list_display = ['codigo', 'tipo', 'valor', 'valor_formatado', 'ativo', 'limite_uso', 'usos_atual', 'data_inicio', 'data_fim']
     list_filter = ['ativo', 'tipo', 'data_inicio', 'data_fim']
     search_fields = ['codigo']
@@ -354,7 +419,7 @@ class CupomAdmin(admin.ModelAdmin):
     readonly_fields = ['criado_em', 'usos_atual']
     
     # ADICIONADO: Ação para limpar usos de cupom
-    actions = ['limpar_usos_cupom']
+    actions = ['limpar_usos_cupom', 'recalcular_usos_cupom']
     
     fieldsets = (
         ('Informações Básicas', {
@@ -382,31 +447,76 @@ class CupomAdmin(admin.ModelAdmin):
     valor_formatado.short_description = 'Desconto'
 
     def usos_atual(self, obj):
-        return obj.usos.count()
+        # Contador mantido por registrar_uso/remover_usos: nenhum COUNT por linha
+        return obj.usos_total
     usos_atual.short_description = 'Usos'
 
     def limpar_usos_cupom(self, request, queryset):
         """Remove todos os usos dos cupons selecionados"""
-        total_usos = 0
-        for cupom in queryset:
-            usos = cupom.usos.count()
-            cupom.usos.all().delete()
-            total_usos += usos
-        
+        total_usos = remover_usos(CupomUso.objects.filter(cupom__in=queryset))
+
         self.message_user(request, f"✅ {total_usos} uso(s) de cupom removido(s) para {queryset.count()} cupom(ns).")
     limpar_usos_cupom.short_description = "🧹 Limpar usos dos cupons selecionados"
 
+    def recalcular_usos_cupom(self, request, queryset):
+        """Refaz os contadores a partir dos usos registrados"""
+        total = recalcular_contadores(queryset)
+        self.message_user(request, f"Contadores recalculados para {total} cupom(ns).")
+    recalcular_usos_cupom.short_description = "Recalcular contadores de uso"
+
 
 # ===============================
 # ADMIN: USO DO CUPOM
 # ===============================
+class FiltroCupom(FiltroAutocomplete):
+    title = 'cupom'
+    parameter_name = 'cupom'
+
+
 @admin.register(CupomUso)
-class CupomUsoAdmin(admin.ModelAdmin):
+class CupomUsoAdmin(AdminEmEscalaMixin, admin.ModelAdmin):
     list_display = ['cupom', 'pedido', 'usuario', 'usado_em']
-    list_filter = ['usado_em', 'cupom']
-    search_fields = ['cupom__codigo', 'pedido__id', 'pedido__usuario__username']
+    list_select_related = ['cupom', 'pedido__usuario']
+    list_filter = ['usado_em', FiltroCupom]
+    search_fields = ['^cupom__codigo', '^pedido__usuario__username']
     readonly_fields = ['cupom', 'pedido', 'usado_em']
 
     def usuario(self, obj):
         return obj.pedido.usuario if obj.pedido.usuario else obj.pedido.email_entrega
-    usuario.short_description = 'Cliente'
\ No newline at end of file
+    usuario.short_description = 'Cliente'
+
+    def busca_exata(self, termo):
+        if termo.isdigit() and len(termo) < 19:
+            return Q(pedido_id=int(termo))
+        return None
+
+
+# ===============================
+# ADMIN: FILA DE NOTIFICAÇÕES DO MERCADO PAGO
+# ===============================
+@admin.register(NotificacaoWebhook)
+class NotificacaoWebhookAdmin(AdminEmEscalaMixin, admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'payment_id', 'status', 'tentativas', 'proxima_tentativa', 'criado_em']
+    list_filter = ['status', 'tipo']
+    search_fields = ['payment_id']
+    readonly_fields = ['tipo', 'payment_id', 'payload', 'tentativas', 'bloqueado_em', 'ultimo_erro', 'criado_em', 'atualizado_em']
+    actions = ['reprocessar_notificacoes']
+
+    def reprocessar_notificacoes(self, request, queryset):
+        updated = reprocessar(queryset)
+        self.message_user(request, f"{updated} notificação(ões) devolvida(s) para a fila.")
+    reprocessar_notificacoes.short_description = "Reprocessar notificações selecionadas"
+
+    def busca_exata(self, termo):
+        return Q(payment_id=termo)
+
+
+@admin.register(PagamentoProcessado)
+class PagamentoProcessadoAdmin(AdminEmEscalaMixin, admin.ModelAdmin):
+    list_display = ['payment_id', 'status', 'pedido_referencia', 'processado_em']
+    list_filter = ['status']
+    search_fields = ['payment_id', 'pedido_referencia']
+    readonly_fields = ['payment_id', 'status', 'pedido_referencia', 'processado_em']
+
+    def busca_exata(self, termo):
+        return Q(payment_id=termo) | Q(pedido_referencia=termo)
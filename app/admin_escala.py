@@ -0,0 +1,132 @@
+import re
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+
+# ===============================
+# CONTAGEM ESTIMADA NA PAGINAÇÃO
+# ===============================
+def contar_estimado(queryset, limite=None):
+    """
+    Contagem exata até `limite` (COUNT sobre um subselect com LIMIT, custo
+    limitado); acima disso, sem filtros, estima pelo maior id (sem varrer
+    a tabela) e, com filtros, devolve o próprio limite.
+    """
+    limite = limite or getattr(settings, 'ADMIN_CONTAGEM_MAXIMA', 10000)
+    queryset = queryset.order_by()
+    total = queryset[:limite + 1].count()
+    if total <= limite:
+        return total
+    if not queryset.query.where:
+        return max(queryset.aggregate(maior=Max('pk'))['maior'] or 0, limite)
+    return limite
+
+
+class PaginadorEstimado(Paginator):
+    @cached_property
+    def count(self):
+        return contar_estimado(self.object_list)
+
+
+# ===============================
+# FILTRO COM BUSCA (CHAVES ESTRANGEIRAS GRANDES)
+# ===============================
+class FiltroAutocomplete(admin.SimpleListFilter):
+    """
+    Filtro por chave estrangeira que não lista as opções na barra lateral:
+    um select2 do próprio admin busca no admin do modelo relacionado
+    conforme o usuário digita. Subclasses definem `title` e
+    `parameter_name` (o nome do campo).
+    """
+    template = 'admin/filtro_autocomplete.html'
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        campo = model._meta.get_field(self.parameter_name)
+        self.campo_busca = forms.ModelChoiceField(
+            queryset=campo.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(campo, model_admin.admin_site, attrs={'class': 'filtro-autocomplete'}),
+            required=False,
+        )
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f'{self.parameter_name}_id': self.value()})
+        return queryset
+
+    def widget(self):
+        # Renderiza só a opção selecionada (uma consulta por chave primária)
+        return self.campo_busca.widget.render(self.parameter_name, self.value())
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'Todos',
+        }
+
+
+# ===============================
+# MIXIN: LISTAGENS DO ADMIN EM ESCALA
+# ===============================
+RE_CEP = re.compile(r'^(\d{5})-?(\d{3})$')
+
+
+def variantes_cep(termo):
+    """'12345678' e '12345-678' (como o CEP pode ter sido gravado), ou None"""
+    correspondencia = RE_CEP.match(termo)
+    if not correspondencia:
+        return None
+    inicio, fim = correspondencia.groups()
+    return [f'{inicio}{fim}', f'{inicio}-{fim}']
+
+
+def variantes_email(termo):
+    """O e-mail como digitado e em minúsculas (igualdade usa o índice), ou None"""
+    if '@' not in termo or ' ' in termo:
+        return None
+    return list({termo, termo.lower()})
+
+
+class AdminEmEscalaMixin:
+    """
+    Listagem do admin com custo fixo por página:
+    - contagem estimada, sem o COUNT(*) extra do total sem filtros;
+    - `busca_exata(termo)` responde ids, CEPs e e-mails com igualdade
+      (índice) antes de cair na busca por texto de `search_fields`;
+    - inclui os arquivos do select2 quando há FiltroAutocomplete.
+    """
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def busca_exata(self, termo):
+        """Q para buscas que dispensam LIKE, ou None"""
+        if termo.isdigit() and len(termo) < 19:
+            return Q(pk=int(termo))
+        return None
+
+    def get_search_results(self, request, queryset, search_term):
+        termo = search_term.strip()
+        filtro = self.busca_exata(termo) if termo else None
+        if filtro is not None:
+            return queryset.filter(filtro), False
+        return super().get_search_results(request, queryset, search_term)
+
+    @property
+    def media(self):
+        media = super().media
+        if any(isinstance(f, type) and issubclass(f, FiltroAutocomplete) for f in self.list_filter):
+            media += AutocompleteSelect(None, self.admin_site).media
+        return media
@@ -5,4 +5,8 @@ class AppConfig(AppConfig):
     name = 'app'
     
     def ready(self):
-        import app.signals
\ No newline at end of file
+        import app.signals
+        from app import consultas_lentas, metricas, rastreamento
+        metricas.instalar()
+        rastreamento.instalar()
+        consultas_lentas.instalar()
@@ -0,0 +1,65 @@
+import contextvars
+import functools
+import inspect
+
+from django.conf import settings
+from django.db import connections
+
+
+# ===============================
+# ROTEAMENTO DE LEITURAS
+# ===============================
+ALIAS_LEITURA = 'leitura'
+
+_somente_leitura = contextvars.ContextVar('somente_leitura', default=False)
+
+
+def somente_leitura(view):
+    """
+    Marca uma view que só lê do banco: as consultas dela vão para a conexão
+    'leitura' (query_only), que não disputa a conexão de escrita com o
+    checkout e os webhooks. Funciona com views síncronas e assíncronas
+    (o contexto acompanha o sync_to_async).
+    """
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def _view(*args, **kwargs):
+            marca = _somente_leitura.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _somente_leitura.reset(marca)
+    else:
+        @functools.wraps(view)
+        def _view(*args, **kwargs):
+            marca = _somente_leitura.set(True)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _somente_leitura.reset(marca)
+    return _view
+
+
+class RoteadorLeitura:
+    """
+    Leituras de views @somente_leitura vão para 'leitura'; todo o resto
+    (inclusive leituras dentro de transações) fica em 'default', para
+    continuar vendo as próprias escritas.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _somente_leitura.get() or ALIAS_LEITURA not in settings.DATABASES:
+            return None
+        if connections['default'].in_atomic_block:
+            return None
+        return ALIAS_LEITURA
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # As duas conexões apontam para a mesma base
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ALIAS_LEITURA
@@ -0,0 +1,129 @@
+import re
+
+from django.db import connection, DatabaseError
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# ===============================
+# BUSCA FULL-TEXT (SQLITE FTS5)
+# ===============================
+TABELA_FTS = 'app_produto_fts'
+
+# unicode61 + remove_diacritics: "agua" encontra "Água"; prefix acelera "deterg*"
+SQL_CRIAR_TABELA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_FTS} USING fts5("
+    "nome, descricao, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+SQL_REMOVER_TABELA = f"DROP TABLE IF EXISTS {TABELA_FTS}"
+
+# Pesos do bm25: nome vale mais que descrição
+PESO_NOME = 10.0
+PESO_DESCRICAO = 1.0
+
+_fts_disponivel = None
+
+
+def fts_disponivel():
+    """Verifica (uma vez por processo) se a tabela FTS5 existe"""
+    global _fts_disponivel
+    if _fts_disponivel is None:
+        if connection.vendor != 'sqlite':
+            _fts_disponivel = False
+        else:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                        [TABELA_FTS]
+                    )
+                    _fts_disponivel = cursor.fetchone() is not None
+            except DatabaseError:
+                _fts_disponivel = False
+    return _fts_disponivel
+
+
+def montar_consulta(termo):
+    """
+    Converte o texto digitado em uma expressão MATCH segura:
+    cada palavra vira um prefixo entre aspas, todas obrigatórias.
+    """
+    palavras = re.findall(r'\w+', termo.lower())
+    return ' '.join(f'"{p}"*' for p in palavras)
+
+
+# ===============================
+# SINCRONIZAÇÃO DO ÍNDICE
+# ===============================
+def indexar_produto(produto):
+    if not fts_disponivel():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_FTS} WHERE rowid = %s", [produto.pk])
+        cursor.execute(
+            f"INSERT INTO {TABELA_FTS} (rowid, nome, descricao) VALUES (%s, %s, %s)",
+            [produto.pk, produto.nome, produto.descricao or '']
+        )
+
+
+def remover_produto(produto_id):
+    if not fts_disponivel():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_FTS} WHERE rowid = %s", [produto_id])
+
+
+def reconstruir_indice(conexao=None):
+    """Recria o conteúdo do índice a partir da tabela de produtos"""
+    conexao = conexao or connection
+    with conexao.cursor() as cursor:
+        cursor.execute(SQL_CRIAR_TABELA)
+        cursor.execute(f"DELETE FROM {TABELA_FTS}")
+        cursor.execute(
+            f"INSERT INTO {TABELA_FTS} (rowid, nome, descricao) "
+            "SELECT id, nome, COALESCE(descricao, '') FROM app_produto"
+        )
+        cursor.execute(f"INSERT INTO {TABELA_FTS} ({TABELA_FTS}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {TABELA_FTS}")
+        total = cursor.fetchone()[0]
+
+    global _fts_disponivel
+    _fts_disponivel = None
+    return total
+
+
+# ===============================
+# CONSULTAS
+# ===============================
+def filtrar_produtos(queryset, termo):
+    """
+    Restringe `queryset` aos produtos que casam com `termo`.
+    Mantém a ordenação do queryset (a paginação por cursor continua valendo).
+    """
+    consulta = montar_consulta(termo)
+    if not consulta:
+        return queryset.none()
+    if not fts_disponivel():
+        return queryset.filter(Q(nome__icontains=termo) | Q(descricao__icontains=termo))
+    return queryset.filter(id__in=RawSQL(
+        f"SELECT rowid FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s", (consulta,)
+    ))
+
+
+def buscar_ids_ranqueados(termo, limite=20, somente_em_estoque=False):
+    """
+    Retorna ids de produtos disponíveis ordenados por relevância (bm25),
+    ou None quando o índice FTS não está disponível.
+    """
+    consulta = montar_consulta(termo)
+    if not consulta or not fts_disponivel():
+        return None
+    filtro_estoque = "AND p.estoque > 0" if somente_em_estoque else ""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {TABELA_FTS}.rowid FROM {TABELA_FTS} "
+            f"JOIN app_produto p ON p.id = {TABELA_FTS}.rowid "
+            f"WHERE {TABELA_FTS} MATCH %s AND p.disponivel {filtro_estoque} "
+            f"ORDER BY bm25({TABELA_FTS}, %s, %s) LIMIT %s",
+            [consulta, PESO_NOME, PESO_DESCRICAO, limite]
+        )
+        return [linha[0] for linha in cursor.fetchall()]
@@ -0,0 +1,99 @@
+from .models import Produto
+
+
+# ===============================
+# VALIDAÇÃO DE CARRINHO (UMA CONSULTA)
+# ===============================
+class LinhaCarrinho:
+    """Resultado da validação de um item do carrinho"""
+
+    def __init__(self, produto_id, quantidade, preco_informado=None, erro=None):
+        self.produto_id = produto_id
+        self.quantidade = quantidade
+        self.preco_informado = preco_informado
+        self.produto = None
+        self.erro = erro
+
+    @property
+    def disponivel(self):
+        return self.erro is None and self.produto is not None and self.produto.estoque_disponivel(self.quantidade)
+
+    @property
+    def preco_unitario(self):
+        """Preço do banco, nunca o enviado pelo navegador"""
+        return self.produto.preco if self.produto else None
+
+    def como_dict(self):
+        return {
+            'produto_id': self.produto.id if self.produto else self.produto_id,
+            'disponivel': self.disponivel,
+            'estoque_atual': self.produto.estoque if self.produto else 0,
+            'solicitado': self.quantidade,
+            'produto_nome': self.produto.nome if self.produto else 'Produto não encontrado',
+            'preco': str(self.produto.preco) if self.produto else None,
+        }
+
+
+class ResultadoCarrinho:
+    def __init__(self, linhas, produtos):
+        self.linhas = linhas
+        self.produtos = produtos
+
+    @property
+    def valido(self):
+        return bool(self.linhas) and all(linha.disponivel for linha in self.linhas)
+
+    @property
+    def erro(self):
+        """Primeira mensagem de erro, no formato usado pelas views de checkout"""
+        if not self.linhas:
+            return 'Carrinho vazio'
+        for linha in self.linhas:
+            if linha.erro:
+                return linha.erro
+            if linha.produto is None:
+                return f'Produto não encontrado: {linha.produto_id}'
+            if not linha.disponivel:
+                return f'Estoque insuficiente para {linha.produto.nome}'
+        return None
+
+    def como_dict(self):
+        return [linha.como_dict() for linha in self.linhas]
+
+
+def _ler_linha(item, exigir_preco):
+    if not isinstance(item, dict):
+        return LinhaCarrinho(None, 0, erro='Dados inválidos no item')
+    produto_id = item.get('id')
+    try:
+        quantidade = int(item.get('quantidade', 1))
+        produto_id = int(produto_id)
+        preco = float(item.get('preco', 0)) if exigir_preco else None
+    except (TypeError, ValueError):
+        return LinhaCarrinho(produto_id, 0, erro='Dados inválidos no item')
+    if quantidade <= 0 or (exigir_preco and preco <= 0):
+        return LinhaCarrinho(produto_id, quantidade, erro='Dados inválidos no item')
+    return LinhaCarrinho(produto_id, quantidade, preco_informado=preco)
+
+
+def validar_carrinho(itens, exigir_preco=False):
+    """
+    Valida todos os itens com um único `in_bulk`, independente do tamanho
+    do carrinho. Nas APIs de estoque itens sem id são ignorados; no checkout
+    (`exigir_preco`) eles invalidam o carrinho. Itens que não são objetos
+    JSON (ou uma lista de itens que não é lista) viram linhas com erro.
+    """
+    if not isinstance(itens or [], list):
+        itens = [None]
+    linhas = [
+        _ler_linha(item, exigir_preco)
+        for item in itens or []
+        if exigir_preco or not isinstance(item, dict) or item.get('id')
+    ]
+    ids = {linha.produto_id for linha in linhas if linha.erro is None}
+
+    produtos = Produto.objects.in_bulk(ids) if ids else {}
+
+    for linha in linhas:
+        linha.produto = produtos.get(linha.produto_id)
+    return ResultadoCarrinho(linhas, produtos)
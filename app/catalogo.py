@@ -0,0 +1,70 @@
+import hashlib
+
+from django.core.cache import cache
+
+from .models import Produto
+
+
+# ===============================
+# CACHE DE PRODUTOS PARA A API JSON
+# ===============================
+TIMEOUT_CACHE_PRODUTO = 60 * 60
+MAXIMO_IDS_POR_LOTE = 100
+
+
+def payload_produto(produto):
+    """Dados usados pela visualização rápida (main.js) e pelo carrinho"""
+    return {
+        'id': produto.id,
+        'nome': produto.nome,
+        'descricao': produto.descricao,
+        'preco': str(produto.preco),
+        'preco_original': str(produto.preco_original) if produto.tem_desconto() else None,
+        'percentual_desconto': produto.percentual_desconto(),
+        'estoque': produto.estoque,
+        'imagem': produto.imagem.url if produto.imagem else '',
+        'atualizado_em': produto.data_atualizacao.isoformat(),
+    }
+
+
+def _chave(produto_id, versao):
+    return f'produto:{produto_id}:{versao.timestamp()}'
+
+
+def versoes_produtos(ids):
+    """
+    Uma consulta enxuta (id, data_atualizacao) para os produtos pedidos.
+    É o suficiente para calcular o ETag e montar as chaves de cache.
+    """
+    return dict(
+        Produto.objects.filter(id__in=ids, disponivel=True)
+        .values_list('id', 'data_atualizacao')
+    )
+
+
+def calcular_etag(versoes):
+    """ETag forte derivado de (id, data_atualizacao) de cada produto"""
+    base = ';'.join(f'{pk}:{versoes[pk].timestamp()}' for pk in sorted(versoes))
+    return '"%s"' % hashlib.sha1(base.encode()).hexdigest()
+
+
+def obter_payloads(versoes):
+    """
+    Busca os payloads no cache; os que faltarem vêm do banco em uma única
+    consulta. Como a chave inclui a versão, um produto alterado nunca é
+    servido desatualizado.
+    """
+    chaves = {pk: _chave(pk, versao) for pk, versao in versoes.items()}
+    encontrados = cache.get_many(chaves.values())
+    payloads = {pk: encontrados[chave] for pk, chave in chaves.items() if chave in encontrados}
+
+    faltando = [pk for pk in versoes if pk not in payloads]
+    if faltando:
+        novos = {}
+        for produto in Produto.objects.filter(id__in=faltando):
+            payload = payload_produto(produto)
+            payloads[produto.id] = payload
+            novos[_chave(produto.id, produto.data_atualizacao)] = payload
+        cache.set_many(novos, TIMEOUT_CACHE_PRODUTO)
+
+    return payloads
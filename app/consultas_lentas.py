@@ -0,0 +1,202 @@
+import contextvars
+import hashlib
+import logging
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+
+from .rastreamento import ExportadorJsonl
+
+logger = logging.getLogger(__name__)
+
+
+# ===============================
+# IMPRESSÃO DIGITAL DA CONSULTA
+# ===============================
+RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+RE_NUMERO = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+RE_LISTA_IN = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+RE_ESPACOS = re.compile(r'\s+')
+
+
+def normalizar_sql(sql):
+    """
+    Mesma forma para consultas que só diferem nos valores: literais e
+    parâmetros viram ?, listas de IN viram (...). Assim `pk IN (1, 2)` e
+    `pk IN (7, 8, 9)` somam no mesmo grupo do relatório.
+    """
+    sql = RE_TEXTO.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = RE_NUMERO.sub('?', sql)
+    sql = RE_LISTA_IN.sub('IN (...)', sql)
+    return RE_ESPACOS.sub(' ', sql).strip()
+
+
+def impressao_digital(sql_normalizado):
+    return hashlib.sha1(sql_normalizado.encode('utf-8')).hexdigest()[:12]
+
+
+# ===============================
+# PLANO DE EXECUÇÃO (SQLITE)
+# ===============================
+class PlanosConsultas:
+    """
+    EXPLAIN QUERY PLAN por impressão digital, uma vez por processo: o plano
+    de uma forma de consulta raramente muda, e a consulta lenta seguinte
+    com a mesma forma não paga um segundo EXPLAIN.
+    """
+
+    def __init__(self, tamanho_maximo=2000):
+        self.tamanho_maximo = tamanho_maximo
+        self._planos = {}
+        self._lock = threading.Lock()
+
+    def obter(self, digital, conexao, sql, params):
+        with self._lock:
+            if digital in self._planos:
+                return self._planos[digital]
+        plano = self._explicar(conexao, sql, params)
+        with self._lock:
+            if len(self._planos) >= self.tamanho_maximo:
+                self._planos.clear()
+            self._planos[digital] = plano
+        return plano
+
+    def _explicar(self, conexao, sql, params):
+        if conexao.vendor != 'sqlite' or sql.lstrip()[:6].upper() not in ('SELECT', 'WITH'):
+            return []
+        # Cursor novo, direto no backend: não passa pelos execute_wrappers
+        # (sem recursão) nem mexe no cursor cujo resultado ainda será lido
+        cursor = conexao.create_cursor()
+        try:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [linha[-1] for linha in cursor.fetchall()]
+        except Exception as e:
+            return [f'(EXPLAIN falhou: {e})']
+        finally:
+            cursor.close()
+
+
+planos_consultas = PlanosConsultas()
+
+
+def varreduras(plano):
+    """Tabelas lidas inteiras ('SCAN tabela' sem índice) no plano do SQLite"""
+    tabelas = []
+    for passo in plano:
+        partes = passo.split()
+        if len(partes) < 2 or partes[0] != 'SCAN' or 'INDEX' in partes:
+            continue
+        tabela = partes[1]
+        # Subconsultas, linhas constantes e o catálogo não são tabelas da aplicação
+        if tabela == 'CONSTANT' or tabela.startswith(('(', 'subquery', 'sqlite_')):
+            continue
+        tabelas.append(tabela)
+    return tabelas
+
+
+# ===============================
+# REGISTRO (EXECUTE WRAPPER)
+# ===============================
+_requisicao_atual = contextvars.ContextVar('requisicao_consultas_lentas', default=None)
+
+
+def _origem():
+    request = _requisicao_atual.get()
+    if request is None:
+        # Workers e varreduras: o nome do comando de gerenciamento
+        return 'comando:' + sys.argv[1] if len(sys.argv) > 1 else 'fora de requisição'
+    resolver = getattr(request, 'resolver_match', None)
+    if resolver is not None and resolver.view_name:
+        return resolver.view_name
+    return f'{request.method} {request.path}'  # antes da view (middlewares)
+
+
+def registrar_consulta_lenta(execute, sql, params, many, context):
+    """execute_wrapper instalado em toda conexão nova (connection_created)"""
+    inicio = time.perf_counter()
+    resultado = execute(sql, params, many, context)
+    duracao_ms = (time.perf_counter() - inicio) * 1000
+    if duracao_ms >= getattr(settings, 'CONSULTAS_LENTAS_LIMITE_MS', 50):
+        _registrar(sql, params, many, context['connection'], duracao_ms)
+    return resultado
+
+
+def _registrar(sql, params, many, conexao, duracao_ms):
+    try:
+        normalizado = normalizar_sql(sql)
+        digital = impressao_digital(normalizado)
+        plano = [] if many else planos_consultas.obter(digital, conexao, sql, params)
+        origem = _origem()
+        tabelas_varridas = varreduras(plano)
+        logger.warning(
+            f"Consulta lenta ({duracao_ms:.1f} ms, {origem}) [{digital}]"
+            f"{' varre ' + ', '.join(tabelas_varridas) if tabelas_varridas else ''}: {sql[:300]}"
+        )
+        exportador_consultas_lentas.exportar({
+            'quando': time.time(),
+            'duracao_ms': round(duracao_ms, 3),
+            'digital': digital,
+            'sql_normalizado': normalizado[:2000],
+            'origem': origem,
+            'banco': conexao.alias,
+            'plano': plano,
+            'varreduras': tabelas_varridas,
+        })
+    except Exception as e:
+        # O registro nunca derruba a consulta que já terminou
+        logger.debug(f"Falha ao registrar consulta lenta: {e}")
+
+
+def instrumentar_conexao(sender, connection, **kwargs):
+    if registrar_consulta_lenta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(registrar_consulta_lenta)
+
+
+def instalar():
+    """Chamado no AppConfig.ready, antes de qualquer conexão ser aberta"""
+    if getattr(settings, 'CONSULTAS_LENTAS_ATIVO', False):
+        connection_created.connect(instrumentar_conexao, dispatch_uid='consultas_lentas_sql')
+
+
+exportador_consultas_lentas = ExportadorJsonl(
+    getattr(settings, 'CONSULTAS_LENTAS_ARQUIVO', Path(settings.BASE_DIR) / 'rastros' / 'consultas_lentas.jsonl'),
+    tamanho_maximo=getattr(settings, 'RASTREAMENTO_TAMANHO_MAXIMO_MB', 50) * 1024 * 1024
+)
+
+
+class ConsultasLentasMiddleware:
+    """Guarda a requisição atual para identificar a view de origem das consultas lentas"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CONSULTAS_LENTAS_ATIVO', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        marca = _requisicao_atual.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _requisicao_atual.reset(marca)
+
+    async def __acall__(self, request):
+        marca = _requisicao_atual.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _requisicao_atual.reset(marca)
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core import signing
+
+from .carrinho import validar_carrinho
+from .cupons import CupomInvalido, validador_cupons
+from .precos import resumir
+
+
+# ===============================
+# COTAÇÃO ASSINADA DO CHECKOUT
+# ===============================
+SALT_COTACAO = 'app.cotacao'
+
+
+class CotacaoInvalida(Exception):
+    """Token de cotação adulterado, expirado ou de outro usuário"""
+
+
+def _agrupar(itens):
+    """Soma quantidades de itens repetidos (um ItemPedido por produto)"""
+    if not isinstance(itens or [], list):
+        return [None]
+    agrupados, invalidos = {}, []
+    for item in itens or []:
+        if not isinstance(item, dict):
+            # validar_carrinho recusa o item
+            invalidos.append(item)
+            continue
+        chave = str(item.get('id'))
+        if chave in agrupados:
+            try:
+                agrupados[chave]['quantidade'] = int(agrupados[chave]['quantidade']) + int(item.get('quantidade', 1))
+            except (TypeError, ValueError):
+                pass
+        else:
+            agrupados[chave] = dict(item)
+    return list(agrupados.values()) + invalidos
+
+
+def montar_cotacao(itens, cupom_codigo='', usuario=None):
+    """
+    Calcula subtotal, frete, desconto e total (motor de preços, em Decimal)
+    com os preços do banco; o preço enviado pelo navegador é ignorado.
+
+    Retorna (cotacao, validacao, erro_cupom): `cotacao` é None quando o
+    carrinho é inválido; `erro_cupom` traz a mensagem de um cupom recusado
+    (a cotação sai sem desconto).
+    """
+    validacao = validar_carrinho(_agrupar(itens), exigir_preco=True)
+    if not validacao.valido:
+        return None, validacao, None
+
+    cupom, erro_cupom = None, None
+    if cupom_codigo:
+        try:
+            cupom = validador_cupons.validar(cupom_codigo, usuario)
+        except CupomInvalido as e:
+            erro_cupom = e
+
+    resumo = resumir([(linha.preco_unitario, linha.quantidade) for linha in validacao.linhas], cupom)
+    usuario_id = usuario.pk if usuario is not None and usuario.is_authenticated else None
+    # Valores monetários como string: o token guarda Decimal sem passar por float
+    cotacao = {
+        'usuario': usuario_id,
+        'linhas': [
+            {
+                'id': linha.produto.id,
+                'nome': linha.produto.nome[:250],
+                'quantidade': linha.quantidade,
+                'preco': str(linha.preco_unitario),
+            }
+            for linha in validacao.linhas
+        ],
+        **resumo.como_dict(),
+        'cupom': cupom.codigo if cupom else '',
+    }
+    return cotacao, validacao, erro_cupom
+
+
+def assinar_cotacao(cotacao):
+    return signing.dumps(cotacao, salt=SALT_COTACAO, compress=True)
+
+
+def verificar_cotacao(token, usuario=None):
+    """
+    Confere assinatura, validade (COTACAO_VALIDADE_SEGUNDOS) e dono da
+    cotação. Nenhuma consulta ao banco: o estoque é garantido depois pela
+    reserva condicional e o cupom pelo registro de uso.
+    """
+    max_age = getattr(settings, 'COTACAO_VALIDADE_SEGUNDOS', 900)
+    try:
+        cotacao = signing.loads(token, salt=SALT_COTACAO, max_age=max_age)
+    except signing.SignatureExpired:
+        raise CotacaoInvalida('Cotação expirada. Revise o carrinho e tente novamente.')
+    except signing.BadSignature:
+        raise CotacaoInvalida('Cotação inválida.')
+
+    usuario_id = usuario.pk if usuario is not None and usuario.is_authenticated else None
+    if cotacao.get('usuario') != usuario_id:
+        raise CotacaoInvalida('Cotação inválida.')
+    return cotacao
@@ -0,0 +1,259 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Cupom, CupomUso, CupomUsoUsuario
+
+
+# ===============================
+# VALIDAÇÃO DE CUPONS (ÚNICA PARA TODAS AS VIEWS)
+# ===============================
+class CupomInvalido(Exception):
+    def __init__(self, mensagem, status=400):
+        self.mensagem = mensagem
+        self.status = status
+        super().__init__(mensagem)
+
+
+def _data(valor):
+    return valor.date() if hasattr(valor, 'date') else valor
+
+
+def _sem_limite(limite):
+    # Nas views, limite 0/vazio sempre significou "sem limite"
+    return not limite
+
+
+class ValidadorCupons:
+    """
+    Valida cupons sem COUNT: os dados do cupom ficam em um LRU por processo
+    (com `ttl`) e os usos vêm dos contadores `Cupom.usos_total` e
+    `CupomUsoUsuario`, lidos juntos em uma consulta por chave primária.
+
+    Códigos inexistentes não entram no cache: um cupom recém-criado vale
+    na hora em todos os workers, e códigos aleatórios não enchem a memória.
+    Os signals de Cupom invalidam o cache do processo atual quando o admin
+    edita um cupom; o `ttl` cobre os outros workers.
+    """
+
+    def __init__(self, ttl=60, tamanho_maximo=1000):
+        self.ttl = ttl
+        self.tamanho_maximo = tamanho_maximo
+        self._lock = threading.Lock()
+        self._cupons = OrderedDict()
+
+    def invalidar(self):
+        with self._lock:
+            self._cupons.clear()
+
+    def obter(self, codigo):
+        """Cupom ativo com este código (ou None), do cache quando possível"""
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._cupons.get(codigo)
+            if entrada is not None and agora - entrada[1] <= self.ttl:
+                self._cupons.move_to_end(codigo)
+                return entrada[0]
+        cupom = Cupom.objects.filter(codigo=codigo, ativo=True).first()
+        with self._lock:
+            if cupom is None:
+                self._cupons.pop(codigo, None)
+                return None
+            self._cupons[codigo] = (cupom, agora)
+            self._cupons.move_to_end(codigo)
+            while len(self._cupons) > self.tamanho_maximo:
+                self._cupons.popitem(last=False)
+        return cupom
+
+    def _usos(self, cupom, usuario):
+        """(usos_total, usos_do_usuario) em uma única consulta"""
+        consulta = Cupom.objects.filter(pk=cupom.pk)
+        if usuario is not None:
+            consulta = consulta.annotate(usos_usuario=Subquery(
+                CupomUsoUsuario.objects.filter(cupom=OuterRef('pk'), usuario=usuario).values('usos')[:1]
+            ))
+            usos = consulta.values_list('usos_total', 'usos_usuario').first()
+        else:
+            usos = consulta.values_list('usos_total', flat=True).first(), None
+        return usos or (0, None)
+
+    def verificar(self, cupom, usuario=None, hoje=None):
+        """Levanta CupomInvalido com a mensagem exibida ao cliente"""
+        hoje = hoje or timezone.now().date()
+        if cupom is None or not cupom.ativo:
+            raise CupomInvalido('Cupom inválido ou inativo.', status=404)
+        if cupom.data_inicio and hoje < _data(cupom.data_inicio):
+            raise CupomInvalido('Cupom ainda não está válido.')
+        if cupom.data_fim and hoje > _data(cupom.data_fim):
+            raise CupomInvalido('Cupom expirado.')
+
+        if usuario is not None and not usuario.is_authenticated:
+            usuario = None
+        if usuario is not None and _sem_limite(cupom.limite_por_usuario):
+            usuario = None
+        if _sem_limite(cupom.limite_uso) and usuario is None:
+            return cupom
+
+        usos_total, usos_usuario = self._usos(cupom, usuario)
+        if not _sem_limite(cupom.limite_uso) and usos_total >= cupom.limite_uso:
+            raise CupomInvalido('Limite de usos do cupom esgotado.')
+        if usuario is not None and (usos_usuario or 0) >= cupom.limite_por_usuario:
+            raise CupomInvalido('Você já usou este cupom o número máximo de vezes permitido.')
+        return cupom
+
+    def validar(self, codigo, usuario=None):
+        """Busca pelo código e verifica; retorna o Cupom ou levanta CupomInvalido"""
+        return self.verificar(self.obter((codigo or '').strip().upper()), usuario)
+
+
+validador_cupons = ValidadorCupons(ttl=getattr(settings, 'CUPONS_CACHE_TTL', 60))
+
+
+# ===============================
+# CONTADORES DE USO
+# ===============================
+def registrar_uso(cupom, pedido, respeitar_limites=True):
+    """
+    Registra o uso do cupom no pedido (no máximo uma vez por pedido) e
+    incrementa os contadores. Com `respeitar_limites`, o incremento é
+    condicional: se outro checkout esgotou o cupom no meio do caminho,
+    levanta CupomInvalido e a transação do chamador desfaz tudo.
+    Retorna True se o uso foi criado agora.
+    """
+    with transaction.atomic():
+        # INSERT direto: o pedido tem no máximo um uso (OneToOne), então a
+        # duplicata aparece como IntegrityError sem um SELECT antes.
+        try:
+            with transaction.atomic():
+                CupomUso.objects.create(cupom=cupom, pedido=pedido)
+        except IntegrityError:
+            return False
+
+        contador = Cupom.objects.filter(pk=cupom.pk)
+        if respeitar_limites:
+            contador = contador.filter(
+                Q(limite_uso__isnull=True) | Q(limite_uso=0) | Q(usos_total__lt=F('limite_uso'))
+            )
+        if not contador.update(usos_total=F('usos_total') + 1):
+            raise CupomInvalido('Limite de usos do cupom esgotado.')
+
+        if pedido.usuario_id:
+            CupomUsoUsuario.objects.get_or_create(cupom=cupom, usuario_id=pedido.usuario_id)
+            por_usuario = CupomUsoUsuario.objects.filter(cupom=cupom, usuario_id=pedido.usuario_id)
+            if respeitar_limites and not _sem_limite(cupom.limite_por_usuario):
+                por_usuario = por_usuario.filter(usos__lt=cupom.limite_por_usuario)
+            if not por_usuario.update(usos=F('usos') + 1):
+                raise CupomInvalido('Você já usou este cupom o número máximo de vezes permitido.')
+    return True
+
+
+def registrar_usos(pedido_ids):
+    """
+    Versão em massa de registrar_uso, para pedidos com pagamento já
+    aprovado (sem checar limites): cria os CupomUso que faltam com um
+    INSERT e soma os contadores com um UPDATE por tabela (CASE por cupom /
+    por usuário). Retorna quantos usos foram criados.
+    """
+    from .models import Pedido
+
+    with transaction.atomic():
+        linhas = list(
+            Pedido.objects.filter(pk__in=pedido_ids, cupom__isnull=False, cupom_uso__isnull=True)
+            .values_list('pk', 'cupom_id', 'usuario_id')
+        )
+        if not linhas:
+            return 0
+        CupomUso.objects.bulk_create([CupomUso(cupom_id=cupom_id, pedido_id=pk) for pk, cupom_id, _ in linhas])
+
+        por_cupom = Counter(cupom_id for _, cupom_id, _ in linhas)
+        Cupom.objects.filter(pk__in=por_cupom).update(usos_total=F('usos_total') + Case(
+            *[When(pk=cupom_id, then=Value(total)) for cupom_id, total in por_cupom.items()],
+            default=Value(0),
+            output_field=models.IntegerField()
+        ))
+
+        por_usuario = Counter((cupom_id, usuario_id) for _, cupom_id, usuario_id in linhas if usuario_id)
+        if por_usuario:
+            CupomUsoUsuario.objects.bulk_create(
+                [CupomUsoUsuario(cupom_id=cupom_id, usuario_id=usuario_id) for cupom_id, usuario_id in por_usuario],
+                ignore_conflicts=True
+            )
+            incrementos = [
+                (Q(cupom_id=cupom_id, usuario_id=usuario_id), total)
+                for (cupom_id, usuario_id), total in por_usuario.items()
+            ]
+            CupomUsoUsuario.objects.filter(reduce(or_, [q for q, _ in incrementos])).update(usos=F('usos') + Case(
+                *[When(condicao, then=Value(total)) for condicao, total in incrementos],
+                default=Value(0),
+                output_field=models.IntegerField()
+            ))
+    return len(linhas)
+
+
+def _descontar(campo, decrementos):
+    """`campo - n` por linha (CASE), sem deixar o contador negativo"""
+    decremento = Case(
+        *[When(condicao, then=Value(total)) for condicao, total in decrementos],
+        default=Value(0),
+        output_field=models.IntegerField()
+    )
+    return Greatest(F(campo) - decremento, Value(0), output_field=models.IntegerField())
+
+
+def remover_usos(usos):
+    """
+    Apaga os CupomUso do queryset e desconta os contadores com um UPDATE
+    por tabela (CASE por cupom / por usuário). Retorna quantos foram apagados.
+    """
+    with transaction.atomic():
+        linhas = list(usos.values_list('id', 'cupom_id', 'pedido__usuario_id'))
+        if not linhas:
+            return 0
+
+        por_cupom = Counter(cupom_id for _, cupom_id, _ in linhas)
+        Cupom.objects.filter(pk__in=por_cupom).update(
+            usos_total=_descontar('usos_total', [(Q(pk=cupom_id), total) for cupom_id, total in por_cupom.items()])
+        )
+
+        por_usuario = Counter((cupom_id, usuario_id) for _, cupom_id, usuario_id in linhas if usuario_id)
+        if por_usuario:
+            decrementos = [
+                (Q(cupom_id=cupom_id, usuario_id=usuario_id), total)
+                for (cupom_id, usuario_id), total in por_usuario.items()
+            ]
+            CupomUsoUsuario.objects.filter(reduce(or_, [q for q, _ in decrementos])).update(
+                usos=_descontar('usos', decrementos)
+            )
+
+        CupomUso.objects.filter(id__in=[linha[0] for linha in linhas]).delete()
+    return len(linhas)
+
+
+def recalcular_contadores(cupons):
+    """Refaz os contadores a partir de CupomUso (ex.: após apagar pedidos pelo admin)"""
+    ids = list(cupons.values_list('pk', flat=True))
+    with transaction.atomic():
+        totais = Counter(CupomUso.objects.filter(cupom_id__in=ids).values_list('cupom_id', flat=True))
+        Cupom.objects.filter(pk__in=ids).update(usos_total=Case(
+            *[When(pk=cupom_id, then=Value(total)) for cupom_id, total in totais.items()],
+            default=Value(0),
+            output_field=models.IntegerField()
+        ))
+        por_usuario = Counter(
+            CupomUso.objects.filter(cupom_id__in=ids, pedido__usuario__isnull=False)
+            .values_list('cupom_id', 'pedido__usuario_id')
+        )
+        CupomUsoUsuario.objects.filter(cupom_id__in=ids).delete()
+        CupomUsoUsuario.objects.bulk_create([
+            CupomUsoUsuario(cupom_id=cupom_id, usuario_id=usuario_id, usos=total)
+            for (cupom_id, usuario_id), total in por_usuario.items()
+        ])
+    return len(ids)
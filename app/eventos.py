@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Pedido
+
+logger = logging.getLogger(__name__)
+
+
+# ===============================
+# STATUS DE PEDIDOS EM TEMPO REAL (SSE)
+# ===============================
+STATUS_FINAIS = ['entregue', 'cancelado', 'reembolsado']
+ROTULOS_STATUS = dict(Pedido.STATUS_CHOICES)
+
+
+def formatar_evento(pedido_id, status):
+    """Mensagem no formato text/event-stream"""
+    dados = json.dumps({'pedido_id': pedido_id, 'status': status, 'status_display': ROTULOS_STATUS.get(status, status)})
+    return f"event: status\ndata: {dados}\n\n"
+
+
+class CanalStatus:
+    """
+    Pub/sub em memória: cada conexão SSE assina um pedido e recebe uma
+    fila; `publicar` (chamável de qualquer thread) entrega o novo status
+    só quando ele muda.
+
+    Mudanças feitas em outros processos (worker de webhooks, varredura de
+    reservas, outro servidor) chegam por um verificador por event loop:
+    uma única consulta a cada `intervalo` segundos para todos os pedidos
+    assinados, em vez de uma por cliente.
+    """
+
+    def __init__(self, intervalo=5):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._assinantes = {}     # pedido_id -> {fila: loop}
+        self._ultimo_status = {}  # pedido_id -> status já entregue
+        self._verificadores = {}  # loop -> task
+
+    def assinados(self):
+        with self._lock:
+            return list(self._assinantes)
+
+    def assinar(self, pedido_id, status_atual):
+        """Deve ser chamado de dentro do event loop da conexão"""
+        loop = asyncio.get_running_loop()
+        fila = asyncio.Queue()
+        with self._lock:
+            self._assinantes.setdefault(pedido_id, {})[fila] = loop
+            self._ultimo_status.setdefault(pedido_id, status_atual)
+            if loop not in self._verificadores:
+                # Contexto vazio: a task vive além da requisição que a criou e
+                # não deve somar consultas na medição/rastro dela
+                self._verificadores[loop] = loop.create_task(self._verificar(loop), context=contextvars.Context())
+        return fila
+
+    def cancelar(self, pedido_id, fila):
+        with self._lock:
+            filas = self._assinantes.get(pedido_id, {})
+            filas.pop(fila, None)
+            if not filas:
+                self._assinantes.pop(pedido_id, None)
+                self._ultimo_status.pop(pedido_id, None)
+
+    def publicar(self, pedido_id, status):
+        with self._lock:
+            filas = self._assinantes.get(pedido_id)
+            if not filas or self._ultimo_status.get(pedido_id) == status:
+                return
+            self._ultimo_status[pedido_id] = status
+            destinos = list(filas.items())
+        for fila, loop in destinos:
+            try:
+                loop.call_soon_threadsafe(fila.put_nowait, status)
+            except RuntimeError:
+                # Loop já encerrado: a conexão caiu sem passar pelo cancelar
+                self.cancelar(pedido_id, fila)
+
+    def publicar_apos_commit(self, pedido_id, status):
+        transaction.on_commit(lambda: self.publicar(pedido_id, status))
+
+    def _tem_assinantes(self, loop):
+        with self._lock:
+            return any(loop in filas.values() for filas in self._assinantes.values())
+
+    async def _verificar(self, loop):
+        try:
+            while True:
+                await asyncio.sleep(self.intervalo)
+                if not self._tem_assinantes(loop):
+                    break
+                ids = self.assinados()
+                try:
+                    atuais = [linha async for linha in Pedido.objects.filter(pk__in=ids).values_list('id', 'status')]
+                except Exception as e:
+                    logger.warning(f"Falha ao verificar status de pedidos: {e}")
+                    continue
+                for pedido_id, status in atuais:
+                    self.publicar(pedido_id, status)
+        finally:
+            with self._lock:
+                self._verificadores.pop(loop, None)
+
+
+canal_status = CanalStatus(intervalo=getattr(settings, 'SSE_INTERVALO_VERIFICACAO', 5))
+
+
+async def transmitir_status(pedido_id, status_atual):
+    """
+    Gerador do StreamingHttpResponse: envia o status atual e depois cada
+    mudança, com comentários de keep-alive. Termina em status final ou
+    após SSE_DURACAO_MAXIMA (o EventSource reconecta sozinho).
+    """
+    loop = asyncio.get_running_loop()
+    prazo = loop.time() + getattr(settings, 'SSE_DURACAO_MAXIMA', 300)
+    keepalive = getattr(settings, 'SSE_KEEPALIVE_SEGUNDOS', 15)
+    fila = canal_status.assinar(pedido_id, status_atual)
+    try:
+        yield "retry: 5000\n" + formatar_evento(pedido_id, status_atual)
+        status = status_atual
+        while status not in STATUS_FINAIS:
+            restante = prazo - loop.time()
+            if restante <= 0:
+                break
+            try:
+                status = await asyncio.wait_for(fila.get(), timeout=min(keepalive, restante))
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield formatar_evento(pedido_id, status)
+    finally:
+        canal_status.cancelar(pedido_id, fila)
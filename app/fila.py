@@ -0,0 +1,128 @@
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import NotificacaoWebhook
+from .pagamentos import processar_notificacao_pagamento
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# FILA DE NOTIFICAÇÕES DO MERCADO PAGO
+# ===============================
+def _max_tentativas():
+    return getattr(settings, 'WEBHOOK_MAX_TENTATIVAS', 8)
+
+
+def calcular_espera(tentativas):
+    """Backoff exponencial com jitter: base * 2^(n-1), limitado e sorteado entre 50% e 100%"""
+    base = getattr(settings, 'WEBHOOK_BACKOFF_SEGUNDOS', 30)
+    limite = getattr(settings, 'WEBHOOK_BACKOFF_MAXIMO_SEGUNDOS', 3600)
+    espera = min(limite, base * 2 ** max(tentativas - 1, 0))
+    return timedelta(seconds=espera * random.uniform(0.5, 1.0))
+
+
+class _ReservaParcial(Exception):
+    """Desfaz o UPDATE em lote de reservar_lote quando nem toda linha foi tomada"""
+
+
+def reservar_lote(tamanho_lote=50, agora=None):
+    """
+    Marca como 'processando' até `tamanho_lote` notificações vencidas e as
+    retorna. Notificações presas em 'processando' além do prazo
+    (WEBHOOK_TEMPO_LIMITE_SEGUNDOS, worker que morreu) voltam para a fila.
+    Várias instâncias do comando podem rodar juntas sem pegar a mesma linha.
+    """
+    agora = agora or timezone.now()
+    limite_bloqueio = agora - timedelta(seconds=getattr(settings, 'WEBHOOK_TEMPO_LIMITE_SEGUNDOS', 300))
+    vencidas = (
+        Q(status='pendente', proxima_tentativa__lte=agora)
+        | Q(status='processando', bloqueado_em__lt=limite_bloqueio)
+    )
+
+    with transaction.atomic():
+        lote = list(
+            NotificacaoWebhook.objects.select_for_update()
+            .filter(vencidas)
+            .order_by('proxima_tentativa')[:tamanho_lote]
+        )
+        if not lote:
+            return []
+        # A posse é tomada por um UPDATE condicional sobre os ids lidos: só
+        # linhas ainda pendentes (bloqueado_em nulo) ou presas além do prazo.
+        # Com a transação IMMEDIATE ninguém escreve entre o SELECT e o
+        # UPDATE e todas são tomadas. Se alguma escapar, o UPDATE em lote é
+        # desfeito (savepoint) e cada linha é tomada sozinha, para devolver
+        # só as que deram certo sem reler por `bloqueado_em=agora`.
+        campos = dict(status='processando', bloqueado_em=agora, tentativas=F('tentativas') + 1, atualizado_em=agora)
+        livres = (
+            Q(status='pendente', bloqueado_em__isnull=True)
+            | Q(status='processando', bloqueado_em__lt=limite_bloqueio)
+        )
+        try:
+            with transaction.atomic():
+                ids = [notificacao.pk for notificacao in lote]
+                if NotificacaoWebhook.objects.filter(livres, pk__in=ids).update(**campos) != len(ids):
+                    raise _ReservaParcial()
+            reservadas = lote
+        except _ReservaParcial:
+            reservadas = [
+                notificacao for notificacao in lote
+                if NotificacaoWebhook.objects.filter(livres, pk=notificacao.pk).update(**campos)
+            ]
+
+    for notificacao in reservadas:
+        notificacao.status = 'processando'
+        notificacao.bloqueado_em = agora
+        notificacao.tentativas += 1
+        notificacao.atualizado_em = agora
+    return reservadas
+
+
+def _registrar_resultado(notificacao, **campos):
+    """
+    Grava o desfecho da tentativa. Se o banco falhar aqui (ex.: lock do
+    SQLite), a notificação fica em 'processando' e volta para a fila quando
+    vencer WEBHOOK_TEMPO_LIMITE_SEGUNDOS, em vez de derrubar o worker.
+    """
+    try:
+        NotificacaoWebhook.objects.filter(pk=notificacao.pk, bloqueado_em=notificacao.bloqueado_em).update(**campos)
+    except Exception as e:
+        logger.error(f"Falha ao gravar o resultado da notificação {notificacao.id} ({campos['status']}): {e}")
+
+
+def processar_notificacao(notificacao):
+    """
+    Processa uma notificação já reservada. Sucesso a conclui; falha agenda
+    nova tentativa com backoff ou, esgotadas as tentativas, a marca como
+    'morta' para análise manual no admin. Retorna True em caso de sucesso.
+    """
+    try:
+        processar_notificacao_pagamento(notificacao.payment_id)
+    except Exception as e:
+        agora = timezone.now()
+        if notificacao.tentativas >= _max_tentativas():
+            status, proxima = 'morta', agora
+            logger.error(f"Notificação {notificacao.id} (pagamento {notificacao.payment_id}) descartada após {notificacao.tentativas} tentativas: {e}")
+        else:
+            status, proxima = 'pendente', agora + calcular_espera(notificacao.tentativas)
+            logger.warning(f"Notificação {notificacao.id} falhou (tentativa {notificacao.tentativas}): {e}")
+        _registrar_resultado(
+            notificacao, status=status, proxima_tentativa=proxima, bloqueado_em=None, ultimo_erro=str(e)[:2000], atualizado_em=agora
+        )
+        return False
+
+    _registrar_resultado(notificacao, status='concluida', bloqueado_em=None, ultimo_erro='', atualizado_em=timezone.now())
+    return True
+
+
+def reprocessar(queryset):
+    """Devolve notificações (ex.: mortas) para a fila, zerando as tentativas"""
+    return queryset.exclude(status='processando').update(
+        status='pendente', tentativas=0, proxima_tentativa=timezone.now(), bloqueado_em=None, atualizado_em=timezone.now()
+    )
@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+
+# ===============================
+# CACHE DE FRAGMENTOS (CARDS DE PRODUTO)
+# ===============================
+class CacheFragmentos:
+    """
+    Cache LRU em memória de HTML renderizado.
+
+    A chave inclui `data_atualizacao`, então um produto editado gera uma
+    chave nova e a versão antiga simplesmente envelhece até ser despejada.
+    """
+
+    def __init__(self, template, tamanho_maximo=2000):
+        self.template = template
+        self.tamanho_maximo = tamanho_maximo
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _renderizar(self, produto):
+        return mark_safe(get_template(self.template).render({'produto': produto}))
+
+    def obter(self, produto):
+        chave = (produto.pk, produto.data_atualizacao)
+        with self._lock:
+            html = self._itens.get(chave)
+            if html is not None:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = self._renderizar(produto)
+        with self._lock:
+            self._itens[chave] = html
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+        return html
+
+    def renderizar_lista(self, produtos):
+        return [self.obter(produto) for produto in produtos]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self.hits = self.misses = 0
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'taxa_acerto': round(self.hits / total, 4) if total else 0.0,
+                'itens': len(self._itens),
+                'tamanho_maximo': self.tamanho_maximo,
+            }
+
+
+cache_cards = CacheFragmentos(
+    'partials/card_produto.html',
+    tamanho_maximo=getattr(settings, 'CACHE_CARDS_TAMANHO_MAXIMO', 2000)
+)
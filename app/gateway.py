@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metricas import metricas
+from .rastreamento import rastrear
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# CLIENTE HTTP DO MERCADO PAGO
+# ===============================
+class ErroGateway(Exception):
+    """Falha de comunicação com o Mercado Pago (timeout, conexão, fila cheia)"""
+
+
+class ClienteMercadoPago:
+    """
+    Cliente compartilhado por processo para a API do Mercado Pago.
+
+    - Sessão `requests` com keep-alive e pool de conexões (sem handshake
+      TLS a cada checkout, como acontecia criando um SDK por chamada).
+    - Timeouts de conexão e leitura sempre aplicados.
+    - Semáforo limitando chamadas simultâneas; quem não consegue vaga
+      dentro do prazo recebe ErroGateway em vez de empilhar workers.
+
+    As respostas seguem o formato do SDK oficial ({'status', 'response'}),
+    então as views não mudam de forma.
+    """
+
+    def __init__(self, token, base_url, timeout_conexao=3.0, timeout_leitura=10.0,
+                 max_concorrencia=20, tamanho_pool=20, espera_vaga=2.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.espera_vaga = espera_vaga
+        self._vagas = threading.BoundedSemaphore(max_concorrencia)
+
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=tamanho_pool, max_retries=0)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+        self.sessao.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json',
+        })
+
+    def _requisitar(self, operacao, metodo, caminho, **kwargs):
+        if not self._vagas.acquire(timeout=self.espera_vaga):
+            raise ErroGateway('Limite de chamadas simultâneas ao Mercado Pago atingido')
+        inicio = time.perf_counter()
+        resultado = 'erro'
+        try:
+            with rastrear(f'mercadopago.{operacao}', 'http', metodo=metodo) as span:
+                resposta = self.sessao.request(metodo, f'{self.base_url}{caminho}', timeout=self.timeout, **kwargs)
+                resultado = span['status'] = str(resposta.status_code)
+        except requests.Timeout as e:
+            resultado = 'timeout'
+            raise ErroGateway(f'Timeout no Mercado Pago: {e}') from e
+        except requests.RequestException as e:
+            raise ErroGateway(f'Erro de conexão com o Mercado Pago: {e}') from e
+        finally:
+            self._vagas.release()
+            metricas.registrar_gateway(operacao, resultado, time.perf_counter() - inicio)
+
+        try:
+            corpo = resposta.json()
+        except ValueError:
+            corpo = {'raw': resposta.text}
+        return {'status': resposta.status_code, 'response': corpo}
+
+    # ---------- API síncrona ----------
+    def criar_preferencia(self, dados):
+        return self._requisitar('criar_preferencia', 'POST', '/checkout/preferences', json=dados)
+
+    def obter_pagamento(self, payment_id):
+        return self._requisitar('obter_pagamento', 'GET', f'/v1/payments/{payment_id}')
+
+    # ---------- API assíncrona (views async / ASGI) ----------
+    async def criar_preferencia_async(self, dados):
+        return await sync_to_async(self.criar_preferencia, thread_sensitive=False)(dados)
+
+    async def obter_pagamento_async(self, payment_id):
+        return await sync_to_async(self.obter_pagamento, thread_sensitive=False)(payment_id)
+
+
+_cliente = None
+_lock_cliente = threading.Lock()
+
+
+def get_cliente_mp():
+    """Retorna o cliente do processo, criando-o na primeira chamada"""
+    global _cliente
+    if _cliente is None:
+        with _lock_cliente:
+            if _cliente is None:
+                token = os.getenv('MP_ACCESS_TOKEN') or getattr(settings, 'MP_ACCESS_TOKEN', None)
+                if not token:
+                    logger.error("MP_ACCESS_TOKEN não encontrado")
+                    raise ValueError("Access Token do Mercado Pago não configurado")
+                _cliente = ClienteMercadoPago(
+                    token,
+                    base_url=getattr(settings, 'MERCADOPAGO_API_URL', 'https://api.mercadopago.com'),
+                    timeout_conexao=getattr(settings, 'MERCADOPAGO_TIMEOUT_CONEXAO', 3.0),
+                    timeout_leitura=getattr(settings, 'MERCADOPAGO_TIMEOUT_LEITURA', 10.0),
+                    max_concorrencia=getattr(settings, 'MERCADOPAGO_MAX_CONCORRENCIA', 20),
+                    tamanho_pool=getattr(settings, 'MERCADOPAGO_TAMANHO_POOL', 20),
+                )
+    return _cliente
@@ -0,0 +1,89 @@
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# ===============================
+# SERVIDOR FALSO DO MERCADO PAGO (DESENVOLVIMENTO / TESTES)
+# ===============================
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Imita os dois endpoints usados pela loja:
+    - POST /checkout/preferences -> 201 com id e init_point
+    - GET  /v1/payments/<id>     -> 200 com status e external_reference
+
+    Por convenção, o pagamento <id> referencia o pedido de mesmo número,
+    a menos que a preferência tenha sido criada com outro external_reference
+    e o pagamento seja consultado pelo id da preferência.
+    """
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, como a API real
+
+    def log_message(self, formato, *args):
+        if self.server.verboso:
+            super().log_message(formato, *args)
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _aguardar(self):
+        if self.server.latencia:
+            time.sleep(self.server.latencia)
+
+    def do_POST(self):
+        tamanho = int(self.headers.get('Content-Length', 0))
+        corpo = json.loads(self.rfile.read(tamanho) or b'{}')
+        self._aguardar()
+        if self.path != '/checkout/preferences':
+            return self._responder(404, {'message': 'not found'})
+
+        preference_id = uuid.uuid4().hex
+        self.server.preferencias[preference_id] = corpo
+        self._responder(201, {
+            'id': preference_id,
+            'init_point': f'http://{self.headers.get("Host")}/checkout/{preference_id}',
+            'external_reference': corpo.get('external_reference'),
+        })
+
+    def do_GET(self):
+        self._aguardar()
+        encontrado = re.fullmatch(r'/v1/payments/([\w-]+)', self.path)
+        if not encontrado:
+            return self._responder(404, {'message': 'not found'})
+
+        payment_id = encontrado.group(1)
+        preferencia = self.server.preferencias.get(payment_id, {})
+        self._responder(200, {
+            'id': payment_id,
+            'status': self.server.status_pagamento,
+            'external_reference': preferencia.get('external_reference', payment_id),
+        })
+
+
+class ServidorStubMercadoPago(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco=('127.0.0.1', 0), latencia=0.0, status_pagamento='approved', verboso=False):
+        super().__init__(endereco, _Handler)
+        self.latencia = latencia
+        self.status_pagamento = status_pagamento
+        self.verboso = verboso
+        self.preferencias = {}
+
+    @property
+    def url(self):
+        host, porta = self.server_address[:2]
+        return f'http://{host}:{porta}'
+
+    def iniciar_em_thread(self):
+        """Sobe o servidor em segundo plano (útil em testes); retorna a URL base"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.url
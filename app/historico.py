@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Count, Prefetch, Q, Sum
+
+from .models import ItemPedido, Pedido
+from .paginacao import paginar_por_cursor
+from .precos import dinheiro
+
+
+# ===============================
+# HISTÓRICO DE PEDIDOS DO CLIENTE
+# ===============================
+CAMPOS_LISTA_PEDIDO = ['id', 'usuario_id', 'status', 'valor_total', 'criado_em']
+STATUS_EM_ANDAMENTO = ['pendente', 'processando', 'pago', 'preparando', 'enviado']
+STATUS_PAGOS = ['pago', 'preparando', 'enviado', 'entregue']
+
+
+def pagina_pedidos(usuario, apos=None, antes=None, por_pagina=None):
+    """
+    Uma página dos pedidos do usuário, do mais recente para o mais antigo.
+    O cursor (criado_em, id) segue o índice (usuario, criado_em): o custo é
+    o mesmo para quem tem 3 ou 3.000 pedidos.
+    """
+    return paginar_por_cursor(
+        Pedido.objects.filter(usuario=usuario).only(*CAMPOS_LISTA_PEDIDO),
+        'criado_em',
+        apos=apos,
+        antes=antes,
+        por_pagina=por_pagina or getattr(settings, 'PEDIDOS_POR_PAGINA', 20)
+    )
+
+
+def pedido_com_itens(usuario, pedido_id):
+    """Pedido com itens e produtos em duas consultas (sem uma por item)"""
+    itens = ItemPedido.objects.select_related('produto').only(
+        'id', 'pedido_id', 'quantidade', 'preco_unitario', 'produto__id', 'produto__nome'
+    )
+    return Pedido.objects.prefetch_related(Prefetch('itens', queryset=itens)).filter(
+        pk=pedido_id, usuario=usuario
+    ).first()
+
+
+class ResumoPedidos:
+    """
+    Contagens do histórico por usuário (total, em andamento, valor gasto),
+    calculadas com um único agregado e guardadas em um LRU por processo.
+
+    O signal de Pedido invalida o usuário no processo atual; o `ttl` cobre
+    os outros workers e as atualizações em massa (que não disparam signals).
+    """
+
+    def __init__(self, ttl=60, tamanho_maximo=5000):
+        self.ttl = ttl
+        self.tamanho_maximo = tamanho_maximo
+        self._resumos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidar(self, usuario_id=None):
+        with self._lock:
+            if usuario_id is None:
+                self._resumos.clear()
+            else:
+                self._resumos.pop(usuario_id, None)
+
+    def obter(self, usuario_id):
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._resumos.get(usuario_id)
+            if entrada is not None and agora - entrada[1] <= self.ttl:
+                self._resumos.move_to_end(usuario_id)
+                return entrada[0]
+
+        resumo = Pedido.objects.filter(usuario_id=usuario_id).aggregate(
+            total=Count('id'),
+            em_andamento=Count('id', filter=Q(status__in=STATUS_EM_ANDAMENTO)),
+            valor_gasto=Sum('valor_total', filter=Q(status__in=STATUS_PAGOS)),
+        )
+        resumo['valor_gasto'] = dinheiro(resumo['valor_gasto'] or 0)
+
+        with self._lock:
+            self._resumos[usuario_id] = (resumo, agora)
+            self._resumos.move_to_end(usuario_id)
+            while len(self._resumos) > self.tamanho_maximo:
+                self._resumos.popitem(last=False)
+        return resumo
+
+
+resumo_pedidos = ResumoPedidos(ttl=getattr(settings, 'RESUMO_PEDIDOS_TTL', 60))
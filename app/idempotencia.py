@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ChaveIdempotencia
+
+
+# ===============================
+# CHAVES DE IDEMPOTÊNCIA DO CHECKOUT
+# ===============================
+class ChaveDeOutroUsuario(Exception):
+    pass
+
+
+class ChaveReutilizada(Exception):
+    """Mesma chave com outro corpo: não é uma repetição do mesmo checkout"""
+
+
+def resumo_corpo(corpo):
+    return hashlib.sha256(corpo or b'').hexdigest()
+
+
+def _tempo_limite():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_TEMPO_LIMITE_SEGUNDOS', 120))
+
+
+def iniciar(chave, usuario_id, hash_corpo=''):
+    """
+    Tenta ficar com a chave. Retorna (registro, dono):
+    - dono=True: esta requisição deve processar o checkout;
+    - dono=False: outra já processou ou está processando.
+
+    Uma chave presa em 'em_andamento' além do tempo limite (processo que
+    morreu no meio) ou expirada (IDEMPOTENCIA_VALIDADE_HORAS) é assumida
+    por esta requisição. A chave reenviada com outro corpo (`hash_corpo`,
+    ver resumo_corpo) levanta ChaveReutilizada.
+    """
+    try:
+        with transaction.atomic():
+            return ChaveIdempotencia.objects.create(chave=chave, usuario_id=usuario_id, hash_corpo=hash_corpo), True
+    except IntegrityError:
+        pass
+
+    registro = ChaveIdempotencia.objects.get(chave=chave)
+    if registro.usuario_id != usuario_id:
+        raise ChaveDeOutroUsuario(chave)
+
+    agora = timezone.now()
+    validade = timedelta(hours=getattr(settings, 'IDEMPOTENCIA_VALIDADE_HORAS', 24))
+    abandonada = registro.status == 'em_andamento' and registro.atualizado_em < agora - _tempo_limite()
+    expirada = registro.criado_em < agora - validade
+    # Chave expirada vale como nova, com qualquer corpo
+    if not expirada and registro.hash_corpo and registro.hash_corpo != hash_corpo:
+        raise ChaveReutilizada(chave)
+    if abandonada or expirada:
+        assumiu = ChaveIdempotencia.objects.filter(
+            pk=registro.pk, status=registro.status, atualizado_em=registro.atualizado_em
+        ).update(
+            status='em_andamento', status_http=None, resposta=None, hash_corpo=hash_corpo,
+            criado_em=agora, atualizado_em=agora
+        )
+        if assumiu:
+            registro.refresh_from_db()
+            return registro, True
+        registro.refresh_from_db()
+    return registro, False
+
+
+def concluir(registro, status_http, resposta):
+    ChaveIdempotencia.objects.filter(pk=registro.pk).update(
+        status='concluida', status_http=status_http, resposta=resposta, atualizado_em=timezone.now()
+    )
+
+
+def descartar(registro):
+    """Erro do servidor: libera a chave para que uma nova tentativa processe de novo"""
+    ChaveIdempotencia.objects.filter(pk=registro.pk, status='em_andamento').delete()
+
+
+async def aguardar(registro):
+    """
+    Espera a requisição dona da chave terminar (sem duplicar o trabalho).
+    Retorna o registro concluído, ou None se ela não terminou a tempo ou
+    foi descartada.
+    """
+    espera = getattr(settings, 'IDEMPOTENCIA_ESPERA_SEGUNDOS', 20)
+    intervalo = 0.1
+    prazo = asyncio.get_running_loop().time() + espera
+    while registro is not None and registro.status != 'concluida':
+        if asyncio.get_running_loop().time() >= prazo:
+            return None
+        await asyncio.sleep(intervalo)
+        intervalo = min(intervalo * 2, 1.0)
+        registro = await ChaveIdempotencia.objects.filter(pk=registro.pk).afirst()
+    return registro
+
+
+iniciar_async = sync_to_async(iniciar)
+concluir_async = sync_to_async(concluir)
+descartar_async = sync_to_async(descartar)
+
+
+def limpar_expiradas(agora=None):
+    """Apaga chaves mais antigas que IDEMPOTENCIA_VALIDADE_HORAS; retorna quantas"""
+    agora = agora or timezone.now()
+    validade = timedelta(hours=getattr(settings, 'IDEMPOTENCIA_VALIDADE_HORAS', 24))
+    apagadas, _ = ChaveIdempotencia.objects.filter(criado_em__lt=agora - validade).delete()
+    return apagadas
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+def _conectar(caminho, pragmas, timeout):
+    conexao = sqlite3.connect(caminho, timeout=timeout, isolation_level=None, check_same_thread=False)
+    for pragma in filter(None, pragmas.split(';')):
+        conexao.execute(pragma)
+    return conexao
+
+
+def _preparar(caminho, pragmas, produtos):
+    conexao = _conectar(caminho, pragmas, 30)
+    conexao.execute('CREATE TABLE produto (id INTEGER PRIMARY KEY, nome TEXT, preco REAL, estoque INTEGER)')
+    conexao.execute('CREATE TABLE pedido (id INTEGER PRIMARY KEY, produto_id INTEGER, quantidade INTEGER, criado_em REAL)')
+    conexao.executemany(
+        'INSERT INTO produto (id, nome, preco, estoque) VALUES (?, ?, ?, ?)',
+        [(i, f'Produto {i}', 9.9, 1000) for i in range(1, produtos + 1)]
+    )
+    conexao.close()
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+class Command(BaseCommand):
+    help = 'Mede leituras concorrentes com escritas de checkout: SQLite padrão x perfil de produção (WAL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leitores', type=int, default=4)
+        parser.add_argument('--escritores', type=int, default=2)
+        parser.add_argument('--duracao', type=float, default=5, help='Segundos por perfil')
+        parser.add_argument('--escrita-ms', type=float, default=5, help='Trabalho dentro de cada transação de escrita')
+        parser.add_argument('--produtos', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        opcoes_banco = getattr(settings, 'SQLITE_OPTIONS', {})
+        perfis = [
+            ('padrão (journal DELETE)', 'PRAGMA journal_mode=DELETE', 5),
+            ('produção (WAL)', 'PRAGMA journal_mode=WAL;' + getattr(settings, 'SQLITE_PRAGMAS', ''), opcoes_banco.get('timeout', 20)),
+        ]
+        for nome, pragmas, timeout in perfis:
+            with tempfile.TemporaryDirectory() as pasta:
+                caminho = os.path.join(pasta, 'benchmark.sqlite3')
+                _preparar(caminho, pragmas, options['produtos'])
+                resultado = self._executar(caminho, pragmas, timeout, options)
+            self._relatar(nome, resultado, options['duracao'])
+
+    def _executar(self, caminho, pragmas, timeout, options):
+        parar = threading.Event()
+        latencias, escritas, erros = [], [0], [0]
+        lock = threading.Lock()
+        produtos = options['produtos']
+        espera_escrita = options['escrita_ms'] / 1000
+
+        def leitor(semente):
+            conexao = _conectar(caminho, pragmas, timeout)
+            locais, i = [], semente
+            while not parar.is_set():
+                inicio_faixa = (i * 97) % (produtos - 12) + 1
+                inicio = time.perf_counter()
+                try:
+                    conexao.execute(
+                        'SELECT id, nome, preco, estoque FROM produto WHERE id BETWEEN ? AND ? AND estoque > 0',
+                        (inicio_faixa, inicio_faixa + 12)
+                    ).fetchall()
+                    locais.append(time.perf_counter() - inicio)
+                except sqlite3.OperationalError:
+                    with lock:
+                        erros[0] += 1
+                i += 1
+            conexao.close()
+            with lock:
+                latencias.extend(locais)
+
+        def escritor(semente):
+            conexao = _conectar(caminho, pragmas, timeout)
+            i = semente
+            while not parar.is_set():
+                produto_id = (i * 31) % produtos + 1
+                try:
+                    conexao.execute('BEGIN IMMEDIATE')
+                    conexao.execute(
+                        'INSERT INTO pedido (produto_id, quantidade, criado_em) VALUES (?, 1, ?)', (produto_id, time.time())
+                    )
+                    conexao.execute('UPDATE produto SET estoque = estoque - 1 WHERE id = ? AND estoque > 0', (produto_id,))
+                    time.sleep(espera_escrita)
+                    conexao.execute('COMMIT')
+                    with lock:
+                        escritas[0] += 1
+                except sqlite3.OperationalError:
+                    if conexao.in_transaction:
+                        conexao.execute('ROLLBACK')
+                    with lock:
+                        erros[0] += 1
+                i += 1
+            conexao.close()
+
+        threads = [threading.Thread(target=leitor, args=(n,)) for n in range(options['leitores'])]
+        threads += [threading.Thread(target=escritor, args=(n,)) for n in range(options['escritores'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duracao'])
+        parar.set()
+        for thread in threads:
+            thread.join()
+        return latencias, escritas[0], erros[0]
+
+    def _relatar(self, nome, resultado, duracao):
+        latencias, escritas, erros = resultado
+        ms = [valor * 1000 for valor in latencias]
+        self.stdout.write(f'{nome}:')
+        self.stdout.write(f'  leituras/s: {len(ms) / duracao:10.0f}   escritas/s: {escritas / duracao:8.1f}   erros: {erros}')
+        if ms:
+            self.stdout.write(
+                f'  latência de leitura (ms): p50={statistics.median(ms):.3f}  '
+                f'p99={_percentil(ms, 0.99):.3f}  máx={max(ms):.3f}'
+            )
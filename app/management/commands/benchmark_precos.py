@@ -0,0 +1,89 @@
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import ItemPedido, Pedido, Produto
+from app.precos import resumir, subtotais_pedidos
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _cronometrar(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+
+def _total_float(itens, valor_cupom):
+    """Cálculo antigo das views: floats do começo ao fim"""
+    subtotal = sum(float(i['preco']) * int(i['quantidade']) for i in itens)
+    frete = 0 if subtotal >= getattr(settings, 'FRETE_GRATIS_ACIMA_DE', 100) else getattr(settings, 'VALOR_FRETE', 15)
+    desconto = subtotal * (valor_cupom / 100)
+    return max(subtotal + frete - desconto, 0)
+
+
+class _CupomPercentual:
+    tipo = 'percentual'
+
+    def __init__(self, valor):
+        self.valor = Decimal(valor)
+
+
+class Command(BaseCommand):
+    help = 'Compara o cálculo de totais antigo (float/Python) com o motor de preços (Decimal/SQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--itens', type=int, default=2000, help='Linhas no carrinho/pedido')
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--semente', type=int, default=42)
+
+    def handle(self, *args, **options):
+        n, repeticoes = options['itens'], options['repeticoes']
+        aleatorio = random.Random(options['semente'])
+        itens = [
+            {'preco': f"{aleatorio.randint(1, 99999) / 100:.2f}", 'quantidade': aleatorio.randint(1, 5)}
+            for _ in range(n)
+        ]
+
+        # ---------- carrinho em memória ----------
+        ms_float, total_float = _cronometrar(lambda: _total_float(itens, 7.5), repeticoes)
+        linhas = [(Decimal(i['preco']), i['quantidade']) for i in itens]
+        cupom = _CupomPercentual('7.5')
+        ms_decimal, resumo = _cronometrar(lambda: resumir(linhas, cupom), repeticoes)
+
+        self.stdout.write(f'Carrinho com {n} linhas ({repeticoes} repetições):')
+        self.stdout.write(f'  float (antigo):   {ms_float:8.3f} ms  total={total_float!r}')
+        self.stdout.write(f'  Decimal (motor):  {ms_decimal:8.3f} ms  total={resumo.total}')
+        self.stdout.write(f'  diferença:        {Decimal(str(total_float)) - resumo.total}')
+
+        # ---------- pedido gravado (desfeito no final) ----------
+        try:
+            with transaction.atomic():
+                produtos = Produto.objects.bulk_create([
+                    Produto(nome=f'benchmark {i}', preco=Decimal(item['preco']), estoque=0)
+                    for i, item in enumerate(itens)
+                ])
+                pedido = Pedido.objects.create(status='pendente')
+                ItemPedido.objects.bulk_create([
+                    ItemPedido(pedido=pedido, produto=produto, quantidade=item['quantidade'], preco_unitario=produto.preco)
+                    for produto, item in zip(produtos, itens)
+                ])
+
+                ms_python, subtotal_python = _cronometrar(
+                    lambda: sum(item.subtotal() for item in pedido.itens.all()), repeticoes
+                )
+                ms_sql, subtotais = _cronometrar(lambda: subtotais_pedidos([pedido.pk]), repeticoes)
+
+                self.stdout.write(f'Pedido gravado com {n} itens:')
+                self.stdout.write(f'  itens.all() em Python: {ms_python:8.3f} ms  subtotal={subtotal_python}')
+                self.stdout.write(f'  SUM no banco:          {ms_sql:8.3f} ms  subtotal={subtotais[pedido.pk]}')
+                raise _Rollback
+        except _Rollback:
+            pass
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+MODOS_JOURNAL = ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST')
+
+
+class Command(BaseCommand):
+    help = (
+        'Grava o journal_mode no arquivo do SQLite (padrão: SQLITE_JOURNAL_MODE). '
+        'Rodar uma vez no deploy: o modo persiste e vale para todas as conexões'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modo', default=None, help=f"Um de {', '.join(MODOS_JOURNAL)}")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        modo = (options['modo'] or getattr(settings, 'SQLITE_JOURNAL_MODE', 'WAL')).upper()
+        if modo not in MODOS_JOURNAL:
+            raise CommandError(f"Modo inválido: {modo} (use {', '.join(MODOS_JOURNAL)})")
+        conexao = connections[options['database']]
+        if conexao.vendor != 'sqlite':
+            raise CommandError('journal_mode só existe no SQLite.')
+
+        with conexao.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            anterior = cursor.fetchone()[0].upper()
+            cursor.execute(f'PRAGMA journal_mode={modo}')
+            atual = cursor.fetchone()[0].upper()
+        if atual != modo:
+            raise CommandError(f'O SQLite manteve journal_mode={atual} (banco em uso por outra conexão?)')
+        self.stdout.write(self.style.SUCCESS(f"journal_mode: {anterior} -> {atual} ({conexao.settings_dict['NAME']})"))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.idempotencia import limpar_expiradas
+from app.reservas import liberar_reservas_expiradas
+from app.sessoes import limpar_sessoes_expiradas
+
+
+class Command(BaseCommand):
+    help = (
+        'Libera o estoque de reservas expiradas, cancela pedidos pendentes antigos '
+        'e apaga chaves de idempotência e sessões vencidas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Pedidos por lote')
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Segundos entre varreduras; 0 executa uma vez (para uso com cron)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            com_reserva, sem_reserva = liberar_reservas_expiradas(tamanho_lote=options['lote'])
+            self.stdout.write(
+                f'{com_reserva} reserva(s) expirada(s) liberada(s), '
+                f'{sem_reserva} pedido(s) pendente(s) antigo(s) cancelado(s), '
+                f'{limpar_expiradas()} chave(s) de idempotência e '
+                f'{limpar_sessoes_expiradas()} sessão(ões) vencida(s) apagada(s).'
+            )
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
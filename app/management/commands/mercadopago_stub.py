@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from app.gateway_stub import ServidorStubMercadoPago
+
+
+class Command(BaseCommand):
+    help = 'Sobe um servidor local que imita a API do Mercado Pago (preferências e pagamentos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--porta', type=int, default=8765)
+        parser.add_argument('--latencia', type=float, default=0.0, help='Atraso por requisição, em segundos')
+        parser.add_argument('--status-pagamento', default='approved',
+                            choices=['approved', 'pending', 'rejected', 'cancelled'])
+
+    def handle(self, *args, **options):
+        servidor = ServidorStubMercadoPago(
+            ('127.0.0.1', options['porta']),
+            latencia=options['latencia'],
+            status_pagamento=options['status_pagamento'],
+            verboso=True,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Stub do Mercado Pago em {servidor.url} '
+            f'(use MERCADOPAGO_API_URL={servidor.url})'
+        ))
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
@@ -0,0 +1,53 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.fila import processar_notificacao, reservar_lote
+
+logger = logging.getLogger(__name__)
+
+
+def _processar(notificacao):
+    # Cada thread do pool tem sua própria conexão; fecha as velhas/quebradas
+    close_old_connections()
+    try:
+        return processar_notificacao(notificacao)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Processa a fila de notificações do Mercado Pago com um pool de workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Threads processando notificações em paralelo')
+        parser.add_argument('--lote', type=int, default=50, help='Notificações reservadas por vez')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera quando a fila está vazia')
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia a fila e termina (para uso com cron)')
+
+    def handle(self, *args, **options):
+        concluidas = falhas = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                # Uma falha de banco (lock, conexão caída) perde só esta volta:
+                # as notificações reservadas voltam para a fila pelo tempo limite
+                try:
+                    lote = reservar_lote(tamanho_lote=options['lote'])
+                    if lote:
+                        for sucesso in pool.map(_processar, lote):
+                            if sucesso:
+                                concluidas += 1
+                            else:
+                                falhas += 1
+                        continue
+                except Exception as e:
+                    logger.error(f"Erro no laço de webhooks: {e}", exc_info=True)
+                    close_old_connections()
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+
+        self.stdout.write(f'{concluidas} notificação(ões) processada(s), {falhas} falha(s).')
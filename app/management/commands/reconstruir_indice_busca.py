@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app.busca import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice full-text (FTS5) de produtos'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('O índice FTS5 só está disponível com SQLite.')
+        total = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'Índice de busca reconstruído: {total} produto(s).'))
@@ -0,0 +1,79 @@
+import json
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Agrupa as consultas lentas por impressão digital, ordena pelo tempo total '
+        'e aponta as que varrem tabelas inteiras (candidatas a índice)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--arquivo', default=None, help='JSONL de consultas lentas (padrão: CONSULTAS_LENTAS_ARQUIVO)')
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--varreduras', action='store_true', help='Só consultas com varredura de tabela')
+
+    def handle(self, *args, **options):
+        caminho = options['arquivo'] or getattr(settings, 'CONSULTAS_LENTAS_ARQUIVO', None)
+        grupos = self._agrupar(caminho)
+        if options['varreduras']:
+            grupos = {digital: grupo for digital, grupo in grupos.items() if grupo['varreduras']}
+        if not grupos:
+            self.stdout.write('Nenhuma consulta lenta registrada.')
+            return
+
+        total_geral = sum(grupo['total_ms'] for grupo in grupos.values())
+        self.stdout.write(
+            f"{sum(grupo['qtd'] for grupo in grupos.values())} consulta(s) lenta(s) em "
+            f"{len(grupos)} forma(s), {total_geral:.0f} ms no total ({caminho})\n"
+        )
+        ranking = sorted(grupos.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        for posicao, (digital, grupo) in enumerate(ranking[:options['top']], 1):
+            aviso = f"  VARRE {', '.join(sorted(grupo['varreduras']))}" if grupo['varreduras'] else ''
+            self.stdout.write(
+                f"{posicao:2d}. [{digital}] {grupo['total_ms']:.0f} ms em {grupo['qtd']}x "
+                f"(média {grupo['total_ms'] / grupo['qtd']:.1f} ms, máx {grupo['max_ms']:.1f} ms){aviso}"
+            )
+            self.stdout.write(f"    origem: {', '.join(f'{o} ({n})' for o, n in grupo['origens'].most_common(3))}")
+            self.stdout.write(f"    sql: {grupo['sql'][:300]}")
+            for passo in grupo['plano']:
+                self.stdout.write(f'    plano: {passo}')
+
+        # Resumo por tabela: onde um índice faria mais diferença
+        por_tabela = defaultdict(lambda: [0, 0.0])
+        for grupo in grupos.values():
+            for tabela in grupo['varreduras']:
+                por_tabela[tabela][0] += 1
+                por_tabela[tabela][1] += grupo['total_ms']
+        if por_tabela:
+            self.stdout.write('\nTabelas lidas inteiras (formas de consulta, tempo total):')
+            for tabela, (formas, total_ms) in sorted(por_tabela.items(), key=lambda item: item[1][1], reverse=True):
+                self.stdout.write(f'  {tabela:30} {formas:4d} forma(s) {total_ms:10.0f} ms')
+
+    def _agrupar(self, caminho):
+        grupos = {}
+        try:
+            arquivo = open(caminho, encoding='utf-8')
+        except FileNotFoundError:
+            raise CommandError(f'Arquivo de consultas lentas não encontrado: {caminho}')
+        with arquivo:
+            for linha in arquivo:
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    continue  # linha cortada (processo encerrado durante a gravação)
+                grupo = grupos.setdefault(registro['digital'], {
+                    'qtd': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'origens': Counter(),
+                    'sql': registro['sql_normalizado'], 'plano': [], 'varreduras': set(),
+                })
+                grupo['qtd'] += 1
+                grupo['total_ms'] += registro['duracao_ms']
+                grupo['max_ms'] = max(grupo['max_ms'], registro['duracao_ms'])
+                grupo['origens'][registro['origem']] += 1
+                if registro['plano']:
+                    grupo['plano'] = registro['plano']
+                grupo['varreduras'].update(registro['varreduras'])
+        return grupos
@@ -0,0 +1,100 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _tempo_proprio(spans):
+    """Duração de cada span menos a dos filhos diretos (o que ele fez sozinho)"""
+    filhos = defaultdict(float)
+    for span in spans:
+        if span.get('pai') is not None:
+            filhos[span['pai']] += span['duracao_ms']
+    return {span['id']: max(0.0, span['duracao_ms'] - filhos[span['id']]) for span in spans}
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0.0
+
+
+class Command(BaseCommand):
+    help = 'Resume os rastros amostrados: requisições mais lentas e onde o tempo foi gasto, por span'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--arquivo', default=None, help='JSONL de rastros (padrão: RASTREAMENTO_ARQUIVO)')
+        parser.add_argument('--rota', default=None, help='Só rastros desta rota (nome da view)')
+        parser.add_argument('--top', type=int, default=10)
+
+    def handle(self, *args, **options):
+        caminho = options['arquivo'] or getattr(settings, 'RASTREAMENTO_ARQUIVO', None)
+        rastros = self._ler(caminho, options['rota'])
+        if not rastros:
+            self.stdout.write('Nenhum rastro encontrado.')
+            return
+        self.stdout.write(f'{len(rastros)} rastro(s) em {caminho}\n')
+        self._mais_lentos(rastros, options['top'])
+        self._por_span(rastros, options['top'])
+
+    def _ler(self, caminho, rota):
+        rastros = []
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                for linha in arquivo:
+                    try:
+                        rastro = json.loads(linha)
+                    except ValueError:
+                        continue  # linha cortada (processo encerrado durante a gravação)
+                    if rota is None or rastro.get('rota') == rota:
+                        rastros.append(rastro)
+        except FileNotFoundError:
+            raise CommandError(f'Arquivo de rastros não encontrado: {caminho}')
+        return rastros
+
+    def _mais_lentos(self, rastros, top):
+        self.stdout.write('Mais lentos (tempo próprio por tipo de span):')
+        for rastro in sorted(rastros, key=lambda r: r['duracao_ms'], reverse=True)[:top]:
+            spans = rastro['spans']
+            proprio = _tempo_proprio(spans)
+            por_tipo, quantidade = defaultdict(float), defaultdict(int)
+            for span in spans:
+                tipo = 'outros' if span['tipo'] in ('requisicao', 'interno') else span['tipo']
+                por_tipo[tipo] += proprio[span['id']]
+                quantidade[tipo] += span['tipo'] != 'requisicao'
+            self.stdout.write(
+                f"  {rastro['duracao_ms']:9.1f} ms  {rastro['metodo']} {rastro['rota']} -> {rastro['status']}"
+                f"  trace {rastro['trace_id']}"
+            )
+            self.stdout.write('      ' + ' | '.join(
+                f'{tipo} {por_tipo[tipo]:.1f} ms ({quantidade[tipo]})'
+                for tipo in sorted(por_tipo, key=por_tipo.get, reverse=True)
+            ))
+            maiores = sorted((s for s in spans if s['tipo'] != 'requisicao'), key=lambda s: s['duracao_ms'], reverse=True)[:3]
+            if maiores:
+                self.stdout.write('      maiores: ' + '; '.join(f"{s['nome']} {s['duracao_ms']:.1f} ms" for s in maiores))
+            if rastro.get('spans_descartados'):
+                self.stdout.write(f"      {rastro['spans_descartados']} span(s) além do limite não gravados")
+
+    def _por_span(self, rastros, top):
+        total_requisicoes = sum(r['duracao_ms'] for r in rastros) or 1
+        agregados = defaultdict(lambda: {'tipo': '', 'proprio': 0.0, 'duracoes': []})
+        for rastro in rastros:
+            proprio = _tempo_proprio(rastro['spans'])
+            for span in rastro['spans']:
+                if span['tipo'] == 'requisicao':
+                    continue
+                agregado = agregados[span['nome']]
+                agregado['tipo'] = span['tipo']
+                agregado['proprio'] += proprio[span['id']]
+                agregado['duracoes'].append(span['duracao_ms'])
+
+        self.stdout.write('\nSpans com mais tempo próprio (% do tempo total das requisições):')
+        self.stdout.write(f"  {'span':45} {'tipo':9} {'qtd':>6} {'próprio ms':>11} {'%':>6} {'p50 ms':>8} {'p95 ms':>8}")
+        for nome, agregado in sorted(agregados.items(), key=lambda item: item[1]['proprio'], reverse=True)[:top]:
+            duracoes = agregado['duracoes']
+            self.stdout.write(
+                f"  {nome[:45]:45} {agregado['tipo']:9} {len(duracoes):6d} {agregado['proprio']:11.1f} "
+                f"{agregado['proprio'] / total_requisicoes * 100:6.1f} "
+                f"{_percentil(duracoes, 0.5):8.2f} {_percentil(duracoes, 0.95):8.2f}"
+            )
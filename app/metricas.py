@@ -0,0 +1,274 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+from .rastreamento import rastrear
+
+
+# ===============================
+# REGISTRO DE MÉTRICAS (FORMATO PROMETHEUS)
+# ===============================
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, extra=''):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, rotulos, buckets=BUCKETS_SEGUNDOS):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.buckets = buckets
+        self._series = {}  # valores dos rótulos -> [contagens por bucket, soma, total]
+
+    def observar(self, valores, valor):
+        serie = self._series.get(valores)
+        if serie is None:
+            serie = self._series[valores] = [[0] * len(self.buckets), 0.0, 0]
+        indice = bisect_left(self.buckets, valor)
+        if indice < len(self.buckets):
+            serie[0][indice] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        for valores, (contagens, soma, total) in sorted(self._series.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                rotulos = _rotulos(self.rotulos, valores, 'le="%s"' % limite)
+                linhas.append(f'{self.nome}_bucket{rotulos} {acumulado}')
+            rotulos = _rotulos(self.rotulos, valores, 'le="+Inf"')
+            linhas.append(f'{self.nome}_bucket{rotulos} {total}')
+            linhas.append(f'{self.nome}_sum{_rotulos(self.rotulos, valores)} {soma:.6f}')
+            linhas.append(f'{self.nome}_count{_rotulos(self.rotulos, valores)} {total}')
+        return linhas
+
+
+class Contador:
+    def __init__(self, nome, ajuda, rotulos):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._series = {}
+
+    def incrementar(self, valores, valor=1):
+        self._series[valores] = self._series.get(valores, 0) + valor
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} counter']
+        for valores, total in sorted(self._series.items()):
+            linhas.append(f'{self.nome}{_rotulos(self.rotulos, valores)} {total}')
+        return linhas
+
+
+class RegistroMetricas:
+    """
+    Métricas do processo, agregadas por rota (nome da view, cardinalidade
+    fixa). Cada worker tem o seu registro; o Prometheus soma os workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requisicoes = Contador(
+            'loja_requisicoes_total', 'Requisições atendidas', ('rota', 'metodo', 'status'))
+        self.duracao = Histograma(
+            'loja_requisicao_segundos', 'Latência da requisição (até a resposta)', ('rota', 'metodo'))
+        self.consultas = Histograma(
+            'loja_requisicao_consultas_sql', 'Consultas SQL por requisição', ('rota',), BUCKETS_CONSULTAS)
+        self.tempo_sql = Histograma(
+            'loja_requisicao_sql_segundos', 'Tempo em SQL por requisição', ('rota',))
+        self.tempo_template = Histograma(
+            'loja_requisicao_template_segundos', 'Tempo renderizando templates por requisição', ('rota',))
+        self.tempo_gateway = Histograma(
+            'loja_requisicao_mercadopago_segundos', 'Tempo em chamadas ao Mercado Pago por requisição', ('rota',))
+        self.chamadas_gateway = Histograma(
+            'loja_mercadopago_chamada_segundos', 'Chamadas ao Mercado Pago (inclui o worker de webhooks)',
+            ('operacao', 'resultado'))
+
+    def registrar_requisicao(self, rota, metodo, status, segundos, medicao):
+        with self._lock:
+            self.requisicoes.incrementar((rota, metodo, status))
+            self.duracao.observar((rota, metodo), segundos)
+            self.consultas.observar((rota,), medicao.consultas)
+            self.tempo_sql.observar((rota,), medicao.tempo_sql)
+            self.tempo_template.observar((rota,), medicao.tempo_template)
+            if medicao.tempo_gateway:
+                self.tempo_gateway.observar((rota,), medicao.tempo_gateway)
+
+    def registrar_gateway(self, operacao, resultado, segundos):
+        if not getattr(settings, 'METRICAS_ATIVAS', False):
+            return
+        medicao = _medicao_atual.get()
+        if medicao is not None:
+            medicao.tempo_gateway += segundos
+        with self._lock:
+            self.chamadas_gateway.observar((operacao, resultado), segundos)
+
+    def exportar(self):
+        from .fragmentos import cache_cards
+
+        with self._lock:
+            linhas = []
+            for metrica in (self.requisicoes, self.duracao, self.consultas, self.tempo_sql,
+                            self.tempo_template, self.tempo_gateway, self.chamadas_gateway):
+                linhas += metrica.exportar()
+
+        cache = cache_cards.estatisticas()
+        linhas += [
+            '# HELP loja_cache_cards_consultas_total Consultas ao cache de cards de produto',
+            '# TYPE loja_cache_cards_consultas_total counter',
+            f'loja_cache_cards_consultas_total{{resultado="hit"}} {cache["hits"]}',
+            f'loja_cache_cards_consultas_total{{resultado="miss"}} {cache["misses"]}',
+            '# HELP loja_cache_cards_itens Cards no cache',
+            '# TYPE loja_cache_cards_itens gauge',
+            f'loja_cache_cards_itens {cache["itens"]}',
+        ]
+        return '\n'.join(linhas) + '\n'
+
+
+metricas = RegistroMetricas()
+
+
+# ===============================
+# MEDIÇÃO POR REQUISIÇÃO
+# ===============================
+class Medicao:
+    __slots__ = ('consultas', 'tempo_sql', 'tempo_template', 'tempo_gateway', 'profundidade_template')
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.tempo_template = 0.0
+        self.tempo_gateway = 0.0
+        self.profundidade_template = 0
+
+
+# Acompanha o sync_to_async, então consultas das views assíncronas (feitas
+# em outra thread) são somadas à requisição certa
+_medicao_atual = contextvars.ContextVar('medicao_atual', default=None)
+
+
+def medir_sql(execute, sql, params, many, context):
+    """execute_wrapper instalado em toda conexão nova (connection_created)"""
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao.tempo_sql += time.perf_counter() - inicio
+        medicao.consultas += 1
+
+
+def instrumentar_conexao(sender, connection, **kwargs):
+    if medir_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_sql)
+
+
+def instalar():
+    """Chamado no AppConfig.ready, antes de qualquer conexão ser aberta"""
+    if getattr(settings, 'METRICAS_ATIVAS', False):
+        connection_created.connect(instrumentar_conexao, dispatch_uid='metricas_sql')
+
+
+class MetricasMiddleware:
+    """
+    Primeiro da lista: mede a requisição inteira, com os outros middlewares.
+    Com METRICAS_ATIVAS = False sai da pilha (MiddlewareNotUsed) e as
+    conexões não recebem o wrapper de SQL (ver instalar).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICAS_ATIVAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        medicao = Medicao()
+        marca = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicao_atual.reset(marca)
+        self._registrar(request, response, time.perf_counter() - inicio, medicao)
+        return response
+
+    async def __acall__(self, request):
+        medicao = Medicao()
+        marca = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicao_atual.reset(marca)
+        self._registrar(request, response, time.perf_counter() - inicio, medicao)
+        return response
+
+    def _registrar(self, request, response, segundos, medicao):
+        resolver = getattr(request, 'resolver_match', None)
+        rota = (resolver.view_name if resolver else None) or 'nao_encontrada'
+        metricas.registrar_requisicao(rota, request.method, response.status_code, segundos, medicao)
+
+
+# ===============================
+# TEMPO DE RENDERIZAÇÃO DE TEMPLATES
+# ===============================
+class TemplateMedido:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, nome):
+        return getattr(self.template, nome)
+
+    def render(self, context=None, request=None):
+        with rastrear(getattr(self.template.origin, 'template_name', None) or 'template', 'template'):
+            medicao = _medicao_atual.get()
+            if medicao is None:
+                return self.template.render(context, request)
+            medicao.profundidade_template += 1
+            inicio = time.perf_counter()
+            try:
+                return self.template.render(context, request)
+            finally:
+                medicao.profundidade_template -= 1
+                if not medicao.profundidade_template:
+                    # Só o render mais externo conta (sem somar includes duas vezes)
+                    medicao.tempo_template += time.perf_counter() - inicio
+
+
+class TemplatesMedidos(DjangoTemplates):
+    """Backend DjangoTemplates que mede e rastreia cada render (ver settings.TEMPLATES)"""
+
+    def from_string(self, template_code):
+        return TemplateMedido(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TemplateMedido(super().get_template(template_name))
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def criar_indice_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS app_produto_fts USING fts5("
+            "nome, descricao, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        cursor.execute(
+            "INSERT INTO app_produto_fts (rowid, nome, descricao) "
+            "SELECT id, nome, COALESCE(descricao, '') FROM app_produto"
+        )
+
+
+def remover_indice_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS app_produto_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_alter_cupom_data_fim_alter_cupom_data_inicio_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice_fts, remover_indice_fts),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_produto_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='estoque_reservado',
+            field=models.BooleanField(default=False, verbose_name='Estoque Reservado'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='reserva_expira_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Reserva Expira em'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estoque_reservado', 'reserva_expira_em'], name='app_pedido_estoque_59793c_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_pedido_reserva_estoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacaoWebhook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50, verbose_name='Tipo')),
+                ('payment_id', models.CharField(max_length=100, verbose_name='ID do Pagamento')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Payload Recebido')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('morta', 'Falhou (sem novas tentativas)')], default='pendente', max_length=20, verbose_name='Status')),
+                ('tentativas', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima Tentativa')),
+                ('bloqueado_em', models.DateTimeField(blank=True, null=True, verbose_name='Em Processamento Desde')),
+                ('ultimo_erro', models.TextField(blank=True, default='', verbose_name='Último Erro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Recebida em')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Última Atualização')),
+            ],
+            options={
+                'verbose_name': 'Notificação do Mercado Pago',
+                'verbose_name_plural': 'Notificações do Mercado Pago',
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa'], name='app_notific_status_faf5b7_idx')],
+            },
+        ),
+    ]
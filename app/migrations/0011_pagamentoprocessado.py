@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_notificacaowebhook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PagamentoProcessado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.CharField(max_length=100, verbose_name='ID do Pagamento')),
+                ('status', models.CharField(max_length=30, verbose_name='Status no Mercado Pago')),
+                ('pedido_referencia', models.CharField(blank=True, default='', max_length=100, verbose_name='Pedido (external_reference)')),
+                ('processado_em', models.DateTimeField(auto_now_add=True, verbose_name='Processado em')),
+            ],
+            options={
+                'verbose_name': 'Pagamento Processado',
+                'verbose_name_plural': 'Pagamentos Processados',
+                'ordering': ['-processado_em'],
+                'constraints': [models.UniqueConstraint(fields=('payment_id', 'status'), name='pagamento_status_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def preencher_contadores(apps, schema_editor):
+    Cupom = apps.get_model('app', 'Cupom')
+    CupomUso = apps.get_model('app', 'CupomUso')
+    CupomUsoUsuario = apps.get_model('app', 'CupomUsoUsuario')
+
+    for cupom_id, total in CupomUso.objects.values_list('cupom_id').annotate(total=Count('id')):
+        Cupom.objects.filter(pk=cupom_id).update(usos_total=total)
+
+    por_usuario = (
+        CupomUso.objects.filter(pedido__usuario__isnull=False)
+        .values_list('cupom_id', 'pedido__usuario_id')
+        .annotate(total=Count('id'))
+    )
+    CupomUsoUsuario.objects.bulk_create([
+        CupomUsoUsuario(cupom_id=cupom_id, usuario_id=usuario_id, usos=total)
+        for cupom_id, usuario_id, total in por_usuario
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_pagamentoprocessado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cupom',
+            name='usos_total',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Usos'),
+        ),
+        migrations.CreateModel(
+            name='CupomUsoUsuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('usos', models.PositiveIntegerField(default=0)),
+                ('cupom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usos_por_usuario', to='app.cupom')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usos_cupom', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Uso de Cupom por Usuário',
+                'verbose_name_plural': 'Usos de Cupom por Usuário',
+                'constraints': [models.UniqueConstraint(fields=('cupom', 'usuario'), name='unique_cupom_usuario')],
+            },
+        ),
+        migrations.RunPython(preencher_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:44
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+
+def preencher_frete(apps, schema_editor):
+    """Frete dos pedidos antigos: o que sobra de valor_total além de itens - desconto"""
+    Pedido = apps.get_model('app', 'Pedido')
+    ItemPedido = apps.get_model('app', 'ItemPedido')
+    subtotais = dict(
+        ItemPedido.objects.values('pedido_id')
+        .annotate(subtotal=Sum(ExpressionWrapper(
+            F('quantidade') * F('preco_unitario'), output_field=DecimalField(max_digits=14, decimal_places=2)
+        )))
+        .values_list('pedido_id', 'subtotal')
+    )
+    for pedido in Pedido.objects.only('id', 'valor_total', 'desconto_cupom'):
+        subtotal = Decimal(str(subtotais.get(pedido.id) or 0))
+        frete = pedido.valor_total - subtotal + pedido.desconto_cupom
+        if frete > 0:
+            Pedido.objects.filter(pk=pedido.pk).update(valor_frete=frete.quantize(Decimal('0.01')))
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_contadores_cupom'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='valor_frete',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Frete'),
+        ),
+        migrations.RunPython(preencher_frete, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_chaveidempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacaowebhook',
+            index=models.Index(fields=['payment_id'], name='app_notific_payment_5ee5c5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['criado_em', 'id'], name='app_pedido_criado__30f03f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['cep'], name='app_pedido_cep_41bbaf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['email_entrega'], name='app_pedido_email_e_731f60_idx'),
+        ),
+    ]
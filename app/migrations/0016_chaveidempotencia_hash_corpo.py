@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_indices_admin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chaveidempotencia',
+            name='hash_corpo',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='SHA-256 do Corpo'),
+        ),
+    ]
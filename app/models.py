@@ -1,10 +1,78 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 import json
 
 
+# ===============================
+# ESTOQUE: UPDATEs CONDICIONAIS
+# ===============================
+class ProdutoQuerySet(models.QuerySet):
+    def reservar_estoque(self, quantidades, tudo_ou_nada=True):
+        """
+        Reserva estoque para vários produtos: {produto_id: quantidade}.
+
+        Com `tudo_ou_nada`, é um único `UPDATE ... SET estoque = estoque - n
+        WHERE id IN (...) AND estoque >= n` (n via CASE), qualquer que seja o
+        tamanho do pedido: se nem todas as linhas forem atualizadas, a
+        reserva inteira é desfeita. Sem ele, cada produto é um UPDATE
+        condicional próprio. Nos dois casos, duas reservas concorrentes
+        nunca sobrescrevem uma à outra. Retorna {produto_id: bool}.
+        """
+        if not quantidades:
+            return {}
+        agora = timezone.now()
+        if not tudo_ou_nada:
+            reservas = {
+                produto_id: bool(
+                    self.filter(pk=produto_id, disponivel=True, estoque__gte=quantidade)
+                    .update(estoque=F('estoque') - quantidade, data_atualizacao=agora)
+                )
+                for produto_id, quantidade in quantidades.items()
+            }
+            self._estoque_alterado([produto_id for produto_id, ok in reservas.items() if ok])
+            return reservas
+
+        quantidade = Case(
+            *[When(pk=produto_id, then=Value(n)) for produto_id, n in quantidades.items()],
+            output_field=models.IntegerField()
+        )
+        with transaction.atomic():
+            atualizados = self.filter(pk__in=quantidades.keys(), disponivel=True, estoque__gte=quantidade).update(
+                estoque=F('estoque') - quantidade, data_atualizacao=agora
+            )
+            if atualizados == len(quantidades):
+                self._estoque_alterado(quantidades)
+                return {produto_id: True for produto_id in quantidades}
+            transaction.set_rollback(True)
+        return {produto_id: False for produto_id in quantidades}
+
+    def liberar_estoque(self, quantidades):
+        """Devolve estoque de vários produtos em um único UPDATE com CASE"""
+        if not quantidades:
+            return 0
+        incremento = Case(
+            *[When(pk=produto_id, then=Value(quantidade)) for produto_id, quantidade in quantidades.items()],
+            default=Value(0),
+            output_field=models.IntegerField()
+        )
+        devolvidos = self.filter(pk__in=quantidades.keys()).update(
+            estoque=F('estoque') + incremento,
+            data_atualizacao=timezone.now()
+        )
+        self._estoque_alterado(quantidades)
+        return devolvidos
+
+    def _estoque_alterado(self, produto_ids):
+        """UPDATE não dispara signals: avisa o índice de sugestões após o commit"""
+        from .sugestoes import indice_sugestoes
+        produto_ids = list(produto_ids)
+        if produto_ids:
+            transaction.on_commit(lambda: indice_sugestoes.marcar_alterados(produto_ids), using=self.db)
+
+
 class Produto(models.Model):
     nome = models.CharField(max_length=100, verbose_name='Nome do Produto')
     descricao = models.TextField(blank=True, verbose_name='Descrição')
@@ -42,6 +110,8 @@ class Produto(models.Model):
     data_criacao = models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')
     data_atualizacao = models.DateTimeField(auto_now=True, verbose_name='Última Atualização')
 
+    objects = ProdutoQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.nome} - R$ {self.preco}"
 
@@ -57,15 +127,15 @@ class Produto(models.Model):
         return self.estoque >= quantidade and self.disponivel
 
     def reservar_estoque(self, quantidade):
-        if self.estoque_disponivel(quantidade):
+        reservado = Produto.objects.reservar_estoque({self.pk: quantidade})[self.pk]
+        if reservado:
+            # Reflete a reserva na instância sem reler a linha
             self.estoque -= quantidade
-            self.save()
-            return True
-        return False
+        return reservado
 
     def liberar_estoque(self, quantidade):
+        Produto.objects.liberar_estoque({self.pk: quantidade})
         self.estoque += quantidade
-        self.save()
 
     class Meta:
         verbose_name = 'Produto'
@@ -115,30 +185,28 @@ class Cupom(models.Model):
         default=1,
         verbose_name='Limite por Usuário'
     )
+    usos_total = models.PositiveIntegerField(default=0, editable=False, verbose_name='Usos')
     criado_em = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.codigo} - {self.valor} ({self.get_tipo_display()})"
 
-    def is_valid(self, usuario=None):
-        agora = timezone.now().date()  # ← .date() aqui!
-
-        if not self.ativo:
-            return False, "Cupom inativo"
-        if self.data_inicio and agora < self.data_inicio:
-            return False, "Cupom ainda não começou"
-        if self.data_fim and agora > self.data_fim:
-            return False, "Cupom expirado"
-        if self.limite_uso is not None:
-            usos = self.usos.count()
-            if usos >= self.limite_uso:
-                return False, "Limite de usos atingido"
-
-        if usuario and usuario.is_authenticated:
-            usos_usuario = self.usos.filter(pedido__usuario=usuario).count()
-            if usos_usuario >= self.limite_por_usuario:
-                return False, "Você já usou este cupom"
+    def save(self, *args, **kwargs):
+        # O contador é mantido por UPDATEs atômicos (app/cupons.py); um save()
+        # vindo do admin não pode sobrescrevê-lo com o valor lido no formulário.
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.attname for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname != 'usos_total'
+            ]
+        super().save(*args, **kwargs)
 
+    def is_valid(self, usuario=None):
+        from .cupons import CupomInvalido, validador_cupons
+        try:
+            validador_cupons.verificar(self, usuario)
+        except CupomInvalido as e:
+            return False, e.mensagem
         return True, "Válido"
 
     class Meta:
@@ -160,6 +228,23 @@ class CupomUso(models.Model):
         verbose_name_plural = 'Usos de Cupom'
 
 
+class CupomUsoUsuario(models.Model):
+    """Contador de usos de um cupom por usuário (evita COUNT com JOIN em Pedido)"""
+    cupom = models.ForeignKey(Cupom, related_name='usos_por_usuario', on_delete=models.CASCADE)
+    usuario = models.ForeignKey(User, related_name='usos_cupom', on_delete=models.CASCADE)
+    usos = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.cupom.codigo} - {self.usuario} ({self.usos})"
+
+    class Meta:
+        verbose_name = 'Uso de Cupom por Usuário'
+        verbose_name_plural = 'Usos de Cupom por Usuário'
+        constraints = [
+            models.UniqueConstraint(fields=['cupom', 'usuario'], name='unique_cupom_usuario')
+        ]
+
+
 # ===============================
 # PEDIDO (ENDEREÇO + CUPOM + JSON)
 # ===============================
@@ -175,6 +260,18 @@ class Pedido(models.Model):
         ('reembolsado', 'Reembolsado'),
     ]
 
+    # Transições permitidas (também usadas pelas transições em massa)
+    FLUXO_STATUS = {
+        'pendente': ['processando', 'pago', 'cancelado'],
+        'processando': ['pago', 'cancelado'],
+        'pago': ['preparando', 'reembolsado'],
+        'preparando': ['enviado'],
+        'enviado': ['entregue'],
+        'entregue': [],
+        'cancelado': [],
+        'reembolsado': [],
+    }
+
     usuario = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -233,16 +330,27 @@ class Pedido(models.Model):
         default=0,
         verbose_name='Desconto do Cupom'
     )
+    valor_frete = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name='Frete'
+    )
+
+    # RESERVA DE ESTOQUE (checkout)
+    estoque_reservado = models.BooleanField(default=False, verbose_name='Estoque Reservado')
+    reserva_expira_em = models.DateTimeField(null=True, blank=True, verbose_name='Reserva Expira em')
 
     def __str__(self):
         usuario_nome = self.usuario.username if self.usuario else "Visitante"
         return f"Pedido #{self.id} - {usuario_nome} - {self.get_status_display()}"
 
     def calcular_total(self):
-        subtotal = sum(item.subtotal() for item in self.itens.all())
-        desconto = self.desconto_cupom or 0
-        self.valor_total = max(subtotal - desconto, 0)
-        self.save()
+        """Itens (somados no banco) + frete - desconto, em Decimal"""
+        from .precos import ResumoPreco, subtotais_pedidos
+        subtotal = subtotais_pedidos([self.pk]).get(self.pk, 0)
+        self.valor_total = ResumoPreco(subtotal, self.valor_frete or 0, self.desconto_cupom or 0).total
+        self.save(update_fields=['valor_total', 'atualizado_em'])
         return self.valor_total
 
     def endereco_completo(self):
@@ -253,22 +361,14 @@ class Pedido(models.Model):
         return ", ".join(filter(None, parts))
 
     def pode_alterar_status(self, novo_status):
-        fluxo_valido = {
-            'pendente': ['processando', 'cancelado'],
-            'processando': ['pago', 'cancelado'],
-            'pago': ['preparando', 'reembolsado'],
-            'preparando': ['enviado'],
-            'enviado': ['entregue'],
-            'entregue': [],
-            'cancelado': [],
-            'reembolsado': [],
-        }
-        return novo_status in fluxo_valido.get(self.status, [])
+        return novo_status in self.FLUXO_STATUS.get(self.status, [])
 
     def atualizar_status(self, novo_status):
         if self.pode_alterar_status(novo_status):
             self.status = novo_status
             self.save()
+            from .eventos import canal_status
+            canal_status.publicar_apos_commit(self.pk, novo_status)
             return True
         return False
 
@@ -278,13 +378,33 @@ class Pedido(models.Model):
             return True
         return False
 
+    def quantidades_por_produto(self):
+        quantidades = {}
+        for produto_id, quantidade in self.itens.values_list('produto_id', 'quantidade'):
+            quantidades[produto_id] = quantidades.get(produto_id, 0) + quantidade
+        return quantidades
+
+    def reservar_estoque_itens(self, tudo_ou_nada=True, quantidades=None):
+        """
+        Reserva o estoque de todos os itens; retorna {produto_id: bool}.
+        `quantidades` evita reler os itens quando o chamador acabou de gravá-los.
+        """
+        if quantidades is None:
+            quantidades = self.quantidades_por_produto()
+        return Produto.objects.reservar_estoque(quantidades, tudo_ou_nada=tudo_ou_nada)
+
+    def liberar_estoque_itens(self):
+        return Produto.objects.liberar_estoque(self.quantidades_por_produto())
+
     def cancelar_pedido(self):
-        if self.status in ['pendente', 'processando']:
-            for item in self.itens.all():
-                item.produto.liberar_estoque(item.quantidade)
-            self.atualizar_status('cancelado')
-            return True
-        return False
+        """Cancela (se o fluxo permitir), devolvendo estoque reservado e cupom"""
+        if not self.pode_alterar_status('cancelado'):
+            return False
+        from .transicoes import transicionar_pedidos
+        if not transicionar_pedidos(Pedido.objects.filter(pk=self.pk), 'cancelado'):
+            return False
+        self.refresh_from_db(fields=['status', 'estoque_reservado', 'reserva_expira_em', 'atualizado_em'])
+        return True
 
     class Meta:
         verbose_name = 'Pedido'
@@ -294,6 +414,11 @@ class Pedido(models.Model):
             models.Index(fields=['usuario', 'criado_em']),
             models.Index(fields=['status']),
             models.Index(fields=['id_mercado_pago']),
+            models.Index(fields=['estoque_reservado', 'reserva_expira_em']),
+            # Listagem do admin (ORDER BY criado_em DESC, id DESC) e buscas exatas
+            models.Index(fields=['criado_em', 'id']),
+            models.Index(fields=['cep']),
+            models.Index(fields=['email_entrega']),
         ]
 
 
@@ -320,4 +445,88 @@ class ItemPedido(models.Model):
         verbose_name_plural = 'Itens dos Pedidos'
         constraints = [
             models.UniqueConstraint(fields=['pedido', 'produto'], name='unique_produto_pedido')
-        ]
\ No newline at end of file
+        ]
+
+# ===============================
+# FILA DE NOTIFICAÇÕES DO MERCADO PAGO
+# ===============================
+class NotificacaoWebhook(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluida', 'Concluída'),
+        ('morta', 'Falhou (sem novas tentativas)'),
+    ]
+
+    tipo = models.CharField(max_length=50, verbose_name='Tipo')
+    payment_id = models.CharField(max_length=100, verbose_name='ID do Pagamento')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Payload Recebido')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente', verbose_name='Status')
+    tentativas = models.PositiveIntegerField(default=0, verbose_name='Tentativas')
+    proxima_tentativa = models.DateTimeField(default=timezone.now, verbose_name='Próxima Tentativa')
+    bloqueado_em = models.DateTimeField(null=True, blank=True, verbose_name='Em Processamento Desde')
+    ultimo_erro = models.TextField(blank=True, default='', verbose_name='Último Erro')
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name='Recebida em')
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name='Última Atualização')
+
+    def __str__(self):
+        return f"Notificação {self.tipo} #{self.payment_id} - {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = 'Notificação do Mercado Pago'
+        verbose_name_plural = 'Notificações do Mercado Pago'
+        ordering = ['-criado_em']
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa']),
+            models.Index(fields=['payment_id']),
+        ]
+
+
+class PagamentoProcessado(models.Model):
+    """Registro de pagamentos já aplicados: uma linha por (pagamento, status)"""
+    payment_id = models.CharField(max_length=100, verbose_name='ID do Pagamento')
+    status = models.CharField(max_length=30, verbose_name='Status no Mercado Pago')
+    pedido_referencia = models.CharField(max_length=100, blank=True, default='', verbose_name='Pedido (external_reference)')
+    processado_em = models.DateTimeField(auto_now_add=True, verbose_name='Processado em')
+
+    def __str__(self):
+        return f"Pagamento #{self.payment_id} - {self.status}"
+
+    class Meta:
+        verbose_name = 'Pagamento Processado'
+        verbose_name_plural = 'Pagamentos Processados'
+        ordering = ['-processado_em']
+        constraints = [
+            # Também serve de índice para buscas só por payment_id
+            models.UniqueConstraint(fields=['payment_id', 'status'], name='pagamento_status_unico'),
+        ]
+
+
+# ===============================
+# IDEMPOTÊNCIA DO CHECKOUT
+# ===============================
+class ChaveIdempotencia(models.Model):
+    """Resposta gravada de um checkout, indexada pela chave enviada pelo navegador"""
+    STATUS_CHOICES = [
+        ('em_andamento', 'Em andamento'),
+        ('concluida', 'Concluída'),
+    ]
+
+    chave = models.CharField(max_length=100, unique=True, verbose_name='Chave')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='chaves_idempotencia')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='em_andamento', verbose_name='Status')
+    status_http = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='Status HTTP')
+    resposta = models.JSONField(null=True, blank=True, verbose_name='Resposta')
+    hash_corpo = models.CharField(max_length=64, blank=True, default='', verbose_name='SHA-256 do Corpo')
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name='Criada em')
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name='Última Atualização')
+
+    def __str__(self):
+        return f"{self.chave} - {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = 'Chave de Idempotência'
+        verbose_name_plural = 'Chaves de Idempotência'
+        indexes = [
+            models.Index(fields=['criado_em']),
+        ]
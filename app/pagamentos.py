@@ -0,0 +1,152 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .gateway import ErroGateway, get_cliente_mp
+from .cupons import registrar_uso, remover_usos
+from .eventos import canal_status
+from .models import Pedido, CupomUso, PagamentoProcessado
+from .reservas import confirmar_reserva, liberar_reserva
+
+logger = logging.getLogger(__name__)
+
+# Status do Mercado Pago que alteram o pedido. Um pagamento pode passar por
+# mais de um (approved -> refunded): cada par (pagamento, status) vale uma vez.
+STATUS_FINAIS = ('approved', 'cancelled', 'rejected', 'refunded', 'charged_back')
+
+
+# ===============================
+# REGISTRO DE PAGAMENTOS JÁ PROCESSADOS (IDEMPOTÊNCIA)
+# ===============================
+class RegistroPagamentos:
+    """
+    Evita reaplicar um pagamento quando o Mercado Pago reenvia a notificação.
+
+    A fonte da verdade é a tabela PagamentoProcessado (única por pagamento
+    e status); na frente dela fica um LRU em memória com os pares
+    (pagamento, status) vistos recentemente, então uma rajada de reenvios
+    custa uma consulta ao dicionário por entrega, sem banco. Um status novo
+    do mesmo pagamento (ex.: estorno depois da aprovação) não é repetição.
+    """
+
+    def __init__(self, tamanho_maximo=10000):
+        self.tamanho_maximo = tamanho_maximo
+        self._recentes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lembrar(self, chave):
+        with self._lock:
+            self._recentes[chave] = True
+            self._recentes.move_to_end(chave)
+            while len(self._recentes) > self.tamanho_maximo:
+                self._recentes.popitem(last=False)
+
+    def em_cache(self, chave):
+        with self._lock:
+            if chave in self._recentes:
+                self._recentes.move_to_end(chave)
+                return True
+        return False
+
+    def ja_processado(self, payment_id, status):
+        chave = (str(payment_id), status)
+        if self.em_cache(chave):
+            return True
+        if PagamentoProcessado.objects.filter(payment_id=chave[0], status=status).exists():
+            self._lembrar(chave)
+            return True
+        return False
+
+    def registrar(self, payment_id, status, pedido_referencia=''):
+        """
+        Grava (payment_id, status). Retorna False se já existia, ou seja,
+        se outra entrega chegou primeiro. Deve rodar na mesma transação
+        que aplica o pagamento; o id só entra no cache após o commit.
+        """
+        chave = (str(payment_id), status)
+        # INSERT direto (sem o SELECT do get_or_create): sendo a primeira
+        # escrita da transação, o SQLite espera o lock em vez de falhar
+        # com "database is locked" quando vários workers gravam juntos.
+        try:
+            with transaction.atomic():
+                PagamentoProcessado.objects.create(
+                    payment_id=chave[0], status=status, pedido_referencia=str(pedido_referencia)
+                )
+            criado = True
+        except IntegrityError:
+            criado = False
+        transaction.on_commit(lambda: self._lembrar(chave))
+        return criado
+
+    def limpar(self):
+        with self._lock:
+            self._recentes.clear()
+
+
+registro_pagamentos = RegistroPagamentos(
+    tamanho_maximo=getattr(settings, 'PAGAMENTOS_RECENTES_TAMANHO_MAXIMO', 10000)
+)
+
+
+# ===============================
+# APLICAÇÃO DE PAGAMENTOS DO MERCADO PAGO
+# ===============================
+def aplicar_pagamento(pedido_id, status):
+    """Atualiza pedido, estoque e cupom conforme o status do pagamento"""
+    try:
+        pedido = Pedido.objects.get(id=pedido_id)
+        if status == 'approved':
+            pedido.status = 'pago'
+            sem_estoque = confirmar_reserva(pedido)
+            if sem_estoque:
+                logger.warning(f"Pedido {pedido.id} pago sem estoque para os produtos {sem_estoque}")
+            # CORREÇÃO: Verificar se o uso do cupom já foi registrado
+            # Pagamento já aprovado: registra mesmo que o cupom tenha esgotado
+            if pedido.cupom and registrar_uso(pedido.cupom, pedido, respeitar_limites=False):
+                logger.info(f"Cupom {pedido.cupom.codigo} registrado via webhook para pedido {pedido.id}")
+        elif status in ['cancelled', 'rejected']:
+            pedido.status = 'cancelado'
+            liberar_reserva(pedido)
+            # CORREÇÃO: Remover uso do cupom se o pagamento falhar
+            if pedido.cupom:
+                remover_usos(CupomUso.objects.filter(pedido=pedido))
+                logger.info(f"Uso do cupom {pedido.cupom.codigo} removido devido a cancelamento do pedido {pedido.id}")
+        elif status in ['refunded', 'charged_back']:
+            # Dinheiro devolvido ao comprador: o estoque já saiu (ou sai) com o envio
+            pedido.status = 'reembolsado'
+        pedido.save(update_fields=['status', 'atualizado_em'])
+        canal_status.publicar_apos_commit(pedido.pk, pedido.status)
+    except Pedido.DoesNotExist:
+        logger.warning(f"Pedido {pedido_id} não encontrado no webhook")
+
+
+def processar_notificacao_pagamento(payment_id):
+    """
+    Consulta o pagamento no Mercado Pago e aplica o resultado ao pedido.
+    Levanta ErroGateway em qualquer resposta inesperada, para que a fila
+    tente de novo mais tarde. Retorna False quando a notificação era
+    repetida e nada foi alterado.
+    """
+    payment_info = get_cliente_mp().obter_pagamento(payment_id)
+    if payment_info['status'] != 200:
+        raise ErroGateway(f"Mercado Pago respondeu {payment_info['status']} para o pagamento {payment_id}")
+
+    payment = payment_info['response']
+    pedido_id = payment.get('external_reference')
+    status = payment.get('status')
+    # Status intermediários (pending, in_process) não alteram o pedido nem
+    # entram no registro: a notificação do status final ainda vai chegar.
+    if not pedido_id or status not in STATUS_FINAIS:
+        return False
+    if registro_pagamentos.ja_processado(payment_id, status):
+        return False
+
+    with transaction.atomic():
+        if not registro_pagamentos.registrar(payment_id, status, pedido_id):
+            logger.info(f"Pagamento {payment_id} ({status}) já processado; notificação ignorada")
+            return False
+        aplicar_pagamento(pedido_id, status)
+    return True
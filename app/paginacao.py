@@ -0,0 +1,96 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+# ===============================
+# PAGINAÇÃO POR CURSOR (KEYSET)
+# ===============================
+def codificar_cursor(valor, pk):
+    """Gera um cursor opaco e estável a partir de (data, id)"""
+    bruto = f"{valor.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Retorna (data, id) ou None se o cursor for inválido"""
+    if not cursor:
+        return None
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        bruto = base64.urlsafe_b64decode(cursor + preenchimento).decode()
+        valor, pk = bruto.rsplit('|', 1)
+        return datetime.fromisoformat(valor), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class PaginaCursor:
+    """
+    Página de resultados com links "anterior/próximo" baseados em cursor.
+    Itera como uma lista, para o template continuar usando {% for %}.
+    """
+
+    def __init__(self, itens, campo, tem_anterior, tem_proximo):
+        self.itens = itens
+        self.campo = campo
+        self.has_previous = tem_anterior
+        self.has_next = tem_proximo
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    def __getitem__(self, indice):
+        return self.itens[indice]
+
+    @property
+    def has_other_pages(self):
+        return self.has_previous or self.has_next
+
+    @property
+    def cursor_anterior(self):
+        if not self.has_previous or not self.itens:
+            return ''
+        primeiro = self.itens[0]
+        return codificar_cursor(getattr(primeiro, self.campo), primeiro.pk)
+
+    @property
+    def cursor_proximo(self):
+        if not self.has_next or not self.itens:
+            return ''
+        ultimo = self.itens[-1]
+        return codificar_cursor(getattr(ultimo, self.campo), ultimo.pk)
+
+
+def paginar_por_cursor(queryset, campo, apos=None, antes=None, por_pagina=12):
+    """
+    Pagina `queryset` em ordem decrescente de (campo, id).
+
+    Em vez de OFFSET, cada página filtra a partir do último item visto, de
+    modo que o custo é proporcional ao tamanho da página e a consulta usa o
+    índice existente em `campo`.
+    """
+    posicao_apos = decodificar_cursor(apos)
+    posicao_antes = None if posicao_apos else decodificar_cursor(antes)
+
+    if posicao_antes:
+        valor, pk = posicao_antes
+        filtro = Q(**{f'{campo}__gt': valor}) | Q(**{campo: valor, 'pk__gt': pk})
+        linhas = list(queryset.filter(filtro).order_by(campo, 'pk')[:por_pagina + 1])
+        tem_anterior = len(linhas) > por_pagina
+        itens = list(reversed(linhas[:por_pagina]))
+        return PaginaCursor(itens, campo, tem_anterior, True)
+
+    if posicao_apos:
+        valor, pk = posicao_apos
+        filtro = Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'pk__lt': pk})
+        queryset = queryset.filter(filtro)
+
+    linhas = list(queryset.order_by(f'-{campo}', '-pk')[:por_pagina + 1])
+    tem_proximo = len(linhas) > por_pagina
+    return PaginaCursor(linhas[:por_pagina], campo, bool(posicao_apos), tem_proximo)
@@ -0,0 +1,108 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Sum, Value, When
+
+from .models import ItemPedido, Pedido
+
+
+# ===============================
+# MOTOR DE PREÇOS (DECIMAL)
+# ===============================
+CENTAVOS = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+def dinheiro(valor):
+    """Converte para Decimal com 2 casas (floats passam por str, sem herdar o erro binário)"""
+    if not isinstance(valor, Decimal):
+        valor = Decimal(str(valor))
+    return valor.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def calcular_frete(subtotal):
+    if subtotal >= dinheiro(getattr(settings, 'FRETE_GRATIS_ACIMA_DE', 100)):
+        return ZERO
+    return dinheiro(getattr(settings, 'VALOR_FRETE', 15))
+
+
+def calcular_desconto(cupom, subtotal):
+    """Desconto do cupom sobre o subtotal (nunca maior que ele)"""
+    if cupom is None:
+        return ZERO
+    if cupom.tipo == 'percentual':
+        desconto = subtotal * cupom.valor / 100
+    else:
+        desconto = cupom.valor
+    return dinheiro(min(desconto, subtotal))
+
+
+class ResumoPreco:
+    """Subtotal, frete, desconto e total de um carrinho ou pedido"""
+
+    def __init__(self, subtotal, frete, desconto):
+        self.subtotal = dinheiro(subtotal)
+        self.frete = dinheiro(frete)
+        self.desconto = dinheiro(desconto)
+        self.total = max(self.subtotal + self.frete - self.desconto, ZERO)
+
+    def como_dict(self):
+        """Valores como string, para JSON sem perda de precisão"""
+        return {
+            'subtotal': str(self.subtotal),
+            'frete': str(self.frete),
+            'desconto': str(self.desconto),
+            'total': str(self.total),
+        }
+
+
+def resumir(linhas, cupom=None):
+    """`linhas`: pares (preco_unitario, quantidade) com preços do banco"""
+    subtotal = sum((dinheiro(preco) * quantidade for preco, quantidade in linhas), ZERO)
+    return ResumoPreco(subtotal, calcular_frete(subtotal), calcular_desconto(cupom, subtotal))
+
+
+# ===============================
+# TOTAIS DE PEDIDOS GRAVADOS (AGREGAÇÃO NO BANCO)
+# ===============================
+_SUBTOTAL_ITEM = ExpressionWrapper(
+    F('quantidade') * F('preco_unitario'),
+    output_field=DecimalField(max_digits=14, decimal_places=2)
+)
+
+
+def subtotais_pedidos(pedido_ids):
+    """{pedido_id: subtotal} com um único SUM(quantidade * preco_unitario) agrupado"""
+    subtotais = (
+        ItemPedido.objects.filter(pedido_id__in=pedido_ids)
+        .values('pedido_id')
+        .annotate(subtotal=Sum(_SUBTOTAL_ITEM))
+        .values_list('pedido_id', 'subtotal')
+    )
+    return {pedido_id: dinheiro(subtotal or 0) for pedido_id, subtotal in subtotais}
+
+
+def recalcular_totais(pedidos, tamanho_lote=500):
+    """
+    Recalcula `valor_total` (itens + frete gravado - desconto) de vários
+    pedidos: por lote, um SELECT agregado e um UPDATE com CASE.
+    A soma final é feita em Decimal no Python, já que o SQLite faria a
+    aritmética em ponto flutuante. Retorna quantos pedidos foram atualizados.
+    """
+    atualizados = 0
+    linhas = list(pedidos.values_list('id', 'valor_frete', 'desconto_cupom'))
+    for inicio in range(0, len(linhas), tamanho_lote):
+        lote = linhas[inicio:inicio + tamanho_lote]
+        subtotais = subtotais_pedidos([pedido_id for pedido_id, _, _ in lote])
+        totais = {
+            pedido_id: max(subtotais.get(pedido_id, ZERO) + dinheiro(frete) - dinheiro(desconto), ZERO)
+            for pedido_id, frete, desconto in lote
+        }
+        with transaction.atomic():
+            atualizados += Pedido.objects.filter(pk__in=totais).update(valor_total=Case(
+                *[When(pk=pedido_id, then=Value(total)) for pedido_id, total in totais.items()],
+                default=F('valor_total'),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2)
+            ))
+    return atualizados
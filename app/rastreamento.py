@@ -0,0 +1,268 @@
+import atexit
+import contextvars
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+
+# ===============================
+# RASTROS E SPANS
+# ===============================
+class Rastro:
+    """Uma requisição amostrada: spans com início relativo e duração em ms"""
+    __slots__ = ('trace_id', 'inicio', 'inicio_perf', 'spans', 'descartados', '_ids', 'limite')
+
+    def __init__(self, limite=500):
+        self.trace_id = uuid.uuid4().hex
+        self.inicio = time.time()
+        self.inicio_perf = time.perf_counter()
+        self.spans = []
+        self.descartados = 0
+        self._ids = itertools.count(1)
+        self.limite = limite
+
+    def novo_id(self):
+        return next(self._ids)
+
+    def adicionar(self, span_id, pai, nome, tipo, inicio, fim, atributos=None):
+        if len(self.spans) >= self.limite:
+            self.descartados += 1
+            return
+        span = {
+            'id': span_id,
+            'pai': pai,
+            'nome': nome,
+            'tipo': tipo,
+            'inicio_ms': round((inicio - self.inicio_perf) * 1000, 3),
+            'duracao_ms': round((fim - inicio) * 1000, 3),
+        }
+        if atributos:
+            span['atributos'] = atributos
+        self.spans.append(span)
+
+
+# Acompanham o sync_to_async: spans das partes síncronas de views
+# assíncronas caem no rastro da requisição certa
+_rastro_atual = contextvars.ContextVar('rastro_atual', default=None)
+_span_atual = contextvars.ContextVar('span_atual', default=0)
+
+
+@contextmanager
+def rastrear(nome, tipo='interno', **atributos):
+    """
+    Span em volta de um bloco. Fora de uma requisição amostrada não faz
+    nada. O dicionário devolvido aceita atributos extras (ex.: status).
+    """
+    rastro = _rastro_atual.get()
+    if rastro is None:
+        yield atributos
+        return
+    span_id = rastro.novo_id()
+    pai = _span_atual.get()
+    marca = _span_atual.set(span_id)
+    inicio = time.perf_counter()
+    try:
+        yield atributos
+    except Exception as e:
+        atributos['erro'] = type(e).__name__
+        raise
+    finally:
+        _span_atual.reset(marca)
+        rastro.adicionar(span_id, pai, nome, tipo, inicio, time.perf_counter(), atributos)
+
+
+RE_TABELA_SQL = re.compile(r'\b(?:FROM|INTO)\s+"?(\w+)', re.IGNORECASE)
+RE_TABELA_UPDATE = re.compile(r'^\s*UPDATE\s+"?(\w+)', re.IGNORECASE)
+
+
+def nome_sql(sql):
+    """'SELECT app_produto', 'UPDATE app_pedido', 'BEGIN'..."""
+    comando = sql.lstrip()[:10].split(None, 1)[0].upper() if sql.strip() else 'SQL'
+    tabela = (RE_TABELA_UPDATE if comando == 'UPDATE' else RE_TABELA_SQL).search(sql)
+    return f'{comando} {tabela.group(1)}' if tabela else comando
+
+
+def rastrear_sql(execute, sql, params, many, context):
+    """execute_wrapper instalado em toda conexão nova (connection_created)"""
+    rastro = _rastro_atual.get()
+    if rastro is None:
+        return execute(sql, params, many, context)
+    span_id = rastro.novo_id()
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        # Só o texto da consulta, sem os parâmetros (dados de clientes)
+        rastro.adicionar(
+            span_id, _span_atual.get(), nome_sql(sql), 'sql', inicio, time.perf_counter(),
+            {'sql': sql[:500], 'banco': context['connection'].alias}
+        )
+
+
+def instrumentar_conexao(sender, connection, **kwargs):
+    if rastrear_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(rastrear_sql)
+
+
+def instalar():
+    """Chamado no AppConfig.ready, antes de qualquer conexão ser aberta"""
+    if getattr(settings, 'RASTREAMENTO_ATIVO', False):
+        connection_created.connect(instrumentar_conexao, dispatch_uid='rastreamento_sql')
+
+
+# ===============================
+# EXPORTAÇÃO EM JSONL (FORA DO CAMINHO DA REQUISIÇÃO)
+# ===============================
+class ExportadorJsonl:
+    """
+    A requisição só enfileira o rastro; uma thread serializa e grava em
+    lotes. Com a fila cheia (disco lento), o rastro é descartado em vez de
+    atrasar a resposta. O arquivo é rotacionado em `tamanho_maximo` bytes.
+    """
+
+    def __init__(self, caminho, tamanho_fila=1000, tamanho_maximo=50 * 1024 * 1024):
+        self.caminho = Path(caminho)
+        self.tamanho_maximo = tamanho_maximo
+        self.descartados = 0
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def exportar(self, registro):
+        if self._thread is None:
+            self._iniciar()
+        try:
+            self._fila.put_nowait(registro)
+        except queue.Full:
+            self.descartados += 1
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._gravar, name='exportador-rastros', daemon=True)
+                self._thread.start()
+                atexit.register(self.encerrar)
+
+    def _gravar(self):
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            lote = [self._fila.get()]
+            while len(lote) < 100:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            fim = None in lote
+            linhas = [json.dumps(registro, ensure_ascii=False, default=str) for registro in lote if registro is not None]
+            try:
+                self._rotacionar()
+                with open(self.caminho, 'a', encoding='utf-8') as arquivo:
+                    arquivo.write(''.join(linha + '\n' for linha in linhas))
+            except OSError as e:
+                logger.warning(f"Falha ao gravar rastros em {self.caminho}: {e}")
+            if fim:
+                return
+
+    def _rotacionar(self):
+        try:
+            if self.caminho.stat().st_size >= self.tamanho_maximo:
+                os.replace(self.caminho, self.caminho.with_name(self.caminho.name + '.1'))
+        except FileNotFoundError:
+            pass
+
+    def encerrar(self, espera=2.0):
+        """Grava o que estiver na fila (chamado na saída do processo)"""
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._fila.put(None, timeout=espera)
+            except queue.Full:
+                return
+            self._thread.join(espera)
+
+
+exportador_rastros = ExportadorJsonl(
+    getattr(settings, 'RASTREAMENTO_ARQUIVO', Path(settings.BASE_DIR) / 'rastros' / 'rastros.jsonl'),
+    tamanho_maximo=getattr(settings, 'RASTREAMENTO_TAMANHO_MAXIMO_MB', 50) * 1024 * 1024
+)
+
+
+# ===============================
+# MIDDLEWARE (AMOSTRAGEM NA ENTRADA)
+# ===============================
+class RastreamentoMiddleware:
+    """
+    Decide na chegada da requisição se ela será rastreada
+    (RASTREAMENTO_AMOSTRAGEM); as não amostradas só pagam um random().
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'RASTREAMENTO_ATIVO', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.taxa = getattr(settings, 'RASTREAMENTO_AMOSTRAGEM', 0.01)
+        self.limite_spans = getattr(settings, 'RASTREAMENTO_SPANS_POR_RASTRO', 500)
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        if random.random() >= self.taxa:
+            return self.get_response(request)
+        rastro = Rastro(self.limite_spans)
+        marca = _rastro_atual.set(rastro)
+        try:
+            response = self.get_response(request)
+        finally:
+            _rastro_atual.reset(marca)
+        self._finalizar(request, response, rastro)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= self.taxa:
+            return await self.get_response(request)
+        rastro = Rastro(self.limite_spans)
+        marca = _rastro_atual.set(rastro)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _rastro_atual.reset(marca)
+        self._finalizar(request, response, rastro)
+        return response
+
+    def _finalizar(self, request, response, rastro):
+        fim = time.perf_counter()
+        resolver = getattr(request, 'resolver_match', None)
+        rota = (resolver.view_name if resolver else None) or 'nao_encontrada'
+        rastro.limite += 1  # o span raiz sempre entra
+        rastro.adicionar(0, None, f'{request.method} {rota}', 'requisicao', rastro.inicio_perf, fim)
+        exportador_rastros.exportar({
+            'trace_id': rastro.trace_id,
+            'inicio': rastro.inicio,
+            'rota': rota,
+            'metodo': request.method,
+            'caminho': request.path,
+            'status': response.status_code,
+            'duracao_ms': round((fim - rastro.inicio_perf) * 1000, 3),
+            'spans': rastro.spans,
+            'spans_descartados': rastro.descartados,
+        })
@@ -0,0 +1,133 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cupons import remover_usos
+from .models import Produto, Pedido, ItemPedido, CupomUso
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# RESERVA TEMPORÁRIA DE ESTOQUE
+# ===============================
+STATUS_COM_RESERVA = ['pendente', 'processando']
+
+
+class EstoqueInsuficiente(Exception):
+    def __init__(self, produtos_ids):
+        self.produtos_ids = produtos_ids
+        super().__init__(f"Estoque insuficiente para os produtos {produtos_ids}")
+
+
+def criar_reserva(pedido, quantidades=None):
+    """
+    Segura o estoque de todos os itens do pedido até o prazo configurado.
+    Deve ser chamada dentro da transação que cria o pedido; o checkout
+    passa `quantidades` ({produto_id: n}) para não reler os itens.
+    """
+    reservas = pedido.reservar_estoque_itens(tudo_ou_nada=True, quantidades=quantidades)
+    if not all(reservas.values()):
+        raise EstoqueInsuficiente([pid for pid, ok in reservas.items() if not ok])
+
+    minutos = getattr(settings, 'RESERVA_ESTOQUE_MINUTOS', 30)
+    pedido.estoque_reservado = True
+    pedido.reserva_expira_em = timezone.now() + timedelta(minutes=minutos)
+    pedido.save(update_fields=['estoque_reservado', 'reserva_expira_em'])
+
+
+def confirmar_reserva(pedido):
+    """
+    Pagamento aprovado: a reserva vira baixa definitiva.
+    Se a reserva já expirou (e foi liberada), tenta baixar o estoque de novo.
+    Retorna a lista de produtos que ficaram sem estoque.
+    """
+    convertida = Pedido.objects.filter(pk=pedido.pk, estoque_reservado=True).update(reserva_expira_em=None)
+    if convertida:
+        pedido.estoque_reservado = True
+        pedido.reserva_expira_em = None
+        return []
+
+    reservas = pedido.reservar_estoque_itens(tudo_ou_nada=False)
+    Pedido.objects.filter(pk=pedido.pk).update(estoque_reservado=True, reserva_expira_em=None)
+    pedido.estoque_reservado = True
+    pedido.reserva_expira_em = None
+    return [pid for pid, ok in reservas.items() if not ok]
+
+
+def liberar_reserva(pedido):
+    """Devolve o estoque segurado pelo pedido (no máximo uma vez)"""
+    liberou = Pedido.objects.filter(pk=pedido.pk, estoque_reservado=True).update(
+        estoque_reservado=False, reserva_expira_em=None
+    )
+    pedido.estoque_reservado = False
+    pedido.reserva_expira_em = None
+    if liberou:
+        pedido.liberar_estoque_itens()
+    return bool(liberou)
+
+
+# ===============================
+# VARREDURA DE RESERVAS EXPIRADAS
+# ===============================
+def _cancelar_lote(ids):
+    """Cancela um lote de pedidos e devolve o estoque com um único UPDATE"""
+    quantidades = dict(
+        ItemPedido.objects.filter(pedido_id__in=ids)
+        .values('produto_id')
+        .annotate(total=Sum('quantidade'))
+        .values_list('produto_id', 'total')
+    )
+    Produto.objects.liberar_estoque(quantidades)
+    remover_usos(CupomUso.objects.filter(pedido_id__in=ids))
+
+
+def liberar_reservas_expiradas(tamanho_lote=500, agora=None):
+    """
+    Cancela, em lotes, pedidos pendentes cuja reserva expirou e devolve o
+    estoque. Também cancela pedidos pendentes antigos sem reserva.
+    Retorna (pedidos_com_reserva, pedidos_sem_reserva).
+    """
+    agora = agora or timezone.now()
+    horas = getattr(settings, 'PEDIDO_PENDENTE_EXPIRA_HORAS', 24)
+
+    com_reserva = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Pedido.objects.select_for_update()
+                .filter(status__in=STATUS_COM_RESERVA, estoque_reservado=True, reserva_expira_em__lt=agora)
+                .values_list('id', flat=True)[:tamanho_lote]
+            )
+            if not ids:
+                break
+            # Os ids lidos acima são o lote: a transação é IMMEDIATE, então
+            # nenhum webhook altera esses pedidos entre o SELECT e o UPDATE,
+            # e o cancelamento e a devolução usam os mesmos ids, sem reler
+            # por status/horário (que pegaria pedidos de outro escritor).
+            Pedido.objects.filter(pk__in=ids).update(
+                status='cancelado', estoque_reservado=False, reserva_expira_em=None, atualizado_em=agora
+            )
+            _cancelar_lote(ids)
+        com_reserva += len(ids)
+
+    sem_reserva = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Pedido.objects.filter(
+                    status='pendente', estoque_reservado=False, criado_em__lt=agora - timedelta(hours=horas)
+                ).values_list('id', flat=True)[:tamanho_lote]
+            )
+            if not ids:
+                break
+            Pedido.objects.filter(pk__in=ids).update(status='cancelado', atualizado_em=agora)
+            remover_usos(CupomUso.objects.filter(pedido_id__in=ids))
+        sem_reserva += len(ids)
+
+    if com_reserva or sem_reserva:
+        logger.info(f"Reservas expiradas: {com_reserva} pedido(s) liberado(s), {sem_reserva} pendente(s) antigo(s) cancelado(s)")
+    return com_reserva, sem_reserva
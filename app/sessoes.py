@@ -0,0 +1,138 @@
+import logging
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db, db
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+# ===============================
+# SESSÕES COM POUCAS ESCRITAS
+# ===============================
+def limpar_sessoes_expiradas(tamanho_lote=None):
+    """
+    Apaga sessões vencidas em lotes (um DELETE curto por lote, sem segurar
+    o lock de escrita do SQLite durante a limpeza inteira). Retorna o total.
+    """
+    tamanho_lote = tamanho_lote or getattr(settings, 'SESSAO_LIMPEZA_LOTE', 1000)
+    modelo = SessionStore.get_model_class()
+    total = 0
+    while True:
+        lote = modelo.objects.filter(expire_date__lt=timezone.now()).values('pk')[:tamanho_lote]
+        apagadas, _ = modelo.objects.filter(pk__in=lote).delete()
+        total += apagadas
+        if apagadas < tamanho_lote:
+            return total
+
+
+class SessionStore(cached_db.SessionStore):
+    """
+    Sessão no banco com leitura pelo cache (SESSION_CACHE_ALIAS).
+
+    Com SESSION_SAVE_EVERY_REQUEST = False, o SessionMiddleware só grava
+    (e só reenvia o Set-Cookie) quando a sessão muda. A expiração continua
+    deslizando: ao carregar uma sessão com menos de
+    SESSAO_FRACAO_RENOVACAO da validade restante, ela é marcada como
+    modificada e o middleware a regrava uma vez, com cookie novo. Assim há
+    no máximo uma escrita por meia vida da sessão em vez de uma por página.
+
+    Com um cache por processo (LocMemCache), o logout ou a rotação da
+    chave feitos em um worker não chegam ao cache dos outros: lá a sessão
+    antiga continua valendo por até SESSAO_CACHE_LOCAL_SEGUNDOS, quando a
+    entrada vence e a sessão é relida do banco. Com um cache compartilhado
+    vale SESSAO_CACHE_SEGUNDOS.
+    """
+    cache_key_prefix = 'app.sessoes'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._expira_gravada = None
+
+    def _timeout_cache(self, expira):
+        restante = int((expira - timezone.now()).total_seconds())
+        if isinstance(self._cache, LocMemCache):
+            limite = getattr(settings, 'SESSAO_CACHE_LOCAL_SEGUNDOS', 5)
+        else:
+            limite = getattr(settings, 'SESSAO_CACHE_SEGUNDOS', 60)
+        return max(1, min(restante, limite))
+
+    def _guardar_no_cache(self, dados, expira):
+        try:
+            self._cache.set(self.cache_key, (dados, expira), self._timeout_cache(expira))
+        except Exception:
+            logger.exception(f"Falha ao gravar sessão no cache ({self._cache})")
+
+    async def _aguardar_no_cache(self, dados, expira):
+        try:
+            await self._cache.aset(await self.acache_key(), (dados, expira), self._timeout_cache(expira))
+        except Exception:
+            logger.exception(f"Falha ao gravar sessão no cache ({self._cache})")
+
+    def load(self):
+        try:
+            entrada = self._cache.get(self.cache_key)
+        except Exception:
+            entrada = None
+        if entrada is None:
+            s = self._get_session_from_db()
+            if not s:
+                return {}
+            entrada = (self.decode(s.session_data), s.expire_date)
+            self._guardar_no_cache(*entrada)
+        dados, self._expira_gravada = entrada
+        self._marcar_renovacao(dados)
+        return dados
+
+    async def aload(self):
+        try:
+            entrada = await self._cache.aget(await self.acache_key())
+        except Exception:
+            entrada = None
+        if entrada is None:
+            s = await self._aget_session_from_db()
+            if not s:
+                return {}
+            entrada = (self.decode(s.session_data), s.expire_date)
+            await self._aguardar_no_cache(*entrada)
+        dados, self._expira_gravada = entrada
+        self._marcar_renovacao(dados)
+        return dados
+
+    def _marcar_renovacao(self, dados):
+        """Validade gravada passou da fração de renovação: o middleware regrava a sessão"""
+        if '_session_expiry' in dados:
+            return  # validade própria (set_expiry): não desliza
+        restante = (self._expira_gravada - timezone.now()).total_seconds()
+        if restante <= settings.SESSION_COOKIE_AGE * getattr(settings, 'SESSAO_FRACAO_RENOVACAO', 0.5):
+            self.modified = True
+
+    def _renovacao_dispensavel(self, idade):
+        """Dados iguais aos gravados e validade ainda longe do fim"""
+        if self.modified or self.session_key is None or self._expira_gravada is None:
+            return False
+        restante = (self._expira_gravada - timezone.now()).total_seconds()
+        return restante > idade * getattr(settings, 'SESSAO_FRACAO_RENOVACAO', 0.5)
+
+    def save(self, must_create=False):
+        if not must_create and self.session_key is not None:
+            self._get_session()  # carrega (cache ou banco) e conhece a validade gravada
+            if self._renovacao_dispensavel(self.get_expiry_age()):
+                return
+        db.SessionStore.save(self, must_create)
+        self._expira_gravada = self.get_expiry_date()
+        self._guardar_no_cache(self._session, self._expira_gravada)
+
+    async def asave(self, must_create=False):
+        if not must_create and self.session_key is not None:
+            await self._aget_session()
+            if self._renovacao_dispensavel(await self.aget_expiry_age()):
+                return
+        await db.SessionStore.asave(self, must_create)
+        self._expira_gravada = await self.aget_expiry_date()
+        await self._aguardar_no_cache(self._session, self._expira_gravada)
+
+    @classmethod
+    def clear_expired(cls):
+        limpar_sessoes_expiradas()
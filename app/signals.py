@@ -1,8 +1,14 @@
 from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
 from allauth.socialaccount.signals import pre_social_login
 from allauth.account.signals import user_logged_in
 from django.contrib.auth import login
 from django.shortcuts import redirect
+from .models import Produto, Cupom, Pedido
+from . import busca
+from .sugestoes import indice_sugestoes
+from .cupons import validador_cupons
+from .historico import resumo_pedidos
 
 @receiver(pre_social_login)
 def social_login_auto_connect(sender, request, sociallogin, **kwargs):
@@ -25,4 +31,52 @@ def social_login_auto_connect(sender, request, sociallogin, **kwargs):
             perform_login(request, existing_user, email_verification='none')
         except User.DoesNotExist:
             # Novo usuário, prossegue normalmente
-            pass
\ No newline at end of file
+            pass
+
+
+# ===============================
+# ÍNDICE DE BUSCA (FTS5)
+# ===============================
+@receiver(post_save, sender=Produto)
+def indexar_produto_busca(sender, instance, update_fields=None, **kwargs):
+    # Saves parciais que não tocam nome/descrição (ex.: estoque) não reindexam
+    if update_fields and not {'nome', 'descricao'} & set(update_fields):
+        return
+    busca.indexar_produto(instance)
+
+
+@receiver(post_delete, sender=Produto)
+def remover_produto_busca(sender, instance, **kwargs):
+    busca.remover_produto(instance.pk)
+
+
+# ===============================
+# ÍNDICE DE SUGESTÕES (AUTOCOMPLETE)
+# ===============================
+@receiver(post_save, sender=Produto)
+def atualizar_sugestoes(sender, instance, **kwargs):
+    indice_sugestoes.atualizar(instance)
+
+
+@receiver(post_delete, sender=Produto)
+def remover_sugestao(sender, instance, **kwargs):
+    indice_sugestoes.remover(instance.pk)
+
+
+# ===============================
+# CACHE DE CUPONS
+# ===============================
+@receiver(post_save, sender=Cupom)
+@receiver(post_delete, sender=Cupom)
+def invalidar_cache_cupons(sender, **kwargs):
+    validador_cupons.invalidar()
+
+
+# ===============================
+# RESUMO DO HISTÓRICO DE PEDIDOS
+# ===============================
+@receiver(post_save, sender=Pedido)
+@receiver(post_delete, sender=Pedido)
+def invalidar_resumo_pedidos(sender, instance, **kwargs):
+    if instance.usuario_id:
+        resumo_pedidos.invalidar(instance.usuario_id)
@@ -0,0 +1,196 @@
+import bisect
+import re
+import threading
+import time
+import unicodedata
+
+
+# ===============================
+# ÍNDICE DE PREFIXOS PARA AUTOCOMPLETE
+# ===============================
+def normalizar(texto):
+    """Minúsculas e sem acentos: 'Água' -> 'agua'"""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def payload_sugestao(produto):
+    """Dicionário pronto para serializar no /api/buscar-sugestoes/"""
+    return {
+        'id': produto.id,
+        'nome': produto.nome,
+        'preco': str(produto.preco),
+        'imagem': produto.imagem.url if produto.imagem else '',
+        'estoque': produto.estoque,
+        'tem_desconto': produto.tem_desconto(),
+        'preco_original': str(produto.preco_original) if produto.preco_original else None
+    }
+
+
+def palavras(texto):
+    return re.findall(r'\w+', normalizar(texto))
+
+
+def elegivel(produto):
+    return produto.disponivel and produto.estoque > 0
+
+
+class IndicePrefixos:
+    """
+    Índice em memória (por processo) dos nomes de produtos em estoque.
+
+    Cada palavra do nome normalizado vira uma chave em uma lista ordenada;
+    a busca por prefixo é um par de bisects, sem nenhuma consulta SQL.
+    As atualizações trocam o estado inteiro de uma vez (copy-on-write),
+    então as leituras não precisam de lock.
+
+    Os signals de Produto enfileiram o produto salvo ou removido; as
+    reservas e devoluções de estoque (UPDATE, sem signals) marcam os
+    produtos afetados, relidos em uma consulta. A fila é aplicada em lote
+    na busca seguinte: uma única cópia do estado, qualquer que seja o
+    número de produtos alterados. A reconstrução periódica (`ttl`) cobre
+    os outros workers e os UPDATEs em massa do admin; só um thread
+    reconstrói, os demais continuam servindo o estado anterior.
+    """
+
+    CAMPOS = ['id', 'nome', 'preco', 'preco_original', 'estoque', 'imagem', 'disponivel']
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._reconstrucao = threading.Lock()
+        self._estado = None
+        self._carregado_em = 0
+        self._alterados = set()
+        self._pendentes = {}
+
+    # ---------- construção ----------
+    @staticmethod
+    def _entradas(produto):
+        return [(palavra, produto.id) for palavra in set(palavras(produto.nome))]
+
+    def _montar(self, produtos):
+        chaves, nomes, payloads = [], {}, {}
+        for produto in produtos:
+            chaves.extend(self._entradas(produto))
+            nomes[produto.id] = palavras(produto.nome)
+            payloads[produto.id] = payload_sugestao(produto)
+        chaves.sort()
+        return chaves, nomes, payloads
+
+    def reconstruir(self):
+        with self._reconstrucao:
+            self._reconstruir()
+
+    def _reconstruir(self):
+        from .models import Produto
+        # O que estava na fila já sai da consulta abaixo; o que chegar
+        # durante a reconstrução fica para a busca seguinte.
+        with self._lock:
+            self._alterados, self._pendentes = set(), {}
+        produtos = Produto.objects.filter(disponivel=True, estoque__gt=0).only(*self.CAMPOS)
+        estado = self._montar(produtos.iterator())
+        with self._lock:
+            self._estado = estado
+            self._carregado_em = time.monotonic()
+
+    def invalidar(self):
+        """Força reconstrução na próxima busca"""
+        with self._lock:
+            self._estado = None
+            self._alterados, self._pendentes = set(), {}
+
+    def _obter_estado(self):
+        if self._estado is None:
+            # Nada para servir: espera quem já estiver reconstruindo
+            with self._reconstrucao:
+                if self._estado is None:
+                    self._reconstruir()
+        elif time.monotonic() - self._carregado_em > self.ttl:
+            if self._reconstrucao.acquire(blocking=False):
+                try:
+                    if time.monotonic() - self._carregado_em > self.ttl:
+                        self._reconstruir()
+                finally:
+                    self._reconstrucao.release()
+        elif (self._alterados or self._pendentes) and not self._reconstrucao.locked():
+            self._aplicar_pendentes()
+        return self._estado
+
+    # ---------- atualização incremental ----------
+    def marcar_alterados(self, produto_ids):
+        """Estoque mudou por UPDATE (sem signal): relê esses produtos na próxima busca"""
+        with self._lock:
+            if self._estado is not None:
+                self._alterados.update(produto_ids)
+
+    def atualizar(self, produto):
+        with self._lock:
+            if self._estado is not None:
+                self._pendentes[produto.id] = produto
+
+    def remover(self, produto_id):
+        with self._lock:
+            if self._estado is not None:
+                self._pendentes[produto_id] = None
+
+    def _aplicar_pendentes(self):
+        from .models import Produto
+        with self._lock:
+            ids, self._alterados = self._alterados, set()
+            pendentes, self._pendentes = self._pendentes, {}
+        if ids:
+            # A releitura vem do banco já comitado: vale mais que a instância do signal
+            relidos = {produto.id: produto for produto in Produto.objects.filter(pk__in=ids).only(*self.CAMPOS)}
+            pendentes.update({produto_id: relidos.get(produto_id) for produto_id in ids})
+        if not pendentes:
+            return
+
+        with self._lock:
+            if self._estado is None:
+                return
+            chaves, nomes, payloads = self._estado
+            chaves = [c for c in chaves if c[1] not in pendentes]
+            nomes = dict(nomes)
+            payloads = dict(payloads)
+            for produto_id in pendentes:
+                nomes.pop(produto_id, None)
+                payloads.pop(produto_id, None)
+            novas = []
+            for produto in pendentes.values():
+                if produto is not None and elegivel(produto):
+                    novas.extend(self._entradas(produto))
+                    nomes[produto.id] = palavras(produto.nome)
+                    payloads[produto.id] = payload_sugestao(produto)
+            if novas:
+                # Lista já ordenada + um trecho novo: o timsort junta em O(n)
+                chaves.extend(novas)
+                chaves.sort()
+            self._estado = (chaves, nomes, payloads)
+
+    # ---------- consulta ----------
+    def buscar(self, termo, limite=8):
+        termos = palavras(termo)
+        if not termos:
+            return []
+        chaves, nomes, payloads = self._obter_estado()
+
+        primeira, demais = termos[0], termos[1:]
+        inicio = bisect.bisect_left(chaves, (primeira,))
+        fim = bisect.bisect_left(chaves, (primeira + '\uffff',))
+
+        resultados, vistos = [], set()
+        for posicao in range(inicio, fim):
+            produto_id = chaves[posicao][1]
+            if produto_id in vistos:
+                continue
+            vistos.add(produto_id)
+            palavras_nome = nomes[produto_id]
+            if all(any(p.startswith(d) for p in palavras_nome) for d in demais):
+                resultados.append(payloads[produto_id])
+                if len(resultados) >= limite:
+                    break
+        return resultados
+
+
+indice_sugestoes = IndicePrefixos()
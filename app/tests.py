@@ -0,0 +1,203 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .gateway import ClienteMercadoPago
+from .gateway_stub import ServidorStubMercadoPago
+from .models import ItemPedido, PagamentoProcessado, Pedido, Produto
+from .pagamentos import processar_notificacao_pagamento, registro_pagamentos
+from .reservas import liberar_reservas_expiradas
+
+
+# ===============================
+# CHECKOUT: CONSULTAS POR TAMANHO DE CARRINHO
+# ===============================
+class CheckoutConsultasTest(TestCase):
+    """
+    O checkout não pode voltar a fazer uma consulta por item: o número de
+    consultas de criar_preferencia_pagamento é fixo (o bulk_create só ganha
+    um INSERT a cada lote de itens do SQLite). O Mercado Pago é o servidor
+    falso de gateway_stub.
+    """
+
+    DADOS_ENTREGA = {
+        'nome': 'Cliente Teste', 'email': 'cliente@teste.com', 'cep': '01001-000',
+        'endereco': 'Praça da Sé', 'bairro': 'Sé', 'cidade': 'São Paulo', 'estado': 'SP',
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor = ServidorStubMercadoPago()
+        cls.cliente_mp = ClienteMercadoPago('token-teste', base_url=cls.servidor.iniciar_em_thread())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        cls.cliente_mp.sessao.close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.produtos = Produto.objects.bulk_create([
+            Produto(nome=f'Produto {i}', preco=Decimal('10.00'), estoque=50) for i in range(300)
+        ])
+
+    def setUp(self):
+        patcher = mock.patch('app.views.get_cliente_mp', return_value=self.cliente_mp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _checkout(self, quantidade_itens, consultas):
+        itens = [
+            {'id': produto.id, 'quantidade': 2, 'preco': '10.00'}
+            for produto in self.produtos[:quantidade_itens]
+        ]
+        corpo = json.dumps({'itens': itens, 'dados_entrega': self.DADOS_ENTREGA})
+        with self.assertNumQueries(consultas):
+            resposta = self.client.post(reverse('criar_preferencia_pagamento'), corpo, content_type='application/json')
+
+        self.assertEqual(resposta.status_code, 200, resposta.content)
+        pedido = Pedido.objects.get(pk=resposta.json()['pedido_id'])
+        self.assertTrue(pedido.preference_id)
+        self.assertTrue(pedido.estoque_reservado)
+        self.assertEqual(ItemPedido.objects.filter(pedido=pedido).count(), quantidade_itens)
+        estoques = Produto.objects.filter(pk__in=[item['id'] for item in itens]).values_list('estoque', flat=True)
+        self.assertEqual(set(estoques), {48})
+
+    def test_carrinho_com_3_itens(self):
+        self._checkout(3, 10)
+
+    def test_carrinho_com_300_itens(self):
+        self._checkout(300, 11)
+
+    def test_sem_token_nao_grava_pedido(self):
+        itens = [{'id': self.produtos[0].id, 'quantidade': 1, 'preco': '10.00'}]
+        corpo = json.dumps({'itens': itens, 'dados_entrega': self.DADOS_ENTREGA})
+        with mock.patch('app.views.get_cliente_mp', side_effect=ValueError('sem token')):
+            resposta = self.client.post(reverse('criar_preferencia_pagamento'), corpo, content_type='application/json')
+
+        self.assertEqual(resposta.status_code, 503)
+        self.assertFalse(Pedido.objects.exists())
+        self.produtos[0].refresh_from_db()
+        self.assertEqual(self.produtos[0].estoque, 50)
+
+    def test_item_que_nao_e_objeto(self):
+        corpo = json.dumps({'itens': [[1]], 'dados_entrega': self.DADOS_ENTREGA})
+        resposta = self.client.post(reverse('criar_preferencia_pagamento'), corpo, content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['error'], 'Dados inválidos no item')
+
+        resposta = self.client.post(reverse('api_cotacao'), json.dumps({'itens': [1]}), content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_chave_de_idempotencia_com_outro_corpo(self):
+        url = reverse('criar_preferencia_pagamento')
+        itens = [{'id': self.produtos[0].id, 'quantidade': 1, 'preco': '10.00'}]
+        corpo = json.dumps({'itens': itens, 'dados_entrega': self.DADOS_ENTREGA})
+
+        primeira = self.client.post(url, corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='chave-1')
+        repetida = self.client.post(url, corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='chave-1')
+        self.assertEqual(repetida.json()['pedido_id'], primeira.json()['pedido_id'])
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+
+        itens[0]['quantidade'] = 3
+        outra = json.dumps({'itens': itens, 'dados_entrega': self.DADOS_ENTREGA})
+        resposta = self.client.post(url, outra, content_type='application/json', HTTP_IDEMPOTENCY_KEY='chave-1')
+        self.assertEqual(resposta.status_code, 422)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+
+# ===============================
+# STATUS DO PEDIDO (SSE)
+# ===============================
+class EventosStatusPedidoTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', 'cliente@teste.com', 'senha-teste-123')
+        cls.pedido = Pedido.objects.create(usuario=cls.usuario, status='entregue', valor_total=Decimal('10.00'))
+
+    def test_wsgi_responde_204_sem_segurar_o_worker(self):
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('eventos_status_pedido', args=[self.pedido.id]))
+        self.assertEqual(resposta.status_code, 204)
+
+    async def test_asgi_transmite_o_status(self):
+        await self.async_client.aforce_login(self.usuario)
+        resposta = await self.async_client.get(reverse('eventos_status_pedido', args=[self.pedido.id]))
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        corpo = b''.join([parte async for parte in resposta.streaming_content])
+        self.assertIn(b'"status": "entregue"', corpo)
+
+
+# ===============================
+# NOTIFICAÇÕES DE PAGAMENTO
+# ===============================
+class NotificacaoPagamentoTest(TestCase):
+    """
+    O mesmo pagamento passa por vários status (aprovado, depois estornado):
+    cada par (pagamento, status) é aplicado uma única vez.
+    """
+
+    def setUp(self):
+        registro_pagamentos.limpar()
+        self.pedido = Pedido.objects.create(status='processando', valor_total=Decimal('10.00'))
+        self.status_gateway = 'approved'
+        cliente_mp = mock.Mock()
+        cliente_mp.obter_pagamento.side_effect = lambda payment_id: {
+            'status': 200,
+            'response': {'external_reference': str(self.pedido.id), 'status': self.status_gateway},
+        }
+        patcher = mock.patch('app.pagamentos.get_cliente_mp', return_value=cliente_mp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_estorno_depois_da_aprovacao(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(processar_notificacao_pagamento('55'))
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.status, 'pago')
+
+        self.assertFalse(processar_notificacao_pagamento('55'))
+
+        self.status_gateway = 'refunded'
+        self.assertTrue(processar_notificacao_pagamento('55'))
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.status, 'reembolsado')
+        self.assertEqual(PagamentoProcessado.objects.filter(payment_id='55').count(), 2)
+
+
+# ===============================
+# VARREDURA DE RESERVAS EXPIRADAS
+# ===============================
+class ReservasExpiradasTest(TestCase):
+    def test_cancela_e_devolve_o_estoque_do_lote(self):
+        agora = timezone.now()
+        produto = Produto.objects.create(nome='Produto', preco=Decimal('10.00'), estoque=0)
+        expirados = []
+        for _ in range(3):
+            pedido = Pedido.objects.create(
+                status='pendente', estoque_reservado=True, reserva_expira_em=agora - timedelta(minutes=1)
+            )
+            ItemPedido.objects.create(pedido=pedido, produto=produto, quantidade=2, preco_unitario=Decimal('10.00'))
+            expirados.append(pedido.pk)
+        vigente = Pedido.objects.create(
+            status='pendente', estoque_reservado=True, reserva_expira_em=agora + timedelta(minutes=1)
+        )
+        ItemPedido.objects.create(pedido=vigente, produto=produto, quantidade=5, preco_unitario=Decimal('10.00'))
+
+        self.assertEqual(liberar_reservas_expiradas(tamanho_lote=2, agora=agora), (3, 0))
+        produto.refresh_from_db()
+        self.assertEqual(produto.estoque, 6)
+        self.assertEqual(
+            set(Pedido.objects.filter(status='cancelado', estoque_reservado=False).values_list('pk', flat=True)),
+            set(expirados),
+        )
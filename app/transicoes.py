@@ -0,0 +1,117 @@
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cupons import registrar_usos, remover_usos
+from .eventos import canal_status
+from .models import CupomUso, ItemPedido, Pedido, Produto
+
+logger = logging.getLogger(__name__)
+
+
+# ===============================
+# TRANSIÇÕES DE STATUS EM MASSA
+# ===============================
+def origens_permitidas(novo_status):
+    """Status a partir dos quais `novo_status` é permitido pelo fluxo do Pedido"""
+    return [origem for origem, destinos in Pedido.FLUXO_STATUS.items() if novo_status in destinos]
+
+
+def _em_lotes(ids, tamanho=900):
+    """Listas de ids abaixo do limite de parâmetros por consulta do SQLite"""
+    for inicio in range(0, len(ids), tamanho):
+        yield ids[inicio:inicio + tamanho]
+
+
+def transicionar_pedidos(pedidos, novo_status, agora=None):
+    """
+    Aplica `novo_status` aos pedidos do queryset que podem recebê-lo
+    (Pedido.FLUXO_STATUS): um UPDATE por status de origem; os demais ficam
+    como estão. Retorna {status_de_origem: pedidos_alterados}.
+
+    No cancelamento, o estoque reservado de todos os pedidos afetados volta
+    com um único UPDATE com CASE em Produto e os usos de cupom são
+    removidos, sem carregar pedido por pedido. Em 'pago', a reserva vira
+    baixa definitiva e os usos de cupom são registrados do mesmo jeito.
+    """
+    agora = agora or timezone.now()
+    selecionados = pedidos.order_by().values('pk')
+    alterados = {}
+    afetados = []
+    with transaction.atomic():
+        # Os ids de cada origem são lidos antes do UPDATE, na mesma transação
+        # (IMMEDIATE: o lock de escrita já está com ela). O resto do
+        # trabalho usa esses ids, nunca uma releitura por status/horário,
+        # que pegaria pedidos de outro escritor com o mesmo atualizado_em.
+        for origem in origens_permitidas(novo_status):
+            ids = list(Pedido.objects.filter(pk__in=selecionados, status=origem).values_list('pk', flat=True))
+            total = 0
+            for lote in _em_lotes(ids):
+                total += Pedido.objects.filter(pk__in=lote, status=origem).update(
+                    status=novo_status, atualizado_em=agora
+                )
+            if total:
+                alterados[origem] = total
+                afetados += ids
+
+        if afetados and novo_status == 'cancelado':
+            _liberar_cancelados(afetados)
+        elif afetados and novo_status == 'pago':
+            _confirmar_pagos(afetados)
+
+        # Avisa as conexões SSE abertas sobre os pedidos alterados
+        for pedido_id in set(canal_status.assinados()).intersection(afetados):
+            canal_status.publicar_apos_commit(pedido_id, novo_status)
+
+    if alterados:
+        logger.info(f"{sum(alterados.values())} pedido(s) -> {novo_status}: {alterados}")
+    return alterados
+
+
+def _liberar_cancelados(ids):
+    """Devolve o estoque e os cupons dos pedidos que acabaram de ser cancelados"""
+    quantidades = Counter()
+    for lote in _em_lotes(ids):
+        com_reserva = list(
+            Pedido.objects.filter(pk__in=lote, estoque_reservado=True).values_list('pk', flat=True)
+        )
+        if com_reserva:
+            quantidades.update(dict(
+                ItemPedido.objects.filter(pedido_id__in=com_reserva)
+                .values('produto_id')
+                .annotate(total=Sum('quantidade'))
+                .values_list('produto_id', 'total')
+            ))
+            Pedido.objects.filter(pk__in=com_reserva).update(estoque_reservado=False, reserva_expira_em=None)
+        remover_usos(CupomUso.objects.filter(pedido_id__in=lote))
+    Produto.objects.liberar_estoque(dict(quantidades))
+
+
+def _confirmar_pagos(ids):
+    """
+    Pagamento confirmado (admin): a reserva vira baixa definitiva e o uso do
+    cupom é registrado, como no webhook aprovado (aplicar_pagamento).
+    """
+    quantidades = Counter()
+    for lote in _em_lotes(ids):
+        Pedido.objects.filter(pk__in=lote, estoque_reservado=True).update(reserva_expira_em=None)
+        # Reserva já expirada (estoque devolvido pela varredura): baixa de novo
+        sem_reserva = list(Pedido.objects.filter(pk__in=lote, estoque_reservado=False).values_list('pk', flat=True))
+        if sem_reserva:
+            quantidades.update(dict(
+                ItemPedido.objects.filter(pedido_id__in=sem_reserva)
+                .values('produto_id')
+                .annotate(total=Sum('quantidade'))
+                .values_list('produto_id', 'total')
+            ))
+            Pedido.objects.filter(pk__in=sem_reserva).update(estoque_reservado=True, reserva_expira_em=None)
+        registrar_usos(lote)
+
+    # Pago mesmo sem estoque: um UPDATE condicional por produto, só para avisar
+    reservas = Produto.objects.reservar_estoque(dict(quantidades), tudo_ou_nada=False)
+    sem_estoque = [produto_id for produto_id, ok in reservas.items() if not ok]
+    if sem_estoque:
+        logger.warning(f"Pedidos pagos sem estoque para os produtos {sem_estoque}")
@@ -34,6 +34,7 @@ urlpatterns = [
     # ===============================
     # APIs - PAGAMENTO
     # ===============================
+    path('api/cotacao/', views.api_cotacao, name='api_cotacao'),
     path('api/criar-preferencia-pagamento/', views.criar_preferencia_pagamento, name='criar_preferencia_pagamento'),
     #path('api/finalizar-compra/', views.finalizar_compra, name='finalizar_compra'),
 
@@ -43,6 +44,10 @@ urlpatterns = [
     path('api/verificar-estoque/', views.verificar_estoque, name='verificar_estoque'),
     path('api/atualizar-estoque-carrinho/', views.atualizar_estoque_carrinho, name='atualizar_estoque_carrinho'),
     path('api/buscar-sugestoes/', views.buscar_sugestoes, name='buscar_sugestoes'),
+    path('api/produto/<int:produto_id>/', views.api_produto, name='api_produto'),
+    path('api/produtos/', views.api_produtos, name='api_produtos'),
+    path('api/cache-cards/', views.estatisticas_cache_cards, name='estatisticas_cache_cards'),
+    path('metrics', views.metricas_prometheus, name='metricas_prometheus'),  # caminho padrão do Prometheus
 
     # ===============================
     # WEBHOOK MERCADO PAGO
@@ -53,6 +58,7 @@ urlpatterns = [
     # APIs - GESTÃO DE PEDIDOS
     # ===============================
     path('api/pedido/<int:pedido_id>/status/', views.obter_status_pedido, name='obter_status_pedido'),
+    path('api/pedido/<int:pedido_id>/eventos/', views.eventos_status_pedido, name='eventos_status_pedido'),
     path('api/pedido/<int:pedido_id>/cancelar/', views.cancelar_pedido_api, name='cancelar_pedido_api'),
     path('api/aplicar-cupom/', views.aplicar_cupom, name='api_aplicar_cupom'),
 ]
\ No newline at end of file
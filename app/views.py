@@ -1,39 +1,45 @@
-import os
+import hmac
 import json
 import logging
-from django.http import JsonResponse, HttpResponse
+from decimal import Decimal
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, Http404, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST, require_GET
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import logout as auth_logout
 from django.db import transaction
 from django.db.models import Q
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.utils import timezone
-from .models import Produto, Pedido, ItemPedido, Cupom, CupomUso
-import mercadopago
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from .models import Produto, Pedido, ItemPedido, CupomUso, NotificacaoWebhook
+from .paginacao import paginar_por_cursor
+from . import busca
+from .sugestoes import indice_sugestoes, payload_sugestao
+from .fragmentos import cache_cards
+from . import catalogo
+from .carrinho import validar_carrinho
+from .gateway import ErroGateway, get_cliente_mp
+from .reservas import EstoqueInsuficiente, criar_reserva, liberar_reserva
+from .cupons import CupomInvalido, validador_cupons, registrar_uso, remover_usos
+from .cotacao import CotacaoInvalida, montar_cotacao, assinar_cotacao, verificar_cotacao
+from . import idempotencia
+from . import historico
+from .eventos import transmitir_status
+from .banco import somente_leitura
+from .metricas import metricas
+from .rastreamento import rastrear
 from dotenv import load_dotenv
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# ===============================
-# CONFIGURAÇÃO MERCADO PAGO
-# ===============================
-def get_mp_access_token():
-    token = os.getenv("MP_ACCESS_TOKEN")
-    if not token:
-        logger.error("MP_ACCESS_TOKEN não encontrado")
-    return token
-
-def get_mp_sdk():
-    token = get_mp_access_token()
-    if not token:
-        raise ValueError("Access Token do Mercado Pago não configurado")
-    return mercadopago.SDK(token)
-
 # ===============================
 # ATALHOS DE LOGIN/LOGOUT
 # ===============================
@@ -52,24 +58,6 @@ def validar_dados_entrega(dados_entrega):
     faltando = [c for c in campos_obrigatorios if not dados_entrega.get(c, '').strip()]
     return faltando
 
-def validar_itens_carrinho(itens_carrinho):
-    if not itens_carrinho:
-        return {'error': 'Carrinho vazio'}
-    for item in itens_carrinho:
-        try:
-            produto_id = item.get('id')
-            quantidade = int(item.get('quantidade', 1))
-            preco = float(item.get('preco', 0))
-            if not produto_id or quantidade <= 0 or preco <= 0:
-                return {'error': 'Dados inválidos no item'}
-            produto = Produto.objects.get(id=produto_id)
-            if not produto.estoque_disponivel(quantidade):
-                return {'error': f'Estoque insuficiente para {produto.nome}'}
-        except Produto.DoesNotExist:
-            return {'error': f'Produto não encontrado: {produto_id}'}
-        except Exception as e:
-            return {'error': str(e)}
-    return {'success': True}
 
 # ===============================
 # API: APLICAR CUPOM (CORRIGIDA - VALIDAÇÃO COMPLETA)
@@ -87,53 +75,23 @@ def aplicar_cupom(request):
         if not itens:
             return JsonResponse({'success': False, 'error': 'Adicione itens ao carrinho primeiro.'}, status=400)
 
-        # Buscar cupom
-        try:
-            cupom = Cupom.objects.get(codigo=codigo, ativo=True)
-        except Cupom.DoesNotExist:
-            return JsonResponse({'success': False, 'error': 'Cupom inválido ou inativo.'}, status=404)
-
-        # CORREÇÃO: Garantir que ambas as datas sejam do mesmo tipo
-        agora = timezone.now().date()
-
-        # Converter datas do cupom para date se necessário
-        data_inicio_cupom = cupom.data_inicio.date() if hasattr(cupom.data_inicio, 'date') else cupom.data_inicio
-        data_fim_cupom = cupom.data_fim.date() if cupom.data_fim and hasattr(cupom.data_fim, 'date') else cupom.data_fim
-
-        if cupom.data_inicio and agora < data_inicio_cupom:
-            return JsonResponse({'success': False, 'error': 'Cupom ainda não está válido.'}, status=400)
-        if cupom.data_fim and agora > data_fim_cupom:
-            return JsonResponse({'success': False, 'error': 'Cupom expirado.'}, status=400)
-
-        # CORREÇÃO: Verificar limite de uso geral
-        if cupom.limite_uso:
-            usos_totais = cupom.usos.count()
-            if usos_totais >= cupom.limite_uso:
-                return JsonResponse({'success': False, 'error': 'Limite de usos do cupom esgotado.'}, status=400)
-
-        # CORREÇÃO: Verificar limite por usuário
-        if cupom.limite_por_usuario and request.user.is_authenticated:
-            usos_usuario = cupom.usos.filter(pedido__usuario=request.user).count()
-            if usos_usuario >= cupom.limite_por_usuario:
-                return JsonResponse({'success': False, 'error': 'Você já usou este cupom o número máximo de vezes permitido.'}, status=400)
-
-        # CORREÇÃO: Converter tudo para float antes dos cálculos
-        subtotal = sum(float(i.get('preco', 0)) * int(i.get('quantidade', 1)) for i in itens)
-        valor_cupom = float(cupom.valor)  # Converter Decimal para float
-        
-        if cupom.tipo == 'percentual':
-            desconto = subtotal * (valor_cupom / 100)
-        else:
-            desconto = min(valor_cupom, subtotal)
+        cotacao, validacao, erro_cupom = montar_cotacao(itens, codigo, request.user)
+        if cotacao is None:
+            return JsonResponse({'success': False, 'error': validacao.erro}, status=400)
+        if erro_cupom:
+            return JsonResponse({'success': False, 'error': erro_cupom.mensagem}, status=erro_cupom.status)
 
+        cupom = validador_cupons.obter(codigo)
         return JsonResponse({
             'success': True,
-            'desconto': round(desconto, 2),
+            'desconto': float(cotacao['desconto']),
             'cupom': {
                 'codigo': cupom.codigo,
                 'tipo': cupom.get_tipo_display(),
-                'valor': valor_cupom  # Já convertido para float
-            }
+                'valor': float(cupom.valor)
+            },
+            'cotacao': cotacao,
+            'token': assinar_cotacao(cotacao),
         })
 
     except Exception as e:
@@ -141,235 +99,316 @@ def aplicar_cupom(request):
         return JsonResponse({'success': False, 'error': 'Erro ao validar cupom.'}, status=500)
 
 # ===============================
-# API: CRIAR PREFERÊNCIA (CUPOM SINCRONIZADO COM REGISTRO DE USO)
+# API: COTAÇÃO ASSINADA (PREÇOS, FRETE E CUPOM CALCULADOS UMA VEZ)
 # ===============================
 @csrf_exempt
 @require_POST
-def criar_preferencia_pagamento(request):
+@somente_leitura
+def api_cotacao(request):
     try:
-        logger.info("=== INICIANDO CRIAÇÃO DE PREFERÊNCIA ===")
-        if not request.body:
-            return JsonResponse({'error': 'Body vazio'}, status=400)
-
         data = json.loads(request.body)
-        itens_carrinho = data.get('itens', [])
-        dados_entrega = data.get('dados_entrega', {})
-
-        if not itens_carrinho:
-            return JsonResponse({'error': 'Carrinho vazio'}, status=400)
-
-        campos_faltando = validar_dados_entrega(dados_entrega)
-        if campos_faltando:
-            return JsonResponse({'error': f'Campos faltando: {", ".join(campos_faltando)}'}, status=400)
-
-        validacao = validar_itens_carrinho(itens_carrinho)
-        if 'error' in validacao:
-            return JsonResponse({'error': validacao['error']}, status=400)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'JSON inválido'}, status=400)
 
-        # CÁLCULO COM CUPOM
-        subtotal = sum(float(i['preco']) * int(i['quantidade']) for i in itens_carrinho)
-        frete = 0 if subtotal >= getattr(settings, 'FRETE_GRATIS_ACIMA_DE', 100) else getattr(settings, 'VALOR_FRETE', 15)
+    cotacao, validacao, erro_cupom = montar_cotacao(
+        data.get('itens', []), (data.get('cupom') or '').strip().upper(), request.user
+    )
+    if cotacao is None:
+        return JsonResponse({
+            'success': False,
+            'error': validacao.erro,
+            'resultados': validacao.como_dict()
+        }, status=400)
 
-        cupom_codigo = dados_entrega.get('cupom', '').strip().upper()
-        cupom = None
-        desconto_cupom = 0
+    return JsonResponse({
+        'success': True,
+        'cotacao': cotacao,
+        'token': assinar_cotacao(cotacao),
+        'erro_cupom': erro_cupom.mensagem if erro_cupom else None,
+    })
 
-        if cupom_codigo:
+# ===============================
+# API: CRIAR PREFERÊNCIA (CUPOM SINCRONIZADO COM REGISTRO DE USO)
+# ===============================
+def _preparar_preferencia(request):
+    """
+    Parte síncrona do checkout: valida, grava o pedido e reserva estoque.
+    Retorna uma JsonResponse de erro ou (pedido, preference_data, resumo).
+    """
+    logger.info("=== INICIANDO CRIAÇÃO DE PREFERÊNCIA ===")
+    if not request.body:
+        return JsonResponse({'error': 'Body vazio'}, status=400)
+
+    data = json.loads(request.body)
+    itens_carrinho = data.get('itens', [])
+    dados_entrega = data.get('dados_entrega', {})
+
+    campos_faltando = validar_dados_entrega(dados_entrega)
+    if campos_faltando:
+        return JsonResponse({'error': f'Campos faltando: {", ".join(campos_faltando)}'}, status=400)
+
+    # Com a cotação assinada, nada é recalculado nem consultado aqui;
+    # sem ela (clientes antigos), a cotação é montada agora.
+    with rastrear('checkout.cotacao'):
+        if data.get('cotacao'):
             try:
-                cupom = Cupom.objects.get(codigo=cupom_codigo, ativo=True)
-                # CORREÇÃO: Garantir que ambas as datas sejam do mesmo tipo
-                agora = timezone.now().date()
-
-                # Converter datas do cupom para date se necessário
-                data_inicio_cupom = cupom.data_inicio.date() if hasattr(cupom.data_inicio, 'date') else cupom.data_inicio
-                data_fim_cupom = cupom.data_fim.date() if cupom.data_fim and hasattr(cupom.data_fim, 'date') else cupom.data_fim
-
-                if (cupom.data_inicio and agora < data_inicio_cupom) or (cupom.data_fim and agora > data_fim_cupom):
-                    cupom = None
-                elif cupom.limite_uso and cupom.usos.count() >= cupom.limite_uso:
-                    cupom = None
-                elif cupom.limite_por_usuario and request.user.is_authenticated:
-                    usos = cupom.usos.filter(pedido__usuario=request.user).count()
-                    if usos >= cupom.limite_por_usuario:
-                        cupom = None
-                if cupom:
-                    # CORREÇÃO: Converter Decimal para float
-                    valor_cupom_float = float(cupom.valor)
-                    if cupom.tipo == 'percentual':
-                        desconto_cupom = subtotal * (valor_cupom_float / 100)
-                    else:
-                        desconto_cupom = min(valor_cupom_float, subtotal)
-                    logger.info(f"Cupom {cupom_codigo} aplicado: desconto de R$ {desconto_cupom:.2f}")
-            except Cupom.DoesNotExist:
-                cupom = None
-                logger.warning(f"Cupom {cupom_codigo} não encontrado")
-
-        total = max(subtotal + frete - desconto_cupom, 0)
-        
-        # LOG PARA DEBUG
-        logger.info(f"Subtotal: R$ {subtotal:.2f}, Frete: R$ {frete:.2f}, Desconto: R$ {desconto_cupom:.2f}, Total: R$ {total:.2f}")
-
-        # ITENS PARA MP
-        items_mp = []
-        for item in itens_carrinho:
-            items_mp.append({
-                "id": str(item['id']),
-                "title": item['nome'][:250],
-                "quantity": int(item['quantidade']),
-                "currency_id": "BRL",
-                "unit_price": float(item['preco'])
-            })
-
-        # ADICIONAR FRETE COMO ITEM SEPARADO
-        if frete > 0:
-            items_mp.append({
-                "id": "frete",
-                "title": "Taxa de Entrega",
-                "quantity": 1,
-                "currency_id": "BRL",
-                "unit_price": float(frete)
-            })
-
-        # CORREÇÃO: ADICIONAR DESCONTO DO CUPOM COMO ITEM NEGATIVO
-        if desconto_cupom > 0:
-            items_mp.append({
-                "id": "desconto_cupom",
-                "title": f"Desconto - {cupom_codigo}",
-                "quantity": 1,
-                "currency_id": "BRL",
-                "unit_price": -float(desconto_cupom)  # VALOR NEGATIVO
-            })
-            logger.info(f"Item de desconto adicionado: -R$ {desconto_cupom:.2f}")
-
-        with transaction.atomic():
-            pedido = Pedido.objects.create(
-                usuario=request.user if request.user.is_authenticated else None,
-                status='pendente',
-                valor_total=total,
-                cupom=cupom,
-                desconto_cupom=round(desconto_cupom, 2),
-                nome_entrega=dados_entrega.get('nome', '').strip(),
-                email_entrega=dados_entrega.get('email', '').strip(),
-                telefone_entrega=dados_entrega.get('telefone', '').strip(),
-                endereco=dados_entrega.get('endereco', '').strip(),
-                numero=dados_entrega.get('numero', '').strip() or 'S/N',
-                complemento=dados_entrega.get('complemento', '').strip(),
-                bairro=dados_entrega.get('bairro', '').strip(),
-                cidade=dados_entrega.get('cidade', '').strip(),
-                estado=dados_entrega.get('estado', '').strip(),
-                cep=dados_entrega.get('cep', '').strip(),
-                dados_entrega=json.dumps(dados_entrega, ensure_ascii=False)
+                cotacao = verificar_cotacao(data['cotacao'], request.user)
+            except CotacaoInvalida as e:
+                return JsonResponse({'error': str(e)}, status=400)
+        else:
+            if not itens_carrinho:
+                return JsonResponse({'error': 'Carrinho vazio'}, status=400)
+            cotacao, validacao, erro_cupom = montar_cotacao(
+                itens_carrinho, dados_entrega.get('cupom', '').strip().upper(), request.user
             )
+            if cotacao is None:
+                return JsonResponse({'error': validacao.erro}, status=400)
+            if erro_cupom:
+                logger.warning(f"Cupom {dados_entrega.get('cupom')} ignorado: {erro_cupom.mensagem}")
+
+    subtotal, frete = Decimal(cotacao['subtotal']), Decimal(cotacao['frete'])
+    desconto_cupom, total = Decimal(cotacao['desconto']), Decimal(cotacao['total'])
+    cupom_codigo = cotacao['cupom']
+    cupom = validador_cupons.obter(cupom_codigo) if cupom_codigo else None
+    if cupom_codigo and cupom is None:
+        return JsonResponse({'error': 'Cupom inválido ou inativo.'}, status=400)
+    if cupom:
+        logger.info(f"Cupom {cupom_codigo} aplicado: desconto de R$ {desconto_cupom:.2f}")
+
+    # LOG PARA DEBUG
+    logger.info(f"Subtotal: R$ {subtotal:.2f}, Frete: R$ {frete:.2f}, Desconto: R$ {desconto_cupom:.2f}, Total: R$ {total:.2f}")
+
+    # ITENS PARA MP
+    items_mp = []
+    for linha in cotacao['linhas']:
+        items_mp.append({
+            "id": str(linha['id']),
+            "title": linha['nome'],
+            "quantity": linha['quantidade'],
+            "currency_id": "BRL",
+            "unit_price": float(linha['preco'])
+        })
 
-            for item in itens_carrinho:
-                produto = Produto.objects.get(id=item['id'])
-                ItemPedido.objects.create(
-                    pedido=pedido,
-                    produto=produto,
-                    quantidade=int(item['quantidade']),
-                    preco_unitario=float(item['preco'])
-                )
-
-            # CORREÇÃO: REGISTRAR USO DO CUPOM IMEDIATAMENTE AO CRIAR O PEDIDO
-            if cupom:
-                # Verificar se já existe um uso para evitar duplicação
-                if not CupomUso.objects.filter(cupom=cupom, pedido=pedido).exists():
-                    CupomUso.objects.create(cupom=cupom, pedido=pedido)
-                    logger.info(f"Cupom {cupom_codigo} registrado para o pedido {pedido.id}")
-
-        base_url = request.build_absolute_uri('/').rstrip('/')
-        preference_data = {
-            "items": items_mp,
-            "back_urls": {
-                "success": f"{base_url}/compra-confirmada/?pedido_id={pedido.id}",
-                "failure": f"{base_url}/compra-erro/",
-                "pending": f"{base_url}/compra-pendente/"
-            },
-            "external_reference": str(pedido.id),
-            "statement_descriptor": "MINHA LOJA",
-            "binary_mode": True
-        }
-
-        sdk = get_mp_sdk()
-        result = sdk.preference().create(preference_data)
+    # ADICIONAR FRETE COMO ITEM SEPARADO
+    if frete > 0:
+        items_mp.append({
+            "id": "frete",
+            "title": "Taxa de Entrega",
+            "quantity": 1,
+            "currency_id": "BRL",
+            "unit_price": float(frete)
+        })
 
-        if result["status"] in [200, 201]:
-            payment = result["response"]
-            pedido.preference_id = payment["id"]
-            pedido.save()
+    # CORREÇÃO: ADICIONAR DESCONTO DO CUPOM COMO ITEM NEGATIVO
+    if desconto_cupom > 0:
+        items_mp.append({
+            "id": "desconto_cupom",
+            "title": f"Desconto - {cupom_codigo}",
+            "quantity": 1,
+            "currency_id": "BRL",
+            "unit_price": -float(desconto_cupom)  # VALOR NEGATIVO
+        })
+        logger.info(f"Item de desconto adicionado: -R$ {desconto_cupom:.2f}")
+
+    with rastrear('checkout.gravar_pedido'), transaction.atomic():
+        pedido = Pedido.objects.create(
+            usuario=request.user if request.user.is_authenticated else None,
+            status='pendente',
+            valor_total=total,
+            cupom=cupom,
+            desconto_cupom=desconto_cupom,
+            valor_frete=frete,
+            nome_entrega=dados_entrega.get('nome', '').strip(),
+            email_entrega=dados_entrega.get('email', '').strip(),
+            telefone_entrega=dados_entrega.get('telefone', '').strip(),
+            endereco=dados_entrega.get('endereco', '').strip(),
+            numero=dados_entrega.get('numero', '').strip() or 'S/N',
+            complemento=dados_entrega.get('complemento', '').strip(),
+            bairro=dados_entrega.get('bairro', '').strip(),
+            cidade=dados_entrega.get('cidade', '').strip(),
+            estado=dados_entrega.get('estado', '').strip(),
+            cep=dados_entrega.get('cep', '').strip(),
+            dados_entrega=json.dumps(dados_entrega, ensure_ascii=False)
+        )
+
+        # Um INSERT para todos os itens, seja qual for o tamanho do carrinho
+        ItemPedido.objects.bulk_create([
+            ItemPedido(
+                pedido=pedido,
+                produto_id=linha['id'],
+                quantidade=linha['quantidade'],
+                preco_unitario=Decimal(linha['preco'])
+            )
+            for linha in cotacao['linhas']
+        ])
+
+        # CORREÇÃO: REGISTRAR USO DO CUPOM IMEDIATAMENTE AO CRIAR O PEDIDO
+        # (condicional: se o cupom esgotou desde a validação, desfaz o pedido)
+        if cupom and registrar_uso(cupom, pedido):
+            logger.info(f"Cupom {cupom_codigo} registrado para o pedido {pedido.id}")
+
+        # Segura o estoque enquanto o cliente paga (liberado pela varredura se expirar)
+        criar_reserva(pedido, {linha['id']: linha['quantidade'] for linha in cotacao['linhas']})
+
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    preference_data = {
+        "items": items_mp,
+        "back_urls": {
+            "success": f"{base_url}/compra-confirmada/?pedido_id={pedido.id}",
+            "failure": f"{base_url}/compra-erro/",
+            "pending": f"{base_url}/compra-pendente/"
+        },
+        "external_reference": str(pedido.id),
+        "statement_descriptor": "MINHA LOJA",
+        "binary_mode": True
+    }
+
+    resumo = {'total': total, 'desconto_cupom': desconto_cupom, 'cupom': cupom, 'cupom_codigo': cupom_codigo}
+    return pedido, preference_data, resumo
+
+def _concluir_preferencia(pedido, result, resumo):
+    """Grava o retorno do Mercado Pago ou desfaz o pedido em caso de falha"""
+    total, desconto_cupom = resumo['total'], resumo['desconto_cupom']
+    cupom, cupom_codigo = resumo['cupom'], resumo['cupom_codigo']
+
+    if result["status"] in [200, 201]:
+        payment = result["response"]
+        pedido.preference_id = payment["id"]
+        pedido.save(update_fields=['preference_id', 'atualizado_em'])
+
+        # LOG FINAL
+        logger.info(f"Preferência criada com sucesso. Total: R$ {total:.2f}, Desconto: R$ {desconto_cupom:.2f}")
 
-            # LOG FINAL
-            logger.info(f"Preferência criada com sucesso. Total: R$ {total:.2f}, Desconto: R$ {desconto_cupom:.2f}")
+        return JsonResponse({
+            'success': True,
+            'init_point': payment["init_point"],
+            'preference_id': payment["id"],
+            'pedido_id': pedido.id
+        })
+    else:
+        liberar_reserva(pedido)
+        pedido.status = 'cancelado'
+        pedido.save(update_fields=['status', 'atualizado_em'])
+        # CORREÇÃO: Se falhar, remover o uso do cupom
+        if cupom:
+            remover_usos(CupomUso.objects.filter(pedido=pedido))
+            logger.info(f"Uso do cupom {cupom_codigo} removido devido a erro no Mercado Pago")
+        return JsonResponse({'error': 'Erro no Mercado Pago'}, status=400)
+
+async def _processar_checkout(request):
+    # Cliente resolvido antes de gravar o pedido: sem MP_ACCESS_TOKEN não
+    # sobra pedido pendente segurando estoque e cupom
+    try:
+        cliente_mp = get_cliente_mp()
+    except ValueError as e:
+        logger.error(f"Checkout indisponível: {e}")
+        return JsonResponse({'error': 'Pagamento indisponível no momento'}, status=503)
 
-            return JsonResponse({
-                'success': True,
-                'init_point': payment["init_point"],
-                'preference_id': payment["id"],
-                'pedido_id': pedido.id
-            })
-        else:
-            pedido.status = 'cancelado'
-            pedido.save()
-            # CORREÇÃO: Se falhar, remover o uso do cupom
-            if cupom:
-                CupomUso.objects.filter(cupom=cupom, pedido=pedido).delete()
-                logger.info(f"Uso do cupom {cupom_codigo} removido devido a erro no Mercado Pago")
-            return JsonResponse({'error': 'Erro no Mercado Pago'}, status=400)
+    try:
+        etapa = await sync_to_async(_preparar_preferencia)(request)
+        if isinstance(etapa, JsonResponse):
+            return etapa
+        pedido, preference_data, resumo = etapa
 
+        # Chamada ao gateway fora do worker: pool compartilhado, timeout e limite de concorrência
+        try:
+            result = await cliente_mp.criar_preferencia_async(preference_data)
+        except ErroGateway as e:
+            logger.error(f"Falha ao criar preferência do pedido {pedido.id}: {e}")
+            result = {'status': 504, 'response': {}}
+
+        return await sync_to_async(_concluir_preferencia)(pedido, result, resumo)
+
+    except EstoqueInsuficiente as e:
+        logger.warning(f"Reserva recusada: {e}")
+        return JsonResponse({'error': 'Estoque insuficiente para um ou mais produtos'}, status=400)
+    except CupomInvalido as e:
+        logger.warning(f"Cupom recusado ao registrar o uso: {e.mensagem}")
+        return JsonResponse({'error': e.mensagem}, status=e.status)
     except Exception as e:
         logger.error(f"Erro: {e}", exc_info=True)
         return JsonResponse({'error': 'Erro interno'}, status=500)
 
+@csrf_exempt
+@require_POST
+async def criar_preferencia_pagamento(request):
+    """
+    Com o cabeçalho Idempotency-Key, repetições (duplo clique, reenvio
+    após queda de rede) recebem a resposta gravada do primeiro envio, ou
+    esperam por ela se ele ainda estiver em andamento, em vez de criar
+    outro pedido e outra preferência no Mercado Pago.
+    """
+    chave = request.headers.get('Idempotency-Key', '').strip()[:100]
+    if not chave:
+        return await _processar_checkout(request)
+
+    usuario = await request.auser()
+    try:
+        registro, dono = await idempotencia.iniciar_async(
+            chave, usuario.pk if usuario.is_authenticated else None, idempotencia.resumo_corpo(request.body)
+        )
+    except idempotencia.ChaveDeOutroUsuario:
+        return JsonResponse({'error': 'Chave de idempotência inválida'}, status=422)
+    except idempotencia.ChaveReutilizada:
+        return JsonResponse({'error': 'Chave de idempotência já usada com outro pedido'}, status=422)
+
+    if not dono:
+        registro = await idempotencia.aguardar(registro)
+        if registro is None:
+            return JsonResponse({'error': 'Pedido ainda em processamento. Tente novamente.'}, status=409)
+        resposta = JsonResponse(registro.resposta, status=registro.status_http)
+        resposta['Idempotent-Replayed'] = 'true'
+        return resposta
+
+    resposta = await _processar_checkout(request)
+    # Erros do servidor não são gravados: a próxima tentativa processa de novo
+    if resposta.status_code < 500:
+        await idempotencia.concluir_async(registro, resposta.status_code, json.loads(resposta.content))
+    else:
+        await idempotencia.descartar_async(registro)
+    return resposta
+
 # ===============================
-# WEBHOOK: REGISTRA USO DO CUPOM (CORRIGIDO)
+# WEBHOOK: ENFILEIRA A NOTIFICAÇÃO (PROCESSADA EM SEGUNDO PLANO)
 # ===============================
 @csrf_exempt
 @require_POST
-def webhook_mercadopago(request):
+async def webhook_mercadopago(request):
+    """
+    Apenas grava a notificação e responde 200; o processamento (consulta ao
+    gateway, estoque, cupom) fica com o comando processar_webhooks.
+    """
     try:
         data = json.loads(request.body)
-        if data.get('type') == 'payment':
-            payment_id = data.get('data', {}).get('id')
-            if not payment_id:
-                return JsonResponse({'status': 'ignored'})
-
-            sdk = get_mp_sdk()
-            payment_info = sdk.payment().get(payment_id)
-            if payment_info["status"] != 200:
-                return JsonResponse({'status': 'error'})
-
-            payment = payment_info["response"]
-            pedido_id = payment.get('external_reference')
-            status = payment.get('status')
-
-            if pedido_id:
-                try:
-                    pedido = Pedido.objects.get(id=pedido_id)
-                    if status == 'approved':
-                        pedido.status = 'pago'
-                        for item in pedido.itens.all():
-                            item.produto.reservar_estoque(item.quantidade)
-                        # CORREÇÃO: Verificar se o uso do cupom já foi registrado
-                        if pedido.cupom and not CupomUso.objects.filter(cupom=pedido.cupom, pedido=pedido).exists():
-                            CupomUso.objects.create(cupom=pedido.cupom, pedido=pedido)
-                            logger.info(f"Cupom {pedido.cupom.codigo} registrado via webhook para pedido {pedido.id}")
-                    elif status in ['cancelled', 'rejected']:
-                        pedido.status = 'cancelado'
-                        # CORREÇÃO: Remover uso do cupom se o pagamento falhar
-                        if pedido.cupom:
-                            CupomUso.objects.filter(cupom=pedido.cupom, pedido=pedido).delete()
-                            logger.info(f"Uso do cupom {pedido.cupom.codigo} removido devido a cancelamento do pedido {pedido.id}")
-                    pedido.save()
-                except Pedido.DoesNotExist:
-                    logger.warning(f"Pedido {pedido_id} não encontrado no webhook")
-        return JsonResponse({'status': 'processed'})
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+
+    if data.get('type') != 'payment':
+        return JsonResponse({'status': 'ignored'})
+    dados_pagamento = data.get('data')
+    payment_id = dados_pagamento.get('id') if isinstance(dados_pagamento, dict) else None
+    if not payment_id or not isinstance(payment_id, (str, int)):
+        return JsonResponse({'status': 'ignored'})
+
+    try:
+        # O status só é conhecido ao consultar o gateway, então a deduplicação
+        # por (pagamento, status) fica com o worker. Aqui só se evita uma
+        # segunda entrada para um pagamento que ainda espera na fila: ela
+        # lerá o status mais recente de qualquer forma.
+        if await NotificacaoWebhook.objects.filter(payment_id=str(payment_id), status='pendente').aexists():
+            return JsonResponse({'status': 'duplicate'})
+        await NotificacaoWebhook.objects.acreate(tipo='payment', payment_id=str(payment_id), payload=data)
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'status': 'queued'})
 
 # ===============================
 # VIEWS DE REDIRECIONAMENTO
 # ===============================
+@somente_leitura
 def compra_confirmada(request):
     pedido_id = request.GET.get('pedido_id')
     payment_id = request.GET.get('payment_id')
@@ -414,21 +453,31 @@ def compra_pendente(request):
 # ===============================
 # VIEWS PRINCIPAIS
 # ===============================
+# Campos usados pelo card de produto em index.html
+CAMPOS_CARD_PRODUTO = ['id', 'nome', 'preco', 'preco_original', 'estoque', 'imagem', 'data_criacao', 'data_atualizacao']
+
+@somente_leitura
 def index(request):
     termo = request.GET.get('search', '').strip()
+    produtos = Produto.objects.filter(disponivel=True).only(*CAMPOS_CARD_PRODUTO)
     if termo:
-        produtos = Produto.objects.filter(
-            Q(nome__icontains=termo) | Q(descricao__icontains=termo),
-            disponivel=True
-        ).order_by('-data_criacao')
-    else:
-        produtos = Produto.objects.filter(disponivel=True).order_by('-data_criacao')
-    
+        produtos = busca.filtrar_produtos(produtos, termo)
+
+    pagina = paginar_por_cursor(
+        produtos,
+        'data_criacao',
+        apos=request.GET.get('apos'),
+        antes=request.GET.get('antes'),
+        por_pagina=getattr(settings, 'PRODUTOS_POR_PAGINA', 12)
+    )
+
     return render(request, 'index.html', {
-        'produtos': produtos, 
+        'produtos': pagina, 
+        'cards_produtos': cache_cards.renderizar_lista(pagina),
         'termo_busca': termo
     })
 
+@somente_leitura
 def produto_detalhe(request, id):
     produto = get_object_or_404(Produto, id=id, disponivel=True)
     return render(request, 'produto.html', {'produto': produto})
@@ -437,44 +486,124 @@ def checkout(request):
     return render(request, 'checkout.html')
 
 @login_required
+@somente_leitura
 def meus_pedidos(request):
-    pedidos = Pedido.objects.filter(usuario=request.user).order_by('-criado_em')
-    return render(request, 'meus_pedidos.html', {'pedidos': pedidos})
+    pedidos = historico.pagina_pedidos(
+        request.user,
+        apos=request.GET.get('apos'),
+        antes=request.GET.get('antes'),
+    )
+    return render(request, 'meus_pedidos.html', {
+        'pedidos': pedidos,
+        'resumo': historico.resumo_pedidos.obter(request.user.pk),
+    })
 
 @login_required
+@somente_leitura
 def detalhe_pedido(request, pedido_id):
-    pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
+    pedido = historico.pedido_com_itens(request.user, pedido_id)
+    if pedido is None:
+        raise Http404('Pedido não encontrado')
     return render(request, 'detalhe_pedido.html', {'pedido': pedido})
 
 # ===============================
 # APIs AUXILIARES
 # ===============================
 @require_GET
+@somente_leitura
 def buscar_sugestoes(request):
     termo = request.GET.get('q', '').strip()
     if len(termo) < 2:
         return JsonResponse({'sugestoes': []})
 
-    produtos = Produto.objects.filter(
-        Q(nome__icontains=termo) | Q(descricao__icontains=termo),
-        disponivel=True,
-        estoque__gt=0
-    )[:8]
-
-    sugestoes = [{
-        'id': p.id,
-        'nome': p.nome,
-        'preco': str(p.preco),
-        'imagem': p.imagem.url if p.imagem else '',
-        'estoque': p.estoque,
-        'tem_desconto': p.tem_desconto(),
-        'preco_original': str(p.preco_original) if p.preco_original else None
-    } for p in produtos]
+    # Caminho rápido: índice de prefixos em memória, sem SQL
+    sugestoes = indice_sugestoes.buscar(termo, limite=8)
+    if sugestoes:
+        return JsonResponse({'sugestoes': sugestoes})
+
+    # Sem resultado pelo nome: tenta a descrição via FTS
+    ids = busca.buscar_ids_ranqueados(termo, limite=8, somente_em_estoque=True)
+    if ids is None:
+        produtos = Produto.objects.filter(
+            Q(nome__icontains=termo) | Q(descricao__icontains=termo),
+            disponivel=True,
+            estoque__gt=0
+        )[:8]
+    else:
+        # in_bulk perde a ordem; reaplica o ranking do bm25
+        por_id = Produto.objects.in_bulk(ids)
+        produtos = [por_id[i] for i in ids if i in por_id]
+
+    sugestoes = [payload_sugestao(p) for p in produtos]
 
     return JsonResponse({'sugestoes': sugestoes})
 
+def _resposta_condicional(request, versoes, conteudo):
+    """Responde 304 se o ETag enviado pelo navegador ainda é válido"""
+    etag = catalogo.calcular_etag(versoes)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(conteudo())
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@require_GET
+@somente_leitura
+def api_produto(request, produto_id):
+    versoes = catalogo.versoes_produtos([produto_id])
+    if not versoes:
+        return JsonResponse({'error': 'Produto não encontrado'}, status=404)
+    return _resposta_condicional(
+        request, versoes,
+        lambda: catalogo.obter_payloads(versoes)[produto_id]
+    )
+
+@require_GET
+@somente_leitura
+def api_produtos(request):
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.GET.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        return JsonResponse({'error': 'Lista de ids inválida'}, status=400)
+    if not ids:
+        return JsonResponse({'error': 'Informe ao menos um id'}, status=400)
+    if len(ids) > catalogo.MAXIMO_IDS_POR_LOTE:
+        return JsonResponse({'error': f'Máximo de {catalogo.MAXIMO_IDS_POR_LOTE} ids por requisição'}, status=400)
+
+    versoes = catalogo.versoes_produtos(ids)
+
+    def conteudo():
+        payloads = catalogo.obter_payloads(versoes)
+        return {
+            'produtos': [payloads[i] for i in ids if i in payloads],
+            'nao_encontrados': [i for i in ids if i not in payloads],
+        }
+
+    return _resposta_condicional(request, versoes, conteudo)
+
+@require_GET
+@staff_member_required
+def estatisticas_cache_cards(request):
+    return JsonResponse(cache_cards.estatisticas())
+
+@require_GET
+def metricas_prometheus(request):
+    """Métricas do processo no formato texto do Prometheus (staff ou METRICAS_TOKEN)"""
+    if not getattr(settings, 'METRICAS_ATIVAS', False):
+        raise Http404
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    autorizado = request.user.is_authenticated and request.user.is_staff
+    if not autorizado and token:
+        autorizado = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not autorizado:
+        return HttpResponse('Não autorizado', status=401, content_type='text/plain; charset=utf-8')
+    return HttpResponse(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @require_GET
 @login_required
+@somente_leitura
 def obter_status_pedido(request, pedido_id):
     pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
     return JsonResponse({
@@ -485,16 +614,38 @@ def obter_status_pedido(request, pedido_id):
         'criado_em': pedido.criado_em.isoformat()
     })
 
+@require_GET
+async def eventos_status_pedido(request, pedido_id):
+    """
+    Server-Sent Events com as mudanças de status do pedido: substitui o
+    polling de obter_status_pedido por uma mensagem por mudança real.
+    """
+    # Sob WSGI (runserver, gunicorn sync) o Django consome o gerador inteiro
+    # antes de responder: nada chega ao navegador e o worker fica preso até
+    # SSE_DURACAO_MAXIMA. O 204 faz o EventSource desistir sem reconectar e
+    # o status_pedido.js passa a consultar obter_status_pedido.
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return JsonResponse({'error': 'Autenticação necessária'}, status=401)
+    status = await Pedido.objects.filter(id=pedido_id, usuario=usuario).values_list('status', flat=True).afirst()
+    if status is None:
+        raise Http404('Pedido não encontrado')
+
+    resposta = StreamingHttpResponse(transmitir_status(pedido_id, status), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'  # nginx: não segurar o stream em buffer
+    return resposta
+
 @csrf_exempt
 @require_POST
 @login_required
 def cancelar_pedido_api(request, pedido_id):
     pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
+    # cancelar_pedido devolve o estoque reservado e remove o uso do cupom
     if pedido.cancelar_pedido():
-        # CORREÇÃO: Remover uso do cupom ao cancelar pedido
-        if pedido.cupom:
-            CupomUso.objects.filter(cupom=pedido.cupom, pedido=pedido).delete()
-            logger.info(f"Uso do cupom {pedido.cupom.codigo} removido devido a cancelamento manual do pedido {pedido.id}")
         return JsonResponse({'success': True, 'message': 'Pedido cancelado'})
     return JsonResponse({'success': False, 'message': 'Não pode ser cancelado'}, status=400)
 
@@ -503,6 +654,7 @@ def cancelar_pedido_api(request, pedido_id):
 # ===============================
 @csrf_exempt
 @require_POST
+@somente_leitura
 def verificar_estoque(request):
     try:
         data = json.loads(request.body)
@@ -512,14 +664,15 @@ def verificar_estoque(request):
         if not produto_id:
             return JsonResponse({'error': 'ID do produto não informado'}, status=400)
         
-        produto = get_object_or_404(Produto, id=produto_id)
-        disponivel = produto.estoque_disponivel(quantidade)
+        linha = validar_carrinho([{'id': produto_id, 'quantidade': quantidade}]).linhas[0]
+        if linha.produto is None:
+            return JsonResponse({'error': 'Produto não encontrado'}, status=404)
         
         return JsonResponse({
-            'disponivel': disponivel,
-            'estoque_atual': produto.estoque,
-            'pode_adicionar': produto.estoque > 0,
-            'produto_nome': produto.nome
+            'disponivel': linha.disponivel,
+            'estoque_atual': linha.produto.estoque,
+            'pode_adicionar': linha.produto.estoque > 0,
+            'produto_nome': linha.produto.nome
         })
         
     except ValueError:
@@ -531,50 +684,20 @@ def verificar_estoque(request):
 @csrf_exempt
 @require_POST
 def atualizar_estoque_carrinho(request):
+    """Verifica o estoque do carrinho inteiro em uma única consulta"""
     try:
         data = json.loads(request.body)
-        itens = data.get('itens', [])
-        resultados = []
-        valido = True
-        
-        for item in itens:
-            produto_id = item.get('id')
-            quantidade = int(item.get('quantidade', 1))
-            
-            if not produto_id:
-                continue
-                
-            try:
-                produto = Produto.objects.get(id=produto_id)
-                disponivel = produto.estoque_disponivel(quantidade)
-                
-                if not disponivel:
-                    valido = False
-                    
-                resultados.append({
-                    'produto_id': produto.id,
-                    'disponivel': disponivel,
-                    'estoque_atual': produto.estoque,
-                    'solicitado': quantidade,
-                    'produto_nome': produto.nome
-                })
-                
-            except Produto.DoesNotExist:
-                resultados.append({
-                    'produto_id': produto_id,
-                    'disponivel': False,
-                    'estoque_atual': 0,
-                    'solicitado': quantidade,
-                    'produto_nome': 'Produto não encontrado'
-                })
-                valido = False
+        validacao = validar_carrinho(data.get('itens', []))
+        if any(linha.erro for linha in validacao.linhas):
+            return JsonResponse({'error': validacao.erro}, status=400)
+        valido = all(linha.disponivel for linha in validacao.linhas)
         
         return JsonResponse({
             'valido': valido, 
-            'resultados': resultados,
+            'resultados': validacao.como_dict(),
             'mensagem': 'Estoque verificado com sucesso' if valido else 'Estoque insuficiente para alguns produtos'
         })
         
     except Exception as e:
         logger.error(f"Erro ao verificar estoque do carrinho: {str(e)}")
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': str(e)}, status=500)
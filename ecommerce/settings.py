@@ -12,6 +12,26 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-chave-temporaria-altere-em
 DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
 
+# Métricas por requisição (latência, SQL, templates, Mercado Pago) em /metrics.
+# Sem METRICAS_TOKEN, só usuários staff logados acessam o endpoint.
+# Observabilidade desligada por padrão (dev, testes, comandos do
+# manage.py): ligue em produção com METRICAS_ATIVAS, RASTREAMENTO_ATIVO e
+# CONSULTAS_LENTAS_ATIVO=True no ambiente.
+METRICAS_ATIVAS = os.getenv('METRICAS_ATIVAS', 'False').lower() == 'true'
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN', '')
+
+# Rastreamento amostrado (spans de SQL, Mercado Pago e templates) gravado
+# em JSONL; resumo com `python manage.py resumo_rastros`
+RASTREAMENTO_ATIVO = os.getenv('RASTREAMENTO_ATIVO', 'False').lower() == 'true'
+RASTREAMENTO_AMOSTRAGEM = float(os.getenv('RASTREAMENTO_AMOSTRAGEM', 0.01))
+RASTREAMENTO_ARQUIVO = os.getenv('RASTREAMENTO_ARQUIVO', str(BASE_DIR / 'rastros' / 'rastros.jsonl'))
+
+# Consultas acima do limite gravadas com EXPLAIN QUERY PLAN e a view de
+# origem; ranking com `python manage.py relatorio_consultas_lentas`
+CONSULTAS_LENTAS_ATIVO = os.getenv('CONSULTAS_LENTAS_ATIVO', 'False').lower() == 'true'
+CONSULTAS_LENTAS_LIMITE_MS = float(os.getenv('CONSULTAS_LENTAS_LIMITE_MS', 50))
+CONSULTAS_LENTAS_ARQUIVO = os.getenv('CONSULTAS_LENTAS_ARQUIVO', str(BASE_DIR / 'rastros' / 'consultas_lentas.jsonl'))
+
 # Application definition
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -31,6 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.metricas.MetricasMiddleware',  # primeiro: mede a pilha inteira
+    'app.rastreamento.RastreamentoMiddleware',
+    'app.consultas_lentas.ConsultasLentasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,7 +68,11 @@ ROOT_URLCONF = 'ecommerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Com métricas ou rastreamento, o mesmo backend medindo cada render
+        'BACKEND': (
+            'app.metricas.TemplatesMedidos' if METRICAS_ATIVAS or RASTREAMENTO_ATIVO
+            else 'django.template.backends.django.DjangoTemplates'
+        ),
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -62,14 +89,52 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'ecommerce.wsgi.application'
+ASGI_APPLICATION = 'ecommerce.asgi.application'
 
 # Database
+# journal_mode fica gravado no próprio arquivo: o WAL (leituras rodando
+# durante uma escrita; o journal padrão bloqueia leitores no commit) é ligado
+# uma vez, no deploy, com `manage.py configurar_sqlite`, e não a cada conexão,
+# o que converteria o db.sqlite3 do repositório em qualquer manage.py/test.
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+
+# Pragmas aplicados a cada conexão nova (não persistem no arquivo). Com WAL,
+# synchronous=NORMAL continua seguro contra corrupção e evita um fsync por commit.
+SQLITE_PRAGMAS = ';'.join([
+    'PRAGMA synchronous=NORMAL',
+    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_BYTES', 256 * 1024 * 1024))}",
+    f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', 20000))}",
+    'PRAGMA temp_store=MEMORY',
+])
+
+SQLITE_OPTIONS = {
+    'init_command': SQLITE_PRAGMAS,
+    # busy_timeout: espera o lock em vez de falhar com "database is locked"
+    'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+    # BEGIN IMMEDIATE: a transação pega o lock de escrita no início, sem a
+    # troca de lock no meio que o SQLite não consegue esperar
+    'transaction_mode': 'IMMEDIATE',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Mesma base, conexão separada só para leitura (views com @somente_leitura)
+    'leitura': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {'init_command': SQLITE_PRAGMAS + ';PRAGMA query_only=1', 'timeout': SQLITE_OPTIONS['timeout']},
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['app.banco.RoteadorLeitura']
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -151,11 +216,28 @@ else:
     EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
     DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@seudominio.com')
 
+# Cache
+# 'sessoes' é por processo: um logout (ou rotação de chave) feito em um
+# worker passa despercebido nos outros por até SESSAO_CACHE_LOCAL_SEGUNDOS,
+# quando a sessão em cache vence e é relida do banco. Com um cache
+# compartilhado (Redis/Memcached) não há essa janela e vale SESSAO_CACHE_SEGUNDOS.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessoes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessoes',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
 # Session
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Leitura pelo cache; o banco (e o Set-Cookie) só é escrito quando a sessão
+# muda ou quando a validade gravada passa da metade (ver app/sessoes.py)
+SESSION_ENGINE = 'app.sessoes'
+SESSION_CACHE_ALIAS = 'sessoes'
 SESSION_COOKIE_AGE = 1209600
 SESSION_COOKIE_HTTPONLY = True
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = False
 
 # CSRF
 CSRF_TRUSTED_ORIGINS = [
@@ -167,6 +249,11 @@ CSRF_TRUSTED_ORIGINS = [
 
 # Mercado Pago
 MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
+MERCADOPAGO_API_URL = os.getenv('MERCADOPAGO_API_URL', 'https://api.mercadopago.com')
+MERCADOPAGO_TIMEOUT_CONEXAO = float(os.getenv('MERCADOPAGO_TIMEOUT_CONEXAO', 3))
+MERCADOPAGO_TIMEOUT_LEITURA = float(os.getenv('MERCADOPAGO_TIMEOUT_LEITURA', 10))
+MERCADOPAGO_MAX_CONCORRENCIA = int(os.getenv('MERCADOPAGO_MAX_CONCORRENCIA', 20))
+MERCADOPAGO_TAMANHO_POOL = 20
 
 # Logging
 LOGGING = {
@@ -185,6 +272,32 @@ LOGGING = {
 CARRINHO_SESSION_ID = 'carrinho'
 FRETE_GRATIS_ACIMA_DE = 100.00
 VALOR_FRETE = 15.00
+PRODUTOS_POR_PAGINA = 12
+CACHE_CARDS_TAMANHO_MAXIMO = 2000
+RESERVA_ESTOQUE_MINUTOS = 30
+PEDIDO_PENDENTE_EXPIRA_HORAS = 24
+WEBHOOK_MAX_TENTATIVAS = 8
+WEBHOOK_BACKOFF_SEGUNDOS = 30
+WEBHOOK_BACKOFF_MAXIMO_SEGUNDOS = 3600
+WEBHOOK_TEMPO_LIMITE_SEGUNDOS = 300
+PAGAMENTOS_RECENTES_TAMANHO_MAXIMO = 10000
+CUPONS_CACHE_TTL = 60
+COTACAO_VALIDADE_SEGUNDOS = 900
+IDEMPOTENCIA_ESPERA_SEGUNDOS = 20
+IDEMPOTENCIA_TEMPO_LIMITE_SEGUNDOS = 120
+IDEMPOTENCIA_VALIDADE_HORAS = 24
+ADMIN_CONTAGEM_MAXIMA = 10000
+PEDIDOS_POR_PAGINA = 20
+RESUMO_PEDIDOS_TTL = 60
+SSE_INTERVALO_VERIFICACAO = 5
+SSE_KEEPALIVE_SEGUNDOS = 15
+SSE_DURACAO_MAXIMA = 300
+SESSAO_CACHE_SEGUNDOS = 60
+SESSAO_CACHE_LOCAL_SEGUNDOS = 5
+SESSAO_FRACAO_RENOVACAO = 0.5
+SESSAO_LIMPEZA_LOTE = 1000
+RASTREAMENTO_SPANS_POR_RASTRO = 500
+RASTREAMENTO_TAMANHO_MAXIMO_MB = 50
 
 # Criar diretórios
 def criar_diretorios_necessarios():
@@ -8,6 +8,8 @@ class CarrinhoManager {
     constructor() {
         this.carrinhoKey = 'carrinho_ecommerce';
         this.cupomAplicado = null; // Armazena { codigo, desconto }
+        this.timeoutValidacaoEstoque = null;
+        this.checkoutPendente = null; // { dados, chave, corpo } até o servidor responder
         this.init();
     }
 
@@ -134,31 +136,25 @@ class CarrinhoManager {
     // ===============================
     async adicionarAoCarrinho(produto) {
         try {
-            const estoqueInfo = await this.verificarEstoque(produto.id, produto.quantidade);
+            let carrinho = this.obterCarrinho();
+            const produtoIndex = carrinho.findIndex(item => item.id === produto.id);
+            const quantidadeAtual = produtoIndex !== -1 ? carrinho[produtoIndex].quantidade : 0;
+            const novaQuantidade = quantidadeAtual + produto.quantidade;
+
+            // Uma única verificação com a quantidade final
+            const estoqueInfo = await this.verificarEstoque(produto.id, novaQuantidade);
 
             if (!estoqueInfo.disponivel) {
                 this.mostrarNotificacao(
-                    `Estoque insuficiente para ${produto.nome}. Disponível: ${estoqueInfo.estoque_atual}`,
+                    quantidadeAtual > 0
+                        ? `Não há estoque suficiente para ${novaQuantidade} unidades. Disponível: ${estoqueInfo.estoque_atual}`
+                        : `Estoque insuficiente para ${produto.nome}. Disponível: ${estoqueInfo.estoque_atual}`,
                     'error'
                 );
                 return false;
             }
 
-            let carrinho = this.obterCarrinho();
-            const produtoIndex = carrinho.findIndex(item => item.id === produto.id);
-
             if (produtoIndex !== -1) {
-                const novaQuantidade = carrinho[produtoIndex].quantidade + produto.quantidade;
-                const estoqueTotalInfo = await this.verificarEstoque(produto.id, novaQuantidade);
-
-                if (!estoqueTotalInfo.disponivel) {
-                    this.mostrarNotificacao(
-                        `Não há estoque suficiente para ${novaQuantidade} unidades. Disponível: ${estoqueTotalInfo.estoque_atual}`,
-                        'error'
-                    );
-                    return false;
-                }
-
                 carrinho[produtoIndex].quantidade = novaQuantidade;
             } else {
                 carrinho.push(produto);
@@ -175,6 +171,63 @@ class CarrinhoManager {
         }
     }
 
+    // ===============================
+    // VALIDAÇÃO DE ESTOQUE EM LOTE (DEBOUNCE)
+    // ===============================
+    agendarValidacaoEstoque(espera = 400) {
+        clearTimeout(this.timeoutValidacaoEstoque);
+        this.timeoutValidacaoEstoque = setTimeout(() => this.validarEstoqueCarrinho(), espera);
+    }
+
+    async validarEstoqueCarrinho() {
+        const carrinho = this.obterCarrinho();
+        if (carrinho.length === 0) return true;
+
+        try {
+            const response = await fetch('/api/atualizar-estoque-carrinho/', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': this.getCSRFToken()
+                },
+                body: JSON.stringify({ itens: carrinho })
+            });
+
+            if (!response.ok) {
+                throw new Error(`Erro HTTP: ${response.status}`);
+            }
+
+            const data = await response.json();
+            if (data.valido) return true;
+
+            // Ajusta as quantidades ao estoque disponível
+            const porId = new Map(data.resultados.map(r => [r.produto_id.toString(), r]));
+            const ajustado = carrinho
+                .map(item => {
+                    const resultado = porId.get(item.id);
+                    if (resultado && !resultado.disponivel) {
+                        return { ...item, quantidade: Math.min(item.quantidade, resultado.estoque_atual) };
+                    }
+                    return item;
+                })
+                .filter(item => item.quantidade > 0);
+
+            this.salvarCarrinho(ajustado);
+            this.atualizarContadorCarrinho();
+            if (this.isCheckoutPage()) {
+                this.carregarItensCarrinho();
+            }
+
+            const nomes = data.resultados.filter(r => !r.disponivel).map(r => r.produto_nome).join(', ');
+            this.mostrarNotificacao(`Quantidade ajustada ao estoque disponível: ${nomes}`, 'error');
+            return false;
+
+        } catch (error) {
+            console.error('Erro na validação de estoque do carrinho:', error);
+            return true;
+        }
+    }
+
     // ===============================
     // REMOVER DO CARRINHO
     // ===============================
@@ -208,7 +261,7 @@ class CarrinhoManager {
     // ===============================
     // ATUALIZAR QUANTIDADE
     // ===============================
-    async atualizarQuantidade(produtoId, novaQuantidade) {
+    atualizarQuantidade(produtoId, novaQuantidade) {
         try {
             novaQuantidade = parseInt(novaQuantidade);
 
@@ -216,26 +269,20 @@ class CarrinhoManager {
                 return this.removerDoCarrinho(produtoId);
             }
 
-            const estoqueInfo = await this.verificarEstoque(produtoId, novaQuantidade);
-            if (!estoqueInfo.disponivel) {
-                this.mostrarNotificacao(
-                    `Estoque insuficiente. Disponível: ${estoqueInfo.estoque_atual}`,
-                    'error'
-                );
-                return false;
-            }
-
             let carrinho = this.obterCarrinho();
             const produtoIndex = carrinho.findIndex(item => item.id === produtoId.toString());
 
             if (produtoIndex !== -1) {
                 carrinho[produtoIndex].quantidade = novaQuantidade;
                 this.salvarCarrinho(carrinho);
+                this.atualizarContadorCarrinho();
 
                 if (this.isCheckoutPage()) {
                     this.carregarItensCarrinho();
                 }
 
+                // Cliques seguidos em +/- geram uma só verificação do carrinho todo
+                this.agendarValidacaoEstoque();
                 return true;
             }
 
@@ -547,27 +594,43 @@ class CarrinhoManager {
             btn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Processando...';
             btn.disabled = true;
 
-            const estoqueResponse = await fetch('/api/atualizar-estoque-carrinho/', {
+            // Cotação assinada: preços, frete e cupom calculados uma vez no servidor
+            const cotacaoResponse = await fetch('/api/cotacao/', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                     'X-CSRFToken': this.getCSRFToken()
                 },
-                body: JSON.stringify({ itens: carrinho })
+                body: JSON.stringify({ itens: carrinho, cupom: dadosEntrega.cupom })
             });
 
-            if (!estoqueResponse.ok) {
-                throw new Error('Erro ao verificar estoque');
-            }
-
-            const estoqueData = await estoqueResponse.json();
+            const cotacaoData = await cotacaoResponse.json();
 
-            if (!estoqueData.valido) {
-                const produtosSemEstoque = estoqueData.resultados
+            if (!cotacaoData.success) {
+                const produtosSemEstoque = (cotacaoData.resultados || [])
                     .filter(r => !r.disponivel)
                     .map(r => r.produto_nome)
                     .join(', ');
-                throw new Error(`Estoque insuficiente para: ${produtosSemEstoque}`);
+                throw new Error(produtosSemEstoque
+                    ? `Estoque insuficiente para: ${produtosSemEstoque}`
+                    : (cotacaoData.error || 'Erro ao verificar estoque'));
+            }
+
+            // Mesma chave e mesmo corpo em novas tentativas após falha de rede:
+            // o servidor devolve o pedido já criado em vez de criar outro (e
+            // recusa a chave reenviada com outro corpo). Carrinho ou entrega
+            // diferentes = compra nova, com chave nova.
+            const dadosPedido = JSON.stringify({ itens: carrinho, dados_entrega: dadosEntrega });
+            if (!this.checkoutPendente || this.checkoutPendente.dados !== dadosPedido) {
+                this.checkoutPendente = {
+                    dados: dadosPedido,
+                    chave: this.gerarChaveIdempotencia(),
+                    corpo: JSON.stringify({
+                        itens: carrinho,
+                        dados_entrega: dadosEntrega,
+                        cotacao: cotacaoData.token
+                    })
+                };
             }
 
             // CORREÇÃO: Enviar dados estruturados corretamente
@@ -575,14 +638,14 @@ class CarrinhoManager {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                    'X-CSRFToken': this.getCSRFToken()
+                    'X-CSRFToken': this.getCSRFToken(),
+                    'Idempotency-Key': this.checkoutPendente.chave
                 },
-                body: JSON.stringify({ 
-                    itens: carrinho,
-                    dados_entrega: dadosEntrega
-                })
+                body: this.checkoutPendente.corpo
             });
 
+            // O servidor respondeu: a próxima compra usa uma chave nova
+            this.checkoutPendente = null;
             const data = await response.json();
 
             if (!response.ok) {
@@ -631,6 +694,23 @@ class CarrinhoManager {
         return window.location.pathname.includes('checkout');
     }
 
+    gerarChaveIdempotencia() {
+        // crypto.randomUUID só existe em contexto seguro (HTTPS/localhost)
+        if (window.crypto && typeof crypto.randomUUID === 'function') {
+            return crypto.randomUUID();
+        }
+        const bytes = new Uint8Array(16);
+        if (window.crypto && crypto.getRandomValues) {
+            crypto.getRandomValues(bytes);
+        } else {
+            for (let i = 0; i < bytes.length; i++) bytes[i] = Math.floor(Math.random() * 256);
+        }
+        bytes[6] = (bytes[6] & 0x0f) | 0x40; // UUID v4
+        bytes[8] = (bytes[8] & 0x3f) | 0x80;
+        const hex = Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+        return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+    }
+
     getCSRFToken() {
         const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]');
         return csrfToken ? csrfToken.value : '';
@@ -0,0 +1,68 @@
+// ===============================
+// STATUS DO PEDIDO EM TEMPO REAL (SSE)
+// ===============================
+// Elementos com data-status-pedido="<url do stream>" recebem o status
+// atualizado sem recarregar a página. Sem streaming (servidor WSGI
+// responde 204, ou navegador sem EventSource), o status é consultado em
+// data-status-pedido-consulta a cada INTERVALO_CONSULTA_MS.
+const STATUS_FINAIS = ['entregue', 'cancelado', 'reembolsado'];
+const INTERVALO_CONSULTA_MS = 30000;
+
+function atualizarBadgeStatus(badge, dados) {
+    badge.textContent = dados.status_display;
+    badge.classList.remove('bg-success', 'bg-danger', 'bg-warning');
+    if (dados.status === 'entregue') {
+        badge.classList.add('bg-success');
+    } else if (dados.status === 'cancelado') {
+        badge.classList.add('bg-danger');
+    } else {
+        badge.classList.add('bg-warning');
+    }
+}
+
+function consultarStatusPeriodicamente(badge) {
+    const url = badge.dataset.statusPedidoConsulta;
+    if (!url) return;
+
+    const consultar = async () => {
+        try {
+            const resposta = await fetch(url, { credentials: 'same-origin' });
+            if (!resposta.ok) return; // sessão expirada ou pedido de outro usuário: para
+            const dados = await resposta.json();
+            atualizarBadgeStatus(badge, dados);
+            if (STATUS_FINAIS.includes(dados.status)) return;
+        } catch (erro) {
+            // Falha de rede: tenta de novo no próximo intervalo
+        }
+        setTimeout(consultar, INTERVALO_CONSULTA_MS);
+    };
+    setTimeout(consultar, INTERVALO_CONSULTA_MS);
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[data-status-pedido]').forEach((badge) => {
+        if (!window.EventSource) {
+            consultarStatusPeriodicamente(badge);
+            return;
+        }
+
+        const fonte = new EventSource(badge.dataset.statusPedido);
+
+        fonte.addEventListener('status', (evento) => {
+            const dados = JSON.parse(evento.data);
+            atualizarBadgeStatus(badge, dados);
+            // Status final: não há mais o que acompanhar
+            if (STATUS_FINAIS.includes(dados.status)) {
+                fonte.close();
+            }
+        });
+
+        // 204 (servidor sem streaming) ou erro HTTP: o EventSource fecha em
+        // vez de reconectar; quedas de rede comuns continuam reconectando
+        fonte.addEventListener('error', () => {
+            if (fonte.readyState === EventSource.CLOSED) {
+                consultarStatusPeriodicamente(badge);
+            }
+        });
+    });
+});